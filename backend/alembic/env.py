@@ -20,6 +20,7 @@ from app.models.file import File
 from app.models.presence import Presence
 from app.models.reaction import Reaction
 from app.models.bot_message_score import BotMessageScore
+from app.models.channel_read import ChannelRead
 from app.database import Base
 
 # this is the Alembic Config object, which provides
@@ -0,0 +1,39 @@
+"""add parent_sender_id to messages and bot conversations index
+
+Revision ID: 2f8d6b3e9a41
+Revises: 9c4a1f6e2b73
+Create Date: 2026-10-18 23:20:07.392518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f8d6b3e9a41'
+down_revision: Union[str, None] = '9c4a1f6e2b73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('parent_sender_id', sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE messages SET parent_sender_id = "
+        "(SELECT parent.sender_id FROM messages AS parent WHERE parent.id = messages.parent_id) "
+        "WHERE parent_id IS NOT NULL"
+    )
+    # Serves the latest replies of a bot to a user, for bot conversation history
+    op.create_index(
+        'ix_messages_bot_conversations', 'messages', ['sender_id', 'parent_sender_id', 'created_at'],
+        unique=False,
+        postgresql_where=sa.text('is_bot'),
+        sqlite_where=sa.text('is_bot = 1')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_bot_conversations', table_name='messages')
+    op.drop_column('messages', 'parent_sender_id')
@@ -0,0 +1,41 @@
+"""add index_outbox table
+
+Revision ID: 3e9b5c1d7f42
+Revises: 7a3c9e5f1b24
+Create Date: 2026-10-18 19:40:26.513907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e9b5c1d7f42'
+down_revision: Union[str, None] = '7a3c9e5f1b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('index_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('operation', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_index_outbox_id'), 'index_outbox', ['id'], unique=False)
+    op.create_index(op.f('ix_index_outbox_message_id'), 'index_outbox', ['message_id'], unique=False)
+    op.create_index(op.f('ix_index_outbox_next_attempt_at'), 'index_outbox', ['next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_index_outbox_next_attempt_at'), table_name='index_outbox')
+    op.drop_index(op.f('ix_index_outbox_message_id'), table_name='index_outbox')
+    op.drop_index(op.f('ix_index_outbox_id'), table_name='index_outbox')
+    op.drop_table('index_outbox')
@@ -0,0 +1,43 @@
+"""add trigram indexes for file and channel search
+
+Revision ID: 4b8e1f6d2c57
+Revises: 9c4e2b7d1a03
+Create Date: 2026-10-18 14:21:37.106254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8e1f6d2c57'
+down_revision: Union[str, None] = '9c4e2b7d1a03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, column) for every column searched by trigram similarity
+TRIGRAM_INDEXES = [
+    ('ix_files_filename_trgm', 'files', 'filename'),
+    ('ix_files_file_type_trgm', 'files', 'file_type'),
+    ('ix_channels_name_trgm', 'channels', 'name'),
+    ('ix_channels_description_trgm', 'channels', 'description'),
+]
+
+
+def upgrade() -> None:
+    # Other databases use the in-process trigram index, which needs no schema
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        op.execute(f"CREATE INDEX {name} ON {table} USING GIN ({column} gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    # The extension is left installed, other objects may depend on it
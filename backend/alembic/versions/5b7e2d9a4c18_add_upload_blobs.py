@@ -0,0 +1,42 @@
+"""add upload_blobs table and files.content_hash
+
+Revision ID: 5b7e2d9a4c18
+Revises: 8d2f4a6c1e35
+Create Date: 2026-10-18 22:05:13.640581
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e2d9a4c18'
+down_revision: Union[str, None] = '8d2f4a6c1e35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('upload_blobs',
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('storage_path', sa.String(), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('chunks', sa.Text(), nullable=True),
+        sa.Column('vector_ids', sa.Text(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('content_hash')
+    )
+    # Files uploaded before keep their own copy and no hash
+    op.add_column('files', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_files_content_hash'), 'files', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_files_content_hash'), table_name='files')
+    op.drop_column('files', 'content_hash')
+    op.drop_table('upload_blobs')
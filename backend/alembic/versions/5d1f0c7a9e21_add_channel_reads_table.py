@@ -0,0 +1,45 @@
+"""add channel_reads table
+
+Revision ID: 5d1f0c7a9e21
+Revises: 81aca82f1de9
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1f0c7a9e21'
+down_revision: Union[str, None] = '81aca82f1de9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('channel_reads',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('channel_id', sa.Integer(), nullable=False),
+        sa.Column('last_read_message_id', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['channel_id'], ['channels.id'], ),
+        sa.ForeignKeyConstraint(['last_read_message_id'], ['messages.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'channel_id', name='uq_channel_reads_user_channel')
+    )
+    op.create_index(op.f('ix_channel_reads_id'), 'channel_reads', ['id'], unique=False)
+    op.create_index(op.f('ix_channel_reads_user_id'), 'channel_reads', ['user_id'], unique=False)
+
+    # Serves per-channel "latest message" and "messages after last read" lookups
+    op.create_index('ix_messages_channel_id_id', 'messages', ['channel_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_channel_id_id', table_name='messages')
+    op.drop_index(op.f('ix_channel_reads_user_id'), table_name='channel_reads')
+    op.drop_index(op.f('ix_channel_reads_id'), table_name='channel_reads')
+    op.drop_table('channel_reads')
@@ -0,0 +1,30 @@
+"""add bot message scores index
+
+Revision ID: 6e1a9d3c5b82
+Revises: 2f8d6b3e9a41
+Create Date: 2026-10-18 23:54:41.208317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e1a9d3c5b82'
+down_revision: Union[str, None] = '2f8d6b3e9a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A bot's best and worst replies, read when its cached examples load
+    op.create_index(
+        'ix_bot_message_scores_bot_user_id_score', 'bot_message_scores', ['bot_user_id', 'score', 'message_id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bot_message_scores_bot_user_id_score', table_name='bot_message_scores')
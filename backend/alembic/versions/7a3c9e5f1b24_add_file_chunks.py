@@ -0,0 +1,69 @@
+"""add file_chunks table with full-text index
+
+Revision ID: 7a3c9e5f1b24
+Revises: 4b8e1f6d2c57
+Create Date: 2026-10-18 16:05:12.730418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3c9e5f1b24'
+down_revision: Union[str, None] = '4b8e1f6d2c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'file_chunks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('file_id', sa.Integer(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['file_id'], ['files.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('file_id', 'chunk_index', name='uq_file_chunks_file_chunk')
+    )
+    op.create_index(op.f('ix_file_chunks_id'), 'file_chunks', ['id'], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE file_chunks ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED"
+        )
+        op.execute("CREATE INDEX ix_file_chunks_search_vector ON file_chunks USING GIN (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE file_chunks_fts USING fts5("
+            "content, content='file_chunks', content_rowid='id', tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER file_chunks_fts_ai AFTER INSERT ON file_chunks BEGIN "
+            "INSERT INTO file_chunks_fts(rowid, content) VALUES (new.id, new.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER file_chunks_fts_ad AFTER DELETE ON file_chunks BEGIN "
+            "INSERT INTO file_chunks_fts(file_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER file_chunks_fts_au AFTER UPDATE OF content ON file_chunks BEGIN "
+            "INSERT INTO file_chunks_fts(file_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+            "INSERT INTO file_chunks_fts(rowid, content) VALUES (new.id, new.content); END"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS file_chunks_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS file_chunks_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS file_chunks_fts_ai")
+        op.execute("DROP TABLE IF EXISTS file_chunks_fts")
+    op.drop_index(op.f('ix_file_chunks_id'), table_name='file_chunks')
+    op.drop_table('file_chunks')
@@ -0,0 +1,29 @@
+"""add updated_at indexes to files and channels
+
+Revision ID: 8a4f2c6e1d93
+Revises: 6e1a9d3c5b82
+Create Date: 2026-10-19 10:12:48.530116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4f2c6e1d93'
+down_revision: Union[str, None] = '6e1a9d3c5b82'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Serve the in-process trigram index's sync of rows updated since the last search
+    op.create_index(op.f('ix_files_updated_at'), 'files', ['updated_at'], unique=False)
+    op.create_index(op.f('ix_channels_updated_at'), 'channels', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_channels_updated_at'), table_name='channels')
+    op.drop_index(op.f('ix_files_updated_at'), table_name='files')
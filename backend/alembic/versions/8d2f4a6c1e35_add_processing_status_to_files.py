@@ -0,0 +1,27 @@
+"""add processing_status to files
+
+Revision ID: 8d2f4a6c1e35
+Revises: 3e9b5c1d7f42
+Create Date: 2026-10-18 21:12:40.218337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f4a6c1e35'
+down_revision: Union[str, None] = '3e9b5c1d7f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing files were processed during their upload
+    op.add_column('files', sa.Column('processing_status', sa.String(), nullable=False, server_default='completed'))
+
+
+def downgrade() -> None:
+    op.drop_column('files', 'processing_status')
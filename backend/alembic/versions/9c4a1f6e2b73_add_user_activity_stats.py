@@ -0,0 +1,44 @@
+"""add user_activity_stats table
+
+Revision ID: 9c4a1f6e2b73
+Revises: 5b7e2d9a4c18
+Create Date: 2026-10-18 22:48:51.107264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4a1f6e2b73'
+down_revision: Union[str, None] = '5b7e2d9a4c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Rows are built from each user's history the first time they are needed
+    op.create_table('user_activity_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('hour_counts', sa.Text(), nullable=False),
+        sa.Column('length_sum', sa.Integer(), nullable=False),
+        sa.Column('length_square_sum', sa.Integer(), nullable=False),
+        sa.Column('short_count', sa.Integer(), nullable=False),
+        sa.Column('long_count', sa.Integer(), nullable=False),
+        sa.Column('code_count', sa.Integer(), nullable=False),
+        sa.Column('emoji_count', sa.Integer(), nullable=False),
+        sa.Column('last_message_at', sa.DateTime(), nullable=True),
+        sa.Column('file_count', sa.Integer(), nullable=False),
+        sa.Column('file_type_counts', sa.Text(), nullable=False),
+        sa.Column('file_days', sa.Integer(), nullable=False),
+        sa.Column('last_file_day', sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_activity_stats')
@@ -0,0 +1,27 @@
+"""add processing_started_at to upload_blobs
+
+Revision ID: c7d3e8a2f594
+Revises: 8a4f2c6e1d93
+Create Date: 2026-10-19 11:03:27.214506
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d3e8a2f594'
+down_revision: Union[str, None] = '8a4f2c6e1d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Claim on the content taken by the file that runs its processing
+    op.add_column('upload_blobs', sa.Column('processing_started_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('upload_blobs', 'processing_started_at')
@@ -0,0 +1,161 @@
+import os
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+import logging
+from sqlalchemy.orm import Session
+from app.models.user import User
+from .clients import AIClients
+from .context_generator import (
+    load_conversation_context,
+    load_scored_messages_context,
+    generate_bot_context
+)
+from .profile_refresher import request_profile_refresh
+from ..services.sections import run_in_session
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds a context stage may take before the bot answers without it
+BOT_STAGE_TIMEOUT = float(os.getenv("BOT_STAGE_TIMEOUT", "5"))
+# Minimum interval between two streamed reply frames; tokens arriving in
+# between are sent together
+BOT_STREAM_INTERVAL_MS = int(os.getenv("BOT_STREAM_INTERVAL_MS", "50"))
+
+class BotContext(NamedTuple):
+    """Prompt context of a bot reply, with the duration of each stage in ms
+    and the tokens each section was given"""
+    context: str
+    timings: Dict[str, float]
+    tokens: Dict[str, int]
+
+async def run_stage(name: str, work: Awaitable, timeout: float, default: Any, timings: Dict[str, float]) -> Any:
+    """Await one pipeline stage, returning ``default`` if it fails or times out"""
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(work, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Bot stage {name} timed out after {timeout}s, continuing without it")
+        return default
+    except Exception as e:
+        logger.error(f"Bot stage {name} failed, continuing without it: {e}")
+        return default
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+async def _retrieve(clients: AIClients, store_name: str, search_kwargs: dict, query: str) -> List[Any]:
+    # The first use of a store looks up its index host, which blocks
+    store = await asyncio.to_thread(getattr, clients, store_name)
+    return await store.as_retriever(search_kwargs=search_kwargs).ainvoke(query)
+
+def _recent_unique(message_docs: List[Any], limit: int = 5) -> List[Any]:
+    """Drop duplicate message documents and keep the newest ones"""
+    seen_messages = set()
+    unique_messages = []
+    for doc in message_docs:
+        msg_id = doc.metadata.get('message_id')
+        if msg_id not in seen_messages:
+            seen_messages.add(msg_id)
+            unique_messages.append(doc)
+    return sorted(
+        unique_messages,
+        key=lambda x: x.metadata.get('timestamp', ''),
+        reverse=True
+    )[:limit]
+
+async def gather_bot_context(
+    clients: AIClients,
+    session_factory: Callable[[], Session],
+    query: str,
+    current_user: User,
+    bot_user: User,
+    target_user: Optional[User] = None
+) -> BotContext:
+    """Load everything the bot prompt needs, with independent stages running concurrently
+
+    The three vector retrievals, the conversation history and the bot's
+    scored messages all start at once, each with its own timeout; database
+    stages run in worker threads on their own sessions. A stage that fails
+    or times out leaves its section out of the prompt instead of failing
+    the reply. A user's bot answers with the stored profile and leaves
+    regenerating it to the profile refresher.
+
+    Args:
+        clients: Shared AI clients
+        session_factory: Creates the sessions of the database stages
+        query: The user's message
+        current_user: User talking to the bot
+        bot_user: The bot that answers
+        target_user: Offline user the bot answers for, if not Lain
+    """
+    timings: Dict[str, float] = {}
+    bot_label = target_user.username if target_user else "Lain"
+    stages = [
+        run_stage(
+            "messages",
+            _retrieve(clients, "messages_store", {"k": 10, "filter": {"is_bot": False}}, query),
+            BOT_STAGE_TIMEOUT, [], timings
+        ),
+        run_stage("file_chunks", _retrieve(clients, "file_chunks_store", {"k": 3}, query), BOT_STAGE_TIMEOUT, [], timings),
+        run_stage("file_descriptions", _retrieve(clients, "file_descriptions_store", {"k": 2}, query), BOT_STAGE_TIMEOUT, [], timings),
+        run_stage(
+            "conversation",
+            asyncio.to_thread(
+                run_in_session, session_factory, load_conversation_context,
+                bot_user.id, current_user.id, current_user.username, bot_label
+            ),
+            BOT_STAGE_TIMEOUT, "", timings
+        ),
+        run_stage(
+            "scored_messages",
+            asyncio.to_thread(run_in_session, session_factory, load_scored_messages_context, bot_user.id),
+            BOT_STAGE_TIMEOUT, "", timings
+        ),
+    ]
+    if target_user:
+        # The stored profile is used as is; the refresher regenerates it if stale
+        request_profile_refresh(target_user.id)
+
+    message_docs, file_chunks, file_descriptions, conversation, scored = await asyncio.gather(*stages)
+    profile = target_user.description if target_user else None
+
+    logger.info(f"Retrieved {len(message_docs)} message documents, {len(file_chunks)} file chunks, and {len(file_descriptions)} file descriptions")
+    logger.info(f"Bot context stage timings (ms): {timings}")
+    packed = generate_bot_context(
+        profile=profile,
+        conversation_context=conversation,
+        scored_messages_context=scored,
+        message_docs_sorted=_recent_unique(message_docs),
+        file_chunks=file_chunks,
+        file_descriptions=file_descriptions
+    )
+    logger.info(f"Bot context tokens by section: {packed.tokens}")
+    return BotContext(packed.context, timings, packed.tokens)
+
+async def stream_reply(llm: Any, prompt: str, send_delta: Callable[[str], Awaitable[None]], interval_ms: int = BOT_STREAM_INTERVAL_MS) -> str:
+    """Stream the completion of a prompt, passing its text to ``send_delta`` as it arrives
+
+    The first token is sent at once, so it sets the latency users see;
+    later tokens are coalesced into at most one call per ``interval_ms``.
+    Cancelling the caller closes the stream and with it the LLM request.
+
+    Returns:
+        The whole reply
+    """
+    parts: List[str] = []
+    buffered: List[str] = []
+    last_sent: Optional[float] = None
+    async for chunk in llm.astream(prompt):
+        if not chunk.content:
+            continue
+        parts.append(chunk.content)
+        buffered.append(chunk.content)
+        now = time.perf_counter()
+        if last_sent is None or (now - last_sent) * 1000 >= interval_ms:
+            await send_delta("".join(buffered))
+            buffered.clear()
+            last_sent = now
+    if buffered:
+        await send_delta("".join(buffered))
+    return "".join(parts)
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import threading
+from typing import Dict, Optional
+import logging
+import httpx
+from openai import AsyncOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_pinecone import PineconeVectorStore
+from .embedding_cache import CachedEmbeddings, cached_embeddings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Connection pool shared by every OpenAI call of the process
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "20"))
+AI_HTTP_TIMEOUT = float(os.getenv("AI_HTTP_TIMEOUT", "60"))
+# "pinecone" uses the hosted indexes; "faiss" keeps each namespace in local
+# index files under FAISS_INDEX_DIR, searched in-process
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+
+class AIClients:
+    """Long-lived AI clients shared by all requests
+
+    Holds pooled HTTP clients, the configured embeddings and chat models,
+    and the vector stores of the configured backend. Vector stores are
+    opened on first use, since opening a Pinecone index looks up its host
+    over the network and opening a FAISS index maps its files.
+    """
+
+    def __init__(self):
+        limits = httpx.Limits(max_connections=AI_HTTP_MAX_CONNECTIONS, max_keepalive_connections=AI_HTTP_MAX_CONNECTIONS)
+        self.http_client = httpx.Client(limits=limits, timeout=AI_HTTP_TIMEOUT)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=AI_HTTP_TIMEOUT)
+        self.openai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=self.http_async_client)
+
+        # Messages index: 1536 dimensions; files index: 3072 dimensions. Cached,
+        # so a question is embedded once per model for all retrievers
+        self.embeddings_1536 = self._embeddings("text-embedding-ada-002")
+        self.embeddings_3072 = self._embeddings("text-embedding-3-large")
+
+        # Bot replies, user profiles and file summaries
+        self.bot_llm = self._chat(temperature=0.5, model_kwargs={"response_format": {"type": "text"}})
+        self.profile_llm = self._chat(temperature=0.7, model_kwargs={"response_format": {"type": "text"}})
+        self.summary_llm = self._chat()
+
+        self._lock = threading.Lock()
+        self._pinecone = None
+        self._indexes: Dict[str, object] = {}
+        self._stores: Dict[tuple, VectorStore] = {}
+
+    def _embeddings(self, model: str) -> CachedEmbeddings:
+        return cached_embeddings(
+            OpenAIEmbeddings(model=model, http_client=self.http_client, http_async_client=self.http_async_client),
+            model
+        )
+
+    def _chat(self, **kwargs) -> ChatOpenAI:
+        return ChatOpenAI(
+            model_name="gpt-4o-mini",
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            **kwargs
+        )
+
+    def _faiss_store(self, namespace: str, embeddings: CachedEmbeddings) -> VectorStore:
+        from .faiss_store import FAISS_INDEX_DIR, FaissVectorStore
+        key = ("faiss", namespace)
+        with self._lock:
+            if key not in self._stores:
+                self._stores[key] = FaissVectorStore(os.path.join(FAISS_INDEX_DIR, namespace), embeddings)
+                logger.info(f"Opened FAISS vector store {namespace}")
+            return self._stores[key]
+
+    def _vector_store(self, index_name: Optional[str], namespace: str, embeddings: CachedEmbeddings) -> VectorStore:
+        if VECTOR_STORE_BACKEND == "faiss":
+            return self._faiss_store(namespace, embeddings)
+        if not index_name:
+            raise EnvironmentError(f"No Pinecone index configured for namespace {namespace}")
+        key = (index_name, namespace)
+        with self._lock:
+            if key not in self._stores:
+                if self._pinecone is None:
+                    from pinecone import Pinecone
+                    self._pinecone = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+                if index_name not in self._indexes:
+                    self._indexes[index_name] = self._pinecone.Index(index_name)
+                self._stores[key] = PineconeVectorStore(
+                    index=self._indexes[index_name],
+                    embedding=embeddings,
+                    namespace=namespace
+                )
+                logger.info(f"Opened Pinecone vector store {index_name}/{namespace}")
+            return self._stores[key]
+
+    @property
+    def messages_store(self) -> VectorStore:
+        return self._vector_store(os.getenv("PINECONE_INDEX_TWO"), "messages", self.embeddings_1536)
+
+    @property
+    def file_chunks_store(self) -> VectorStore:
+        return self._vector_store(os.getenv("PINECONE_INDEX"), "chunks", self.embeddings_3072)
+
+    @property
+    def file_descriptions_store(self) -> VectorStore:
+        return self._vector_store(os.getenv("PINECONE_INDEX"), "descriptions", self.embeddings_3072)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            stores = list(self._stores.values())
+        for store in stores:
+            if hasattr(store, "close"):
+                # Waits for a running FAISS rebuild
+                await asyncio.to_thread(store.close)
+        self.http_client.close()
+        await self.http_async_client.aclose()
+
+_clients: Optional[AIClients] = None
+_clients_lock = threading.Lock()
+
+def start_ai_clients() -> AIClients:
+    """Create the process-wide AI clients; called from the application lifespan"""
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            _clients = AIClients()
+            logger.info("Created AI clients")
+        return _clients
+
+async def stop_ai_clients() -> None:
+    """Close the pooled connections of the AI clients"""
+    global _clients
+    with _clients_lock:
+        clients, _clients = _clients, None
+    if clients is not None:
+        await clients.aclose()
+
+def get_ai_clients() -> AIClients:
+    """Dependency for the shared AI clients
+
+    Also usable outside requests. Created on first use when the application
+    lifespan has not run, as with a bare test client.
+    """
+    return _clients or start_ai_clients()
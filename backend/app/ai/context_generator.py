@@ -1,17 +1,26 @@
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any
 from datetime import datetime
-from sqlalchemy.orm import Session
-from app.models.user import User
+from sqlalchemy.orm import Session, aliased
 from app.models.message import Message
-from app.models.bot_message_score import BotMessageScore
-from sqlalchemy import alias
+from app.services.bot_scores import ScoredExamples, bot_score_cache
 import logging
 from langchain.prompts.prompt import PromptTemplate
+from .context_packer import BOT_CONTEXT_TOKENS, ContextSection, PackedContext, pack_context
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tokens each context section may take, within BOT_CONTEXT_TOKENS
+CONTEXT_SECTION_BUDGETS = {
+    "profile": 400,
+    "conversation": 1500,
+    "scored_messages": 800,
+    "messages": 1200,
+    "file_descriptions": 600,
+    "file_chunks": 1500,
+}
+
 # Bot prompt templates and instructions
 LAIN_SPECIFIC_INSTRUCTIONS = """
 6. Pay special attention to the "BOT'S SCORED MESSAGES" section:
@@ -25,245 +34,136 @@ LAIN_PERSONALITY = """a fictional character from "Serial Experiments Lain". Resp
 
 USER_BOT_PERSONALITY = """responding on behalf of {target_user} who is currently offline. Try to emulate their communication style while being helpful and informative. When using context from prior message/file posts, subtly and cryptically mention surveillance, that no information leaves the Wired. Start your response with '{target_user}<bot>:'"""
 
-async def get_bot_scored_messages(db: Session, bot_user_id: int) -> Tuple[Optional[dict], Optional[dict]]:
+async def get_bot_scored_messages(db: Session, bot_user_id: int) -> ScoredExamples:
     """
     Get the highest and lowest scored messages for a bot user.
-    Returns a tuple of (highest_scored_message, lowest_scored_message).
+    Returns (highest, lowest) lists of up to BOT_SCORED_EXAMPLES messages each,
+    best first and worst first; ``lowest`` leaves out messages in ``highest``.
     Each message is a dict containing the message content, parent message content, score, and metadata.
-    Returns None for either message if no scores exist.
     """
-    try:
-        # Create aliases for the Message table
-        ParentMessage = alias(Message)
-
-        # Get highest scored message
-        highest_score = (
-            db.query(BotMessageScore, Message, ParentMessage.c.content.label('parent_content'))
-            .join(Message, BotMessageScore.message_id == Message.id)
-            .outerjoin(ParentMessage, Message.parent_id == ParentMessage.c.id)
-            .filter(BotMessageScore.bot_user_id == bot_user_id)
-            .order_by(BotMessageScore.score.desc())
-            .first()
-        )
-
-        # Get lowest scored message
-        lowest_score = (
-            db.query(BotMessageScore, Message, ParentMessage.c.content.label('parent_content'))
-            .join(Message, BotMessageScore.message_id == Message.id)
-            .outerjoin(ParentMessage, Message.parent_id == ParentMessage.c.id)
-            .filter(BotMessageScore.bot_user_id == bot_user_id)
-            .order_by(BotMessageScore.score.asc())
-            .first()
-        )
+    return load_bot_scored_messages(db, bot_user_id)
 
-        # Format results
-        highest_message = None
-        if highest_score:
-            score, message, parent_content = highest_score
-            highest_message = {
-                'message_id': message.id,
-                'message': message.content,
-                'parent_message': parent_content,
-                'score': score.score,
-                'created_at': message.created_at
-            }
-
-        lowest_message = None
-        if lowest_score and (not highest_score or lowest_score[0].id != highest_score[0].id):
-            score, message, parent_content = lowest_score
-            lowest_message = {
-                'message_id': message.id,
-                'message': message.content,
-                'parent_message': parent_content,
-                'score': score.score,
-                'created_at': message.created_at
-            }
-
-        return highest_message, lowest_message
+def load_bot_scored_messages(db: Session, bot_user_id: int) -> ScoredExamples:
+    """Synchronous body of ``get_bot_scored_messages``, for use in worker threads.
 
+    Served from the bot score cache; only a bot's first use reads the database.
+    """
+    try:
+        return bot_score_cache.get(db, bot_user_id)
     except Exception as e:
         logger.error(f"Error getting bot scored messages: {e}")
-        return None, None
+        return ScoredExamples([], [])
 
-def generate_message_context(message_docs_sorted: List[Any]) -> str:
-    """Generate context from message documents."""
-    if not message_docs_sorted:
-        return ""
-    
-    return "=== RECENT USER MESSAGES ===\n(Showing newest first)\n\n" + "\n\n".join([
+def _message_entry(doc: Any) -> str:
+    return (
         f"[{doc.metadata.get('timestamp')}]\n"
         f"User: {doc.metadata.get('sender')}\n"
         f"Channel: {doc.metadata.get('channel')}\n"
         f"Message: {doc.page_content}"
-        for doc in message_docs_sorted
-    ])
+    )
 
-def generate_file_contexts(file_chunks: List[Any], file_descriptions: List[Any]) -> Tuple[str, str]:
-    """Generate context from file chunks and descriptions."""
-    file_chunks_context = "=== RELEVANT FILE CONTENT ===\n\n" + "\n\n".join([
+def _file_chunk_entry(doc: Any) -> str:
+    return (
         f"[File Chunk {doc.metadata.get('chunk_index')} of {doc.metadata.get('total_chunks')}]\n"
         f"From: {doc.metadata.get('filename')}\n"
         f"Type: {doc.metadata.get('file_type')}\n"
         f"Uploaded by: {doc.metadata.get('uploaded_by')} on {doc.metadata.get('upload_date')}\n"
         f"Content:\n{doc.page_content}"
-        for doc in file_chunks
-    ])
+    )
 
-    file_descriptions_context = "=== FILE SUMMARIES ===\n\n" + "\n\n".join([
+def _file_description_entry(doc: Any) -> str:
+    return (
         f"[File: {doc.metadata.get('filename')}]\n"
         f"Type: {doc.metadata.get('file_type')}\n"
         f"Uploaded by: {doc.metadata.get('uploaded_by')} on {doc.metadata.get('upload_date')}\n"
         f"Summary:\n{doc.page_content}"
-        for doc in file_descriptions
-    ])
-
-    return file_chunks_context, file_descriptions_context
+    )
 
-async def generate_scored_messages_context(db: Session, bot_user_id: int) -> str:
+def generate_scored_messages_context(highest_messages: List[dict], lowest_messages: List[dict]) -> str:
     """Generate context for bot's scored messages."""
-    highest_message, lowest_message = await get_bot_scored_messages(db, bot_user_id)
-    if not (highest_message or lowest_message):
+    if not (highest_messages or lowest_messages):
         return ""
         
     scored_messages_context = "=== BOT'S SCORED MESSAGES ===\n\n"
     
-    if highest_message:
-        scored_messages_context += f"HIGHEST SCORED MESSAGE (Score: {highest_message['score']}):\n"
-        if highest_message['parent_message']:
-            scored_messages_context += f"User: {highest_message['parent_message']}\n"
-        scored_messages_context += f"Bot: {highest_message['message']}\n\n"
-    
-    if lowest_message:
-        scored_messages_context += f"LOWEST SCORED MESSAGE (Score: {lowest_message['score']}):\n"
-        if lowest_message['parent_message']:
-            scored_messages_context += f"User: {lowest_message['parent_message']}\n"
-        scored_messages_context += f"Bot: {lowest_message['message']}\n"
+    for label, messages in (("HIGHEST", highest_messages), ("LOWEST", lowest_messages)):
+        for message in messages:
+            scored_messages_context += f"{label} SCORED MESSAGE (Score: {message['score']}):\n"
+            if message['parent_message']:
+                scored_messages_context += f"User: {message['parent_message']}\n"
+            scored_messages_context += f"Bot: {message['message']}\n\n"
     
-    return scored_messages_context
+    return scored_messages_context.rstrip("\n") + "\n"
 
-async def generate_lain_context(
-    db: Session,
-    current_user: User,
-    message_docs_sorted: List[Any],
-    file_chunks: List[Any],
-    file_descriptions: List[Any]
-) -> str:
-    """Generate context specifically for Lain bot."""
-    combined_context = ""
-    
-    # Add Lain's previous interactions first (most important context)
-    lain_user = db.query(User).filter(User.is_bot == True, User.username == "lain").first()
-    if lain_user:
-        # Get the last 5 conversation pairs between user and Lain
-        lain_messages = db.query(Message).filter(
-            Message.sender_id == lain_user.id,
-            Message.parent_id.in_(
-                db.query(Message.id).filter(Message.sender_id == current_user.id)
-            )
-        ).order_by(Message.created_at.desc()).limit(5).all()
-        
-        if lain_messages:
-            lain_context = "=== RECENT CONVERSATIONS WITH LAIN ===\n\n" + "\n\n".join([
-                f"[{msg.created_at.isoformat()}]\n"
-                f"{current_user.username}: {msg.parent.content if msg.parent else '[No parent message]'}\n"
-                f"Lain: {msg.content}"
-                for msg in reversed(lain_messages)
-            ])
-            combined_context += lain_context + "\n\n"
-    
-    # Add scored messages context
-    if lain_user:
-        scored_messages_context = await generate_scored_messages_context(db, lain_user.id)
-        if scored_messages_context:
-            combined_context += scored_messages_context + "\n\n"
-    
-    # Add semantically relevant messages from Pinecone
-    if message_docs_sorted:
-        relevant_context = "=== SEMANTICALLY RELEVANT MESSAGES ===\n\n" + "\n\n".join([
-            f"[{doc.metadata.get('timestamp')}]\n"
-            f"User: {doc.metadata.get('sender')}\n"
-            f"Channel: {doc.metadata.get('channel')}\n"
-            f"Message: {doc.page_content}"
-            for doc in message_docs_sorted[:5]  # Limit to top 5 most relevant messages
-        ])
-        combined_context += relevant_context + "\n\n"
-    
-    # Add file information
-    file_chunks_context, file_descriptions_context = generate_file_contexts(file_chunks, file_descriptions)
-    
-    if file_descriptions_context.strip() != "=== FILE SUMMARIES ===":
-        combined_context += file_descriptions_context + "\n\n"
-    if file_chunks_context.strip() != "=== RELEVANT FILE CONTENT ===":
-        combined_context += file_chunks_context
+def load_scored_messages_context(db: Session, bot_user_id: int) -> str:
+    """Load the bot's highest and lowest scored messages as prompt context."""
+    return generate_scored_messages_context(*load_bot_scored_messages(db, bot_user_id))
+
+def load_conversation_context(db: Session, bot_user_id: int, user_id: int, username: str, bot_label: str) -> str:
+    """Load the last 5 conversation pairs between a user and a bot as prompt context.
 
-    return combined_context
+    One query over the bot conversations index, with the user's messages
+    joined in.
+    """
+    parent = aliased(Message)
+    pairs = (
+        db.query(Message.created_at, Message.content, parent.content.label("parent_content"))
+        .outerjoin(parent, parent.id == Message.parent_id)
+        .filter(
+            Message.sender_id == bot_user_id,
+            Message.parent_sender_id == user_id,
+            Message.is_bot == True
+        )
+        .order_by(Message.created_at.desc())
+        .limit(5)
+        .all()
+    )
+
+    if not pairs:
+        return ""
+    return f"=== RECENT CONVERSATIONS WITH {bot_label.upper()} ===\n\n" + "\n\n".join([
+        f"[{pair.created_at.isoformat()}]\n"
+        f"{username}: {pair.parent_content if pair.parent_content is not None else '[No parent message]'}\n"
+        f"{bot_label}: {pair.content}"
+        for pair in reversed(pairs)
+    ])
 
-async def generate_user_bot_context(
-    db: Session,
-    current_user: User,
-    target_user: str,
+def generate_bot_context(
+    profile: Optional[str],
+    conversation_context: str,
+    scored_messages_context: str,
     message_docs_sorted: List[Any],
     file_chunks: List[Any],
-    file_descriptions: List[Any]
-) -> str:
-    """Generate context for user-specific bots."""
-    combined_context = ""
-    
-    # Add target user's profile and previous messages
-    target_user_obj = db.query(User).filter(User.username == target_user).first()
-    if target_user_obj:
-        # Add user profile if available
-        if target_user_obj.description:
-            user_profile = f"=== USER PROFILE ===\n{target_user_obj.description}\n\n"
-            combined_context = user_profile + combined_context
-        
-        # Get bot user for target user
-        bot_username = f"{target_user}<bot>"
-        bot_user = db.query(User).filter(User.username == bot_username).first()
-        
-        # Get the last 5 conversation pairs between user and bot
-        if bot_user:
-            user_messages = db.query(Message).filter(
-                Message.sender_id == bot_user.id,
-                Message.parent_id.in_(
-                    db.query(Message.id).filter(Message.sender_id == current_user.id)
-                )
-            ).order_by(Message.created_at.desc()).limit(5).all()
-            
-            if user_messages:
-                user_context = f"=== RECENT CONVERSATIONS WITH {target_user.upper()} ===\n\n" + "\n\n".join([
-                    f"[{msg.created_at.isoformat()}]\n"
-                    f"{current_user.username}: {msg.parent.content if msg.parent else '[No parent message]'}\n"
-                    f"{target_user}: {msg.content}"
-                    for msg in reversed(user_messages)
-                ])
-                combined_context += user_context + "\n\n"
-            
-            # Add scored messages context
-            scored_messages_context = await generate_scored_messages_context(db, bot_user.id)
-            if scored_messages_context:
-                combined_context += scored_messages_context + "\n\n"
-    
-    # Add semantically relevant messages from Pinecone
-    if message_docs_sorted:
-        relevant_context = "=== SEMANTICALLY RELEVANT MESSAGES ===\n\n" + "\n\n".join([
-            f"[{doc.metadata.get('timestamp')}]\n"
-            f"User: {doc.metadata.get('sender')}\n"
-            f"Channel: {doc.metadata.get('channel')}\n"
-            f"Message: {doc.page_content}"
-            for doc in message_docs_sorted[:5]  # Limit to top 5 most relevant messages
-        ])
-        combined_context += relevant_context + "\n\n"
-    
-    # Add file information
-    file_chunks_context, file_descriptions_context = generate_file_contexts(file_chunks, file_descriptions)
-    
-    if file_descriptions_context.strip() != "=== FILE SUMMARIES ===":
-        combined_context += file_descriptions_context + "\n\n"
-    if file_chunks_context.strip() != "=== RELEVANT FILE CONTENT ===":
-        combined_context += file_chunks_context
+    file_descriptions: List[Any],
+    limit: int = BOT_CONTEXT_TOKENS
+) -> PackedContext:
+    """Combine the loaded context sections in prompt order, packed into ``limit`` tokens.
 
-    return combined_context
+    Each section has a token budget; when the limit is reached, the least
+    important sections are cut short or left out first.
+    """
+    sections = [
+        # User profile first, for bots answering on behalf of a user
+        ContextSection("profile", "=== USER PROFILE ===", [profile] if profile else [], 0, CONTEXT_SECTION_BUDGETS["profile"]),
+        # Previous interactions with the bot are the most important context;
+        # the oldest are cut first
+        ContextSection("conversation", "", [conversation_context] if conversation_context else [], 1, CONTEXT_SECTION_BUDGETS["conversation"], keep_tail=True),
+        ContextSection("scored_messages", "", [scored_messages_context] if scored_messages_context else [], 2, CONTEXT_SECTION_BUDGETS["scored_messages"]),
+        # Semantically relevant messages, top 5
+        ContextSection(
+            "messages", "=== SEMANTICALLY RELEVANT MESSAGES ===",
+            [_message_entry(doc) for doc in message_docs_sorted[:5]], 3, CONTEXT_SECTION_BUDGETS["messages"]
+        ),
+        ContextSection(
+            "file_descriptions", "=== FILE SUMMARIES ===",
+            [_file_description_entry(doc) for doc in file_descriptions], 4, CONTEXT_SECTION_BUDGETS["file_descriptions"]
+        ),
+        ContextSection(
+            "file_chunks", "=== RELEVANT FILE CONTENT ===",
+            [_file_chunk_entry(doc) for doc in file_chunks], 5, CONTEXT_SECTION_BUDGETS["file_chunks"]
+        ),
+    ]
+    return pack_context(sections, limit)
 
 def generate_bot_prompt_template() -> PromptTemplate:
     """Generate the prompt template for bot responses."""
@@ -295,38 +195,20 @@ If no relevant information is found, say so, but still be somewhat conversationa
         input_variables=["query", "context", "username", "bot_name", "target_user", "personality", "extra_instructions", "lain_note"]
     )
 
-async def generate_bot_prompt(
-    db: Session,
-    current_user: User,
+def generate_bot_prompt(
+    username: str,
     request_message: str,
     target_user: Optional[str],
-    message_docs_sorted: List[Any],
-    file_chunks: List[Any],
-    file_descriptions: List[Any]
+    combined_context: str
 ) -> str:
     """Generate the complete bot prompt with context."""
-    # Get the appropriate context based on bot type
+    # Get the persona based on bot type
     if target_user:
-        combined_context = await generate_user_bot_context(
-            db=db,
-            current_user=current_user,
-            target_user=target_user,
-            message_docs_sorted=message_docs_sorted,
-            file_chunks=file_chunks,
-            file_descriptions=file_descriptions
-        )
         bot_name = f"{target_user}<bot>"
         personality = USER_BOT_PERSONALITY.format(target_user=target_user)
         extra_instructions = ""
         lain_note = ""
     else:
-        combined_context = await generate_lain_context(
-            db=db,
-            current_user=current_user,
-            message_docs_sorted=message_docs_sorted,
-            file_chunks=file_chunks,
-            file_descriptions=file_descriptions
-        )
         bot_name = "lain"
         personality = LAIN_PERSONALITY
         extra_instructions = LAIN_SPECIFIC_INSTRUCTIONS
@@ -339,7 +221,7 @@ async def generate_bot_prompt(
     prompt_with_context = template.invoke({
         "query": request_message,
         "context": combined_context,
-        "username": current_user.username,
+        "username": username,
         "bot_name": bot_name,
         "target_user": target_user or "Lain",
         "personality": personality,
@@ -0,0 +1,203 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import logging
+import tiktoken
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Tokens of context a bot prompt may carry, over all sections
+BOT_CONTEXT_TOKENS = int(os.getenv("BOT_CONTEXT_TOKENS", "6000"))
+# Encoding of the bot model (gpt-4o-mini)
+BOT_TOKEN_ENCODING = os.getenv("BOT_TOKEN_ENCODING", "o200k_base")
+# Token counts kept in memory, keyed by snippet hash
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "4096"))
+# A section is only cut down to fit if this much of it remains
+MIN_TRUNCATED_TOKENS = 32
+TRUNCATION_MARKER = "[...]"
+ENTRY_SEPARATOR = "\n\n"
+
+class ContextSection(NamedTuple):
+    """One section of the prompt context
+
+    Entries are packed in order until the section's budget or the overall
+    limit is reached; the entry that crosses it is cut short. Lower
+    priorities are packed first and so are the last to be dropped.
+    """
+    name: str
+    header: str
+    entries: List[str]
+    priority: int
+    budget: int
+    keep_tail: bool = False  # Cut from the start, keeping the latest text
+
+class PackedContext(NamedTuple):
+    """Packed prompt context, with the tokens each section was given"""
+    context: str
+    tokens: Dict[str, int]
+
+class TokenCounter:
+    """Counts tokens with tiktoken, caching the counts of repeated snippets
+
+    Prompts reuse the same profiles, conversations and file chunks, so
+    counts are kept in a bounded LRU keyed by snippet hash. When the
+    encoding cannot be loaded (its file is downloaded on first use), counts
+    fall back to an estimate of four characters per token.
+    """
+
+    def __init__(self, encoding_name: str = BOT_TOKEN_ENCODING, max_entries: int = TOKEN_COUNT_CACHE_SIZE):
+        self.encoding_name = encoding_name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._encoding: Optional[Any] = None
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def encoding(self) -> Optional[Any]:
+        if not self._loaded:
+            try:
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                logger.warning(f"Token encoding {self.encoding_name} unavailable, estimating token counts: {e}")
+            self._loaded = True
+        return self._encoding
+
+    def _count(self, text: str) -> int:
+        encoding = self.encoding
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return count
+            self.misses += 1
+        count = self._count(text)
+        if self.max_entries > 0:
+            with self._lock:
+                self._counts[key] = count
+                while len(self._counts) > self.max_entries:
+                    self._counts.popitem(last=False)
+        return count
+
+    def truncate(self, text: str, max_tokens: int, keep_tail: bool = False) -> str:
+        """Cut text to at most ``max_tokens`` tokens, from the end or the start"""
+        encoding = self.encoding
+        if encoding is None:
+            limit = max_tokens * 4
+            return text[-limit:] if keep_tail else text[:limit]
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(tokens[-max_tokens:] if keep_tail else tokens[:max_tokens])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "encoding": self.encoding_name,
+                "estimated": self._loaded and self._encoding is None,
+                "entries": len(self._counts),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+class _PackingStats:
+    """Running totals of the tokens given to each section"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.packs = 0
+        self.tokens: Dict[str, int] = {}
+        self.truncated: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+
+    def record(self, tokens: Dict[str, int], truncated: List[str], dropped: List[str]) -> None:
+        with self._lock:
+            self.packs += 1
+            for name, count in tokens.items():
+                self.tokens[name] = self.tokens.get(name, 0) + count
+            for name in truncated:
+                self.truncated[name] = self.truncated.get(name, 0) + 1
+            for name in dropped:
+                self.dropped[name] = self.dropped.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "packs": self.packs,
+                "average_tokens": {name: round(count / self.packs, 1) for name, count in self.tokens.items()},
+                "truncated": dict(self.truncated),
+                "dropped": dict(self.dropped),
+            }
+
+token_counter = TokenCounter()
+_packing_stats = _PackingStats()
+
+def _pack_entries(section: ContextSection, available: int, counter: TokenCounter) -> Tuple[List[str], bool]:
+    """The section's entries that fit in ``available`` tokens, the last one
+    possibly cut, and whether any of it was left out"""
+    entries = list(reversed(section.entries)) if section.keep_tail else list(section.entries)
+    separator = counter.count(ENTRY_SEPARATOR)
+    marker = counter.count(TRUNCATION_MARKER) + 1
+    packed: List[str] = []
+    for entry in entries:
+        cost = counter.count(entry) + (separator if packed else 0)
+        if cost <= available:
+            packed.append(entry)
+            available -= cost
+            continue
+        room = available - (separator if packed else 0) - marker
+        if room >= MIN_TRUNCATED_TOKENS:
+            cut = counter.truncate(entry, room, section.keep_tail)
+            packed.append(f"{TRUNCATION_MARKER}\n{cut}" if section.keep_tail else f"{cut}\n{TRUNCATION_MARKER}")
+        return (list(reversed(packed)) if section.keep_tail else packed), True
+    return (list(reversed(packed)) if section.keep_tail else packed), False
+
+def pack_context(sections: List[ContextSection], limit: int = BOT_CONTEXT_TOKENS, counter: TokenCounter = token_counter) -> PackedContext:
+    """Fit context sections into a token limit
+
+    Sections are packed by priority, each up to its own budget, and
+    emitted in the order given. A section left with no entry is dropped.
+    """
+    remaining = limit
+    packed: Dict[str, List[str]] = {}
+    tokens: Dict[str, int] = {}
+    truncated: List[str] = []
+    dropped: List[str] = []
+    for section in sorted(sections, key=lambda s: s.priority):
+        if not section.entries:
+            continue
+        header = counter.count(section.header + ENTRY_SEPARATOR) if section.header else 0
+        available = min(section.budget, remaining) - header
+        entries, cut = _pack_entries(section, available, counter) if available > 0 else ([], True)
+        if not entries:
+            dropped.append(section.name)
+            continue
+        if cut:
+            truncated.append(section.name)
+        packed[section.name] = entries
+        used = header + sum(counter.count(entry) for entry in entries) + counter.count(ENTRY_SEPARATOR) * (len(entries) - 1)
+        tokens[section.name] = used
+        remaining -= used
+
+    blocks = []
+    for section in sections:
+        if section.name in packed:
+            body = ENTRY_SEPARATOR.join(packed[section.name])
+            blocks.append(f"{section.header}{ENTRY_SEPARATOR}{body}" if section.header else body)
+    _packing_stats.record(tokens, truncated, dropped)
+    return PackedContext(ENTRY_SEPARATOR.join(blocks), tokens)
+
+def packing_stats() -> Dict[str, Any]:
+    return {**_packing_stats.snapshot(), "token_counts": token_counter.stats()}
@@ -0,0 +1,186 @@
+import os
+import asyncio
+import hashlib
+import json
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import ByteStore
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Embeddings kept in memory per model; a 3072-dimension vector takes 24 KB
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2000"))
+# Directory of the on-disk embedding store; unset keeps embeddings in memory only
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace, so texts differing only in spacing share an embedding"""
+    return " ".join(text.split())
+
+def embedding_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}-{digest}"
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that computes each distinct text once
+
+    Vectors are keyed by model and normalized text hash and looked up in a
+    bounded in-memory LRU, then in the optional byte store. A text already
+    being embedded by another thread or task is awaited instead of requested
+    again, so concurrent retrievers embedding the same question make a
+    single API call. Query and document embeddings share entries, since
+    OpenAI embeds both the same way.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, max_entries: int = EMBEDDING_CACHE_SIZE, store: Optional[ByteStore] = None):
+        self.underlying = underlying
+        self.model = model
+        self.max_entries = max_entries
+        self.store = store
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, array]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    # --- Lookup --------------------------------------------------------------
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = array("d", vector)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _claim(self, keys: List[str]) -> Tuple[Dict[str, List[float]], Dict[str, Future], Dict[str, Future]]:
+        """Split keys into cached vectors, keys this caller must embed and keys being embedded elsewhere"""
+        found, owned, waiting = {}, {}, {}
+        with self._lock:
+            for key in keys:
+                if key in found or key in owned or key in waiting:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector.tolist()
+                    self.hits += 1
+                elif key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                    self.shared += 1
+                else:
+                    owned[key] = self._inflight[key] = Future()
+        disk_hits = 0
+        if owned and self.store is not None:
+            try:
+                stored = self.store.mget(list(owned))
+            except OSError as e:
+                logger.error(f"Could not read embedding store: {e}")
+                stored = [None] * len(owned)
+            for key, value in zip(list(owned), stored):
+                if value is not None:
+                    vector = json.loads(value.decode("utf-8"))
+                    self._resolve(key, owned.pop(key), vector, persist=False)
+                    found[key] = vector
+                    disk_hits += 1
+        with self._lock:
+            self.disk_hits += disk_hits
+            self.misses += len(owned)
+        return found, owned, waiting
+
+    def _resolve(self, key: str, future: Future, vector: List[float], persist: bool = True) -> None:
+        self._remember(key, vector)
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(vector)
+        if persist and self.store is not None:
+            try:
+                self.store.mset([(key, json.dumps(vector).encode("utf-8"))])
+            except OSError as e:
+                logger.error(f"Could not persist embedding {key}: {e}")
+
+    def _fail(self, owned: Dict[str, Future], error: BaseException) -> None:
+        with self._lock:
+            for key in owned:
+                self._inflight.pop(key, None)
+        for future in owned.values():
+            future.set_exception(error)
+
+    def _owned_texts(self, texts: List[str], keys: List[str], owned: Dict[str, Future]) -> Tuple[List[str], List[str]]:
+        first = {}
+        for text, key in zip(texts, keys):
+            if key in owned and key not in first:
+                first[key] = text
+        return list(first), list(first.values())
+
+    # --- Embeddings interface ------------------------------------------------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(self.model, text) for text in texts]
+        found, owned, waiting = self._claim(keys)
+        if owned:
+            owned_keys, owned_texts = self._owned_texts(texts, keys, owned)
+            try:
+                vectors = self.underlying.embed_documents(owned_texts)
+            except BaseException as e:
+                self._fail(owned, e)
+                raise
+            for key, vector in zip(owned_keys, vectors):
+                self._resolve(key, owned[key], vector)
+                found[key] = vector
+        for key, future in waiting.items():
+            found[key] = future.result()
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(self.model, text) for text in texts]
+        found, owned, waiting = self._claim(keys)
+        if owned:
+            owned_keys, owned_texts = self._owned_texts(texts, keys, owned)
+            try:
+                vectors = await self.underlying.aembed_documents(owned_texts)
+            except BaseException as e:
+                self._fail(owned, e)
+                raise
+            for key, vector in zip(owned_keys, vectors):
+                self._resolve(key, owned[key], vector)
+                found[key] = vector
+        for key, future in waiting.items():
+            found[key] = await asyncio.wrap_future(future)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "model": self.model,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "persistent": self.store is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "shared_in_flight": self.shared,
+            }
+
+def cached_embeddings(underlying: Embeddings, model: str) -> CachedEmbeddings:
+    """Wrap embeddings in the configured cache, persisted under ``EMBEDDING_CACHE_DIR`` if set"""
+    store = None
+    if EMBEDDING_CACHE_DIR:
+        from langchain.storage import LocalFileStore
+        store = LocalFileStore(EMBEDDING_CACHE_DIR)
+    return CachedEmbeddings(underlying, model, store=store)
@@ -0,0 +1,489 @@
+import os
+import asyncio
+import base64
+import json
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Directory holding the index files, one sub-directory per namespace
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "faiss_indexes")
+# Pending changes that start a background rebuild of the index file
+FAISS_REBUILD_THRESHOLD = int(os.getenv("FAISS_REBUILD_THRESHOLD", "1000"))
+# Candidates fetched per wanted result when a filter is checked after the search
+FAISS_FILTER_OVERSAMPLE = 4
+
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+DOCUMENTS_FILE = "documents.json"
+
+# --- Metadata filters ---------------------------------------------------------
+#
+# The Pinecone filter syntax used by the retrievers: a field maps to a value
+# or to operators, and clauses can be combined with $and / $or.
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+}
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Whether document metadata satisfies a Pinecone-style metadata filter"""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+                if not _OPERATORS[operator](value, operand):
+                    return False
+    return True
+
+def _normalized(vectors: List[List[float]]) -> np.ndarray:
+    matrix = np.array(vectors, dtype="float32", ndmin=2)
+    faiss.normalize_L2(matrix)
+    return matrix
+
+# --- Index file generations ---------------------------------------------------
+
+class _Snapshot:
+    """One generation of a namespace: a memory-mapped FAISS index and its documents
+
+    Never changed once written; a rebuild writes the next generation and
+    the store swaps it in.
+    """
+
+    def __init__(self, generation: int, index: Optional[faiss.Index], ids: List[str], documents: List[Tuple[str, Dict[str, Any]]]):
+        self.generation = generation
+        self.index = index
+        self.ids = ids
+        self.documents = documents
+        self.dimension = index.d if index is not None else None
+        self._postings: Dict[str, Optional[Dict[Any, np.ndarray]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def empty(cls) -> "_Snapshot":
+        return cls(0, None, [], [])
+
+    @classmethod
+    def load(cls, path: str, generation: int) -> "_Snapshot":
+        if not os.path.exists(os.path.join(path, INDEX_FILE)):
+            # Every vector was deleted
+            return cls(generation, None, [], [])
+        index = faiss.read_index(os.path.join(path, INDEX_FILE), faiss.IO_FLAG_MMAP)
+        with open(os.path.join(path, DOCUMENTS_FILE), encoding="utf-8") as f:
+            rows = json.load(f)
+        return cls(generation, index, [row[0] for row in rows], [(row[1], row[2]) for row in rows])
+
+    @staticmethod
+    def write(path: str, ids: List[str], vectors: np.ndarray, documents: List[Tuple[str, Dict[str, Any]]]) -> None:
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+        faiss.write_index(index, os.path.join(path, INDEX_FILE))
+        with open(os.path.join(path, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            json.dump([[id, text, metadata] for id, (text, metadata) in zip(ids, documents)], f)
+
+    def vectors(self) -> np.ndarray:
+        """The stored vectors, as a view of the memory-mapped index file"""
+        if self.index is None:
+            return np.empty((0, 0), dtype="float32")
+        return faiss.rev_swig_ptr(self.index.get_xb(), self.index.ntotal * self.dimension).reshape(self.index.ntotal, self.dimension)
+
+    def _field_postings(self, key: str) -> Optional[Dict[Any, np.ndarray]]:
+        """Positions of the documents per value of a metadata field, built on first use"""
+        with self._lock:
+            if key not in self._postings:
+                postings: Dict[Any, List[int]] = {}
+                for position, (_, metadata) in enumerate(self.documents):
+                    value = metadata.get(key)
+                    if isinstance(value, (list, dict)):
+                        # Only scalar fields can be looked up
+                        postings = None
+                        break
+                    postings.setdefault(value, []).append(position)
+                self._postings[key] = (
+                    {value: np.array(positions, dtype="int64") for value, positions in postings.items()}
+                    if postings is not None else None
+                )
+            return self._postings[key]
+
+    def candidate_positions(self, filter: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Positions that can match the equality and ``$in`` clauses of a filter
+
+        None when no clause narrows the search; the filter is still checked
+        on every result.
+        """
+        candidates = None
+        for key, condition in filter.items():
+            if key == "$and":
+                narrowed = [self.candidate_positions(clause) for clause in condition]
+                positions = [p for p in narrowed if p is not None]
+                matched = positions[0] if positions else None
+                for other in positions[1:]:
+                    matched = np.intersect1d(matched, other)
+            elif key.startswith("$"):
+                continue
+            else:
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                values = [condition["$eq"]] if "$eq" in condition else condition.get("$in")
+                postings = self._field_postings(key) if values is not None else None
+                if postings is None:
+                    continue
+                matched = np.concatenate([postings.get(value, np.empty(0, dtype="int64")) for value in values] or [np.empty(0, dtype="int64")])
+            if matched is not None:
+                candidates = matched if candidates is None else np.intersect1d(candidates, matched)
+        return candidates
+
+    def search(self, query: np.ndarray, k: int, filter: Optional[Dict[str, Any]], hidden: frozenset) -> List[Tuple[float, int]]:
+        """Best ``(score, position)`` pairs, skipping hidden IDs and documents failing the filter"""
+        if self.index is None or k <= 0:
+            return []
+        params = None
+        total = self.index.ntotal
+        if filter:
+            positions = self.candidate_positions(filter)
+            if positions is not None:
+                if not len(positions):
+                    return []
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(positions))
+                total = len(positions)
+        fetch = min(total, k * (FAISS_FILTER_OVERSAMPLE if filter else 1) + len(hidden))
+        while True:
+            scores, positions = self.index.search(query, fetch, params=params)
+            results = [
+                (float(score), int(position))
+                for score, position in zip(scores[0], positions[0])
+                if position >= 0
+                and self.ids[position] not in hidden
+                and (not filter or matches_filter(self.documents[position][1], filter))
+            ]
+            if len(results) >= k or fetch >= total:
+                return results[:k]
+            fetch = min(total, fetch * FAISS_FILTER_OVERSAMPLE)
+
+# --- Vector store ---------------------------------------------------------------
+
+class FaissVectorStore(VectorStore):
+    """Vector store kept in local FAISS index files, a drop-in for Pinecone
+
+    Each namespace lives in its own directory. Searches read a memory-mapped
+    index file generation, plus the changes made since it was written, which
+    are kept in memory and appended to a journal so they survive a restart.
+    Once enough changes are pending, a background thread writes the next
+    generation and swaps it in atomically; searches keep running meanwhile.
+    Vectors are normalized, so scores are cosine similarities, and metadata
+    filters use the Pinecone syntax.
+    """
+
+    def __init__(self, directory: str, embedding: Embeddings, rebuild_threshold: int = FAISS_REBUILD_THRESHOLD):
+        self.directory = directory
+        self._embedding = embedding
+        self.rebuild_threshold = rebuild_threshold
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._rebuild_thread: Optional[threading.Thread] = None
+        # Changes since the current generation: ID -> (vector, document), or None when deleted
+        self._pending: Dict[str, Optional[Tuple[np.ndarray, Tuple[str, Dict[str, Any]]]]] = {}
+        self._view: Optional[tuple] = None
+        self.rebuilds = 0
+        self.last_rebuild_ms = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+        self._snapshot = self._load_current()
+        self._dimension = self._snapshot.dimension
+        self._journal_number = self._replay_journals()
+        self._journal = open(self._journal_path(self._journal_number), "a", encoding="utf-8")
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # --- Files ---------------------------------------------------------------
+
+    def _generation_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"gen-{generation:08d}")
+
+    def _journal_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"journal-{number:08d}.jsonl")
+
+    def _journal_numbers(self) -> List[int]:
+        return sorted(
+            int(name[len("journal-"):-len(".jsonl")])
+            for name in os.listdir(self.directory)
+            if name.startswith("journal-") and name.endswith(".jsonl")
+        )
+
+    def _load_current(self) -> _Snapshot:
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE), encoding="utf-8") as f:
+                generation = int(f.read().strip())
+        except FileNotFoundError:
+            return _Snapshot.empty()
+        snapshot = _Snapshot.load(self._generation_path(generation), generation)
+        logger.info(f"Loaded FAISS index {self.directory} generation {generation} with {len(snapshot.ids)} vectors")
+        return snapshot
+
+    def _replay_journals(self) -> int:
+        """Load the changes journaled after the current generation, returning the journal to append to"""
+        number = self._snapshot.generation + 1
+        for journal in self._journal_numbers():
+            if journal <= self._snapshot.generation:
+                os.remove(self._journal_path(journal))
+                continue
+            with open(self._journal_path(journal), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line of a write interrupted by a crash
+                        logger.warning(f"Skipping unreadable entry in FAISS journal {journal} of {self.directory}")
+                        continue
+                    if record["vector"] is None:
+                        self._pending[record["id"]] = None
+                    else:
+                        vector = np.frombuffer(base64.b64decode(record["vector"]), dtype="float32")
+                        self._dimension = self._dimension or len(vector)
+                        self._pending[record["id"]] = (vector, (record["text"], record["metadata"]))
+            number = journal
+        return number
+
+    # --- Writes --------------------------------------------------------------
+
+    def _write(self, changes: List[Tuple[str, Optional[Tuple[np.ndarray, Tuple[str, Dict[str, Any]]]]]]) -> None:
+        with self._lock:
+            for id, change in changes:
+                record = {"id": id, "vector": None}
+                if change is not None:
+                    vector, (text, metadata) = change
+                    record.update(vector=base64.b64encode(vector.tobytes()).decode("ascii"), text=text, metadata=metadata)
+                self._journal.write(json.dumps(record) + "\n")
+                self._pending[id] = change
+            self._journal.flush()
+            self._view = None
+            start_rebuild = len(self._pending) >= self.rebuild_threshold and not self.rebuilding
+            if start_rebuild:
+                self._rebuild_thread = threading.Thread(target=self._rebuild_in_background, name=f"faiss-rebuild-{os.path.basename(self.directory)}", daemon=True)
+                self._rebuild_thread.start()
+
+    def add_vectors(self, vectors: List[List[float]], texts: List[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """Add precomputed embeddings; an existing ID is overwritten"""
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        if not texts:
+            return []
+        matrix = _normalized(vectors)
+        with self._lock:
+            if self._dimension is None:
+                self._dimension = matrix.shape[1]
+            elif matrix.shape[1] != self._dimension:
+                raise ValueError(f"Expected vectors of {self._dimension} dimensions, got {matrix.shape[1]}")
+        self._write([
+            (id, (matrix[i], (text, dict(metadata))))
+            for i, (id, text, metadata) in enumerate(zip(ids, texts, metadatas))
+        ])
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_vectors(self._embedding.embed_documents(texts) if texts else [], texts, metadatas, ids)
+
+    async def aadd_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        vectors = await self._embedding.aembed_documents(texts) if texts else []
+        return self.add_vectors(vectors, texts, metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids is None:
+            raise ValueError("IDs of the vectors to delete are required")
+        self._write([(id, None) for id in ids])
+        return True
+
+    async def adelete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        return self.delete(ids, **kwargs)
+
+    # --- Searches ------------------------------------------------------------
+
+    def _current_view(self) -> tuple:
+        """Snapshot plus a stacked matrix of the pending vectors, cached until the next change"""
+        with self._lock:
+            if self._view is None:
+                live = [(id, change) for id, change in self._pending.items() if change is not None]
+                matrix = np.stack([change[0] for _, change in live]) if live else None
+                self._view = (
+                    self._snapshot,
+                    [id for id, _ in live],
+                    matrix,
+                    [change[1] for _, change in live],
+                    frozenset(self._pending),
+                )
+            return self._view
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        snapshot, pending_ids, pending_matrix, pending_documents, hidden = self._current_view()
+        query = _normalized([embedding])
+        results = [
+            (score, snapshot.documents[position])
+            for score, position in snapshot.search(query, k, filter, hidden)
+        ]
+        if pending_matrix is not None:
+            scores = pending_matrix @ query[0]
+            matched = 0
+            for i in np.argsort(-scores):
+                if matched >= k:
+                    break
+                if not filter or matches_filter(pending_documents[i][1], filter):
+                    results.append((float(scores[i]), pending_documents[i]))
+                    matched += 1
+        results.sort(key=lambda result: -result[0])
+        return [
+            (Document(page_content=text, metadata=dict(metadata)), score)
+            for score, (text, metadata) in results[:k]
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter)]
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = await self._embedding.aembed_query(query)
+        return await asyncio.to_thread(self.similarity_search_with_score_by_vector, embedding, k, filter)
+
+    async def asimilarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in await self.asimilarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosine similarity in [-1, 1] to relevance in [0, 1]
+        return lambda score: (score + 1) / 2
+
+    # --- Rebuilds ------------------------------------------------------------
+
+    @property
+    def rebuilding(self) -> bool:
+        return self._rebuild_thread is not None and self._rebuild_thread.is_alive()
+
+    def _rebuild_in_background(self) -> None:
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.error(f"Rebuilding FAISS index {self.directory} failed: {e}")
+
+    def rebuild(self) -> bool:
+        """Write the pending changes into a new index file generation and swap it in
+
+        Returns False when nothing was pending. Changes made while the
+        generation is written go to the next journal and stay pending.
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                if not self._pending:
+                    return False
+                snapshot = self._snapshot
+                pending = dict(self._pending)
+                generation = self._journal_number
+                self._journal.close()
+                self._journal_number += 1
+                self._journal = open(self._journal_path(self._journal_number), "a", encoding="utf-8")
+
+            started = time.perf_counter()
+            kept = [position for position, id in enumerate(snapshot.ids) if id not in pending]
+            added = [(id, change) for id, change in pending.items() if change is not None]
+            ids = [snapshot.ids[position] for position in kept] + [id for id, _ in added]
+            documents = [snapshot.documents[position] for position in kept] + [change[1] for _, change in added]
+            parts = []
+            if kept:
+                parts.append(snapshot.vectors()[kept])
+            if added:
+                parts.append(np.stack([change[0] for _, change in added]))
+
+            path = self._generation_path(generation)
+            staging = path + ".tmp"
+            shutil.rmtree(staging, ignore_errors=True)
+            os.makedirs(staging)
+            if ids:
+                _Snapshot.write(staging, ids, np.concatenate(parts), documents)
+            os.replace(staging, path)
+            new_snapshot = _Snapshot.load(path, generation)
+
+            # Atomic swap: a restart loads either the old or the new generation
+            current = os.path.join(self.directory, CURRENT_FILE)
+            with open(current + ".tmp", "w", encoding="utf-8") as f:
+                f.write(str(generation))
+            os.replace(current + ".tmp", current)
+
+            with self._lock:
+                self._snapshot = new_snapshot
+                for id, change in pending.items():
+                    # Unless changed again since, the change is now in the index file
+                    if id in self._pending and self._pending[id] is change:
+                        del self._pending[id]
+                self._view = None
+
+            # Searches still holding the old generation keep their mapping after the unlink
+            for number in self._journal_numbers():
+                if number <= generation:
+                    os.remove(self._journal_path(number))
+            if snapshot.generation:
+                shutil.rmtree(self._generation_path(snapshot.generation), ignore_errors=True)
+
+            self.rebuilds += 1
+            self.last_rebuild_ms = round((time.perf_counter() - started) * 1000, 2)
+            logger.info(f"Rebuilt FAISS index {self.directory} generation {generation} with {len(ids)} vectors in {self.last_rebuild_ms} ms")
+            return True
+
+    def close(self) -> None:
+        """Wait for a running rebuild and close the journal; pending changes are replayed on the next start"""
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            self._journal.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "generation": self._snapshot.generation,
+                "indexed": len(self._snapshot.ids),
+                "pending": len(self._pending),
+                "rebuilding": self.rebuilding,
+                "rebuilds": self.rebuilds,
+                "last_rebuild_ms": self.last_rebuild_ms,
+            }
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, directory: str = FAISS_INDEX_DIR, **kwargs: Any) -> "FaissVectorStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
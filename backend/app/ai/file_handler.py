@@ -1,34 +1,22 @@
-import os
-from typing import Optional, List, Tuple
+import asyncio
+from typing import Dict, Optional, List, Tuple
 import aiofiles
-from langchain_openai import ChatOpenAI
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.vectorstores import Pinecone
 from langchain.schema import Document
+from langchain_core.vectorstores import VectorStore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import logging
 from PIL import Image
 import io
 import fitz  # PyMuPDF for PDF processing
 import base64
-from openai import AsyncOpenAI
 from datetime import datetime
 from app.models.message import Message
+from .clients import AIClients, get_ai_clients
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Initialize LLM for text processing
-llm = ChatOpenAI(model_name="gpt-4o-mini")
-
-# Initialize embeddings
-embeddings_1536 = OpenAIEmbeddings(model="text-embedding-ada-002")
-embeddings_3072 = OpenAIEmbeddings(model="text-embedding-3-large")
-
 async def read_text_file(file_path: str) -> str:
     """Read content from a text file."""
     try:
@@ -41,14 +29,17 @@ async def read_text_file(file_path: str) -> str:
             content = await f.read()
             return content
 
-async def read_pdf_file(file_path: str) -> str:
-    """Read content from a PDF file."""
-    try:
-        text = []
-        doc = fitz.open(file_path)
+def _extract_pdf_text(file_path: str) -> str:
+    text = []
+    with fitz.open(file_path) as doc:
         for page in doc:
             text.append(page.get_text())
-        return "\n".join(text)
+    return "\n".join(text)
+
+async def read_pdf_file(file_path: str) -> str:
+    """Read content from a PDF file, in a worker thread so extraction does not block the event loop."""
+    try:
+        return await asyncio.to_thread(_extract_pdf_text, file_path)
     except Exception as e:
         logger.error(f"Error reading PDF file: {str(e)}")
         raise
@@ -71,7 +62,7 @@ async def process_text_content(content: str, chunk_size: int = 1000, chunk_overl
     )
     return text_splitter.split_text(content)
 
-async def generate_text_summary(content: str) -> str:
+async def generate_text_summary(content: str, clients: AIClients) -> str:
     """Generate a single summary for the entire text content."""
     try:
         # Limit content length for the summary
@@ -79,20 +70,20 @@ async def generate_text_summary(content: str) -> str:
         truncated_content = content[:max_content_length] + ("..." if len(content) > max_content_length else "")
         
         prompt = f"Please provide a concise summary of the following text (max 200 words):\n\n{truncated_content}"
-        response = await llm.ainvoke(prompt)
+        response = await clients.summary_llm.ainvoke(prompt)
         return response.content
     except Exception as e:
         logger.error(f"Error generating text summary: {str(e)}")
         return "Error generating summary"
 
-async def generate_image_description(file_path: str) -> str:
+async def generate_image_description(file_path: str, clients: AIClients) -> str:
     """Generate a description for an image using base64 encoding."""
     try:
         # Encode image to base64
         base64_image = await encode_image(file_path)
         
         # Create message with image
-        response = await openai_client.chat.completions.create(
+        response = await clients.openai.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {
@@ -123,24 +114,32 @@ async def generate_image_description(file_path: str) -> str:
         logger.error(f"Error generating image description: {str(e)}")
         return "Error generating image description"
 
-async def upload_to_pinecone_with_model(
+async def upload_to_pinecone(
     documents: List[Document],
-    embeddings,
-    index_name: str,
-    namespace: str
-) -> None:
-    """Upload documents to Pinecone with specified embedding model."""
+    store: VectorStore
+) -> List[str]:
+    """Upload documents to a Pinecone vector store, returning their vector IDs."""
     try:
-        Pinecone.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            index_name=index_name,
-            namespace=namespace
-        )
-        logger.info(f"Successfully uploaded {len(documents)} documents to Pinecone index {index_name}")
+        ids = await store.aadd_documents(documents)
+        logger.info(f"Successfully uploaded {len(documents)} documents to Pinecone")
+        return ids
     except Exception as e:
         logger.error(f"Error uploading to Pinecone: {str(e)}")
-        pass
+        return []
+
+async def delete_vectors(vector_ids: Dict[str, List[str]], clients: Optional[AIClients] = None) -> None:
+    """Delete the vectors of a file, given as store attribute -> vector IDs."""
+    if not any(vector_ids.values()):
+        return
+    clients = clients or get_ai_clients()
+    for store_name, ids in vector_ids.items():
+        if not ids:
+            continue
+        try:
+            store = await asyncio.to_thread(getattr, clients, store_name)
+            await asyncio.to_thread(store.delete, ids=ids)
+        except Exception as e:
+            logger.error(f"Error deleting {len(ids)} vectors from {store_name}: {str(e)}")
 
 async def process_file(
     file_path: str,
@@ -149,13 +148,20 @@ async def process_file(
     filename: str,
     uploaded_by: str,
     message: Optional[Message],
-    created_at: datetime
-) -> Optional[Tuple[List[str], List[str]]]:
-    """Process a file and generate its description."""
+    created_at: datetime,
+    clients: Optional[AIClients] = None
+) -> Optional[Tuple[List[str], List[str], Dict[str, List[str]]]]:
+    """Process a file and generate its description.
+
+    Returns the description, the raw text chunks and the IDs of the vectors
+    stored per store attribute of ``clients``.
+    """
+    clients = clients or get_ai_clients()
     try:
         logger.info(f"Starting file processing for {filename} (type: {file_type})")
         description = None
         raw_chunks = None
+        vector_ids = {}
         
         # Process based on file type
         if file_type.startswith('text/') or file_type == 'application/pdf':
@@ -165,7 +171,7 @@ async def process_file(
             # Get raw chunks for 3072d index
             raw_chunks = await process_text_content(content)
             # Generate one summary for the entire document
-            description = await generate_text_summary(content)
+            description = await generate_text_summary(content, clients)
             
             # Create documents for raw chunks (3072d)
             raw_documents = [
@@ -201,27 +207,12 @@ async def process_file(
             )
             
             # Upload raw chunks and description to 3072d index in separate namespaces
-            pinecone_index_3072 = os.getenv("PINECONE_INDEX")
-            
-            # Upload chunks to chunks namespace
-            await upload_to_pinecone_with_model(
-                raw_documents,
-                embeddings_3072,
-                pinecone_index_3072,
-                "chunks"
-            )
-            
-            # Upload description to descriptions namespace
-            await upload_to_pinecone_with_model(
-                [description_document],
-                embeddings_3072,
-                pinecone_index_3072,
-                "descriptions"
-            )
+            vector_ids["file_chunks_store"] = await upload_to_pinecone(raw_documents, clients.file_chunks_store)
+            vector_ids["file_descriptions_store"] = await upload_to_pinecone([description_document], clients.file_descriptions_store)
             
         elif file_type.startswith('image/'):
             logger.info(f"Processing image file: {filename}")
-            description = await generate_image_description(file_path)
+            description = await generate_image_description(file_path, clients)
             
             # Create document for image description (3072d)
             description_document = Document(
@@ -238,13 +229,7 @@ async def process_file(
             )
             
             # Upload image description to 3072d index in descriptions namespace
-            pinecone_index_3072 = os.getenv("PINECONE_INDEX")
-            await upload_to_pinecone_with_model(
-                [description_document],
-                embeddings_3072,
-                pinecone_index_3072,
-                "descriptions"
-            )
+            vector_ids["file_descriptions_store"] = await upload_to_pinecone([description_document], clients.file_descriptions_store)
             
         else:
             logger.warning(f"Unsupported file type for processing: {file_type}")
@@ -253,7 +238,7 @@ async def process_file(
         if not description:
             logger.warning(f"No description generated for file {filename}")
             
-        return [description] if description else None, raw_chunks
+        return [description] if description else None, raw_chunks, vector_ids
     
     except Exception as e:
         logger.error(f"Error processing file {filename}: {str(e)}", exc_info=True)
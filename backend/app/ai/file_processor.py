@@ -0,0 +1,290 @@
+import os
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from datetime import datetime, timedelta
+import logging
+from sqlalchemy.orm import Session
+from app.models.file import File
+from .clients import AIClients
+from .file_handler import process_file, delete_vectors
+from ..services.file_content import save_file_chunks
+from ..services.upload_store import (
+    claim_processing, release_processing, reuse_processed_content, remember_processed_content
+)
+from ..services.sections import run_in_session
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Files processed at the same time; each one holds an LLM call and embedding
+# requests open, and PDFs are extracted in a worker thread
+FILE_PROCESSING_CONCURRENCY = int(os.getenv("FILE_PROCESSING_CONCURRENCY", "2"))
+# Seconds between checks of a file waiting for identical content processed
+# by another file, and after which that claim is taken over
+FILE_CLAIM_POLL_SECONDS = float(os.getenv("FILE_CLAIM_POLL_SECONDS", "1"))
+FILE_CLAIM_TIMEOUT = int(os.getenv("FILE_CLAIM_TIMEOUT", "600"))
+
+# Values of File.processing_status
+PENDING = "pending"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+class ProcessingJob(NamedTuple):
+    id: int
+    file_path: str
+    file_type: str
+    filename: str
+    uploaded_by: str
+    created_at: datetime
+    content_hash: Optional[str]
+    claimed: bool  # False while another file processes the same content
+
+def can_process(file_type: str) -> bool:
+    """Whether files of this type get a description and searchable chunks"""
+    return file_type.startswith(('text/', 'image/')) or file_type == 'application/pdf'
+
+def _outcome(file: File) -> Dict[str, Any]:
+    return {
+        "file_id": file.id,
+        "status": file.processing_status,
+        "description": file.description,
+        "uploaded_by_id": file.uploaded_by_id,
+        "message_id": file.message_id,
+        "channel_id": file.message.channel_id if file.message else None,
+    }
+
+def _reuse_processing(db: Session, file_id: int) -> Optional[Dict[str, Any]]:
+    # Content uploaded before, including by files queued ahead of this one,
+    # keeps the description and chunks it got then
+    file = db.query(File).filter(File.id == file_id).first()
+    if not file or file.processing_status not in (PENDING, PROCESSING):
+        return None
+    if not reuse_processed_content(db, file):
+        return None
+    file.processing_status = COMPLETED
+    db.commit()
+    return _outcome(file)
+
+def _start_processing(db: Session, file_id: int) -> Optional[ProcessingJob]:
+    file = db.query(File).filter(File.id == file_id).first()
+    if not file or file.processing_status not in (PENDING, PROCESSING):
+        return None
+    claimed = not file.content_hash or claim_processing(
+        db, file.content_hash, timedelta(seconds=FILE_CLAIM_TIMEOUT)
+    )
+    file.processing_status = PROCESSING
+    db.commit()
+    return ProcessingJob(
+        file.id, file.file_path, file.file_type, file.filename,
+        file.uploaded_by.username if file.uploaded_by else "", file.created_at,
+        file.content_hash, claimed
+    )
+
+def _finish_processing(
+    db: Session,
+    job: ProcessingJob,
+    descriptions: Optional[List[str]],
+    chunks: Optional[List[str]],
+    vector_ids: Dict[str, List[str]],
+    succeeded: bool
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Store the outcome of a file; also returns whether its vectors are still referenced"""
+    kept = True
+    if succeeded and job.content_hash:
+        kept = remember_processed_content(
+            db, job.content_hash, descriptions[0] if descriptions else None, chunks, vector_ids
+        )
+    elif job.content_hash:
+        release_processing(db, job.content_hash)
+    file = db.query(File).filter(File.id == job.id).first()
+    if not file:
+        # Deleted while it was processed
+        db.commit()
+        return None, kept
+    if descriptions:
+        file.description = descriptions[0]
+    # Keep the extracted text so file search can match inside documents
+    if chunks:
+        save_file_chunks(db, file, chunks)
+    file.processing_status = COMPLETED if succeeded else FAILED
+    db.commit()
+    return _outcome(file), kept
+
+def _unfinished_file_ids(db: Session) -> List[int]:
+    return [
+        row.id
+        for row in db.query(File.id).filter(File.processing_status.in_([PENDING, PROCESSING])).order_by(File.id)
+    ]
+
+class FileProcessor:
+    """Describes, chunks and embeds uploaded files in the background
+
+    Uploads queue their file once it is committed, and a fixed number of
+    worker tasks take files from the queue, so at most ``concurrency``
+    files run the AI pipeline at once however many are uploaded. The
+    status column is the durable part of the queue: files still pending
+    or processing when the process stopped are queued again on start.
+    ``notify`` is awaited with the outcome of each file.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        clients: AIClients,
+        upload_dir: str,
+        concurrency: int = FILE_PROCESSING_CONCURRENCY,
+        notify: Optional[Callable[..., Awaitable[None]]] = None
+    ):
+        self.session_factory = session_factory
+        self.clients = clients
+        self.upload_dir = upload_dir
+        self.concurrency = concurrency
+        self.notify = notify
+        self._queue: "asyncio.Queue[int]" = asyncio.Queue()
+        self._queued: Set[int] = set()
+        self._workers: List[asyncio.Task] = []
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.reused = 0
+        self.last_file_ms = 0.0
+
+    def submit(self, file_id: int) -> None:
+        """Queue a committed file; must be called on the worker's event loop"""
+        if file_id not in self._queued:
+            self._queued.add(file_id)
+            self._queue.put_nowait(file_id)
+
+    async def process(self, file_id: int) -> Optional[Dict[str, Any]]:
+        """Run the AI pipeline for one file and store its outcome
+
+        Returns the outcome passed to ``notify``, or None if the file was
+        gone or already processed. Content processed before is not sent to
+        the models again, and while another file processes the same
+        content this one waits for it and then reuses its outcome.
+        """
+        while True:
+            result = await asyncio.to_thread(run_in_session, self.session_factory, _reuse_processing, file_id)
+            if result is not None:
+                self.reused += 1
+                logger.info(f"File {file_id} reused the processing of identical content")
+                if self.notify:
+                    await self.notify(**result)
+                return result
+
+            job = await asyncio.to_thread(run_in_session, self.session_factory, _start_processing, file_id)
+            if job is None:
+                return None
+            if job.claimed:
+                break
+            await asyncio.sleep(FILE_CLAIM_POLL_SECONDS)
+        started = time.perf_counter()
+        processed = await process_file(
+            file_path=os.path.join(self.upload_dir, os.path.basename(job.file_path)),
+            file_type=job.file_type,
+            file_id=job.id,
+            filename=job.filename,
+            uploaded_by=job.uploaded_by,
+            message=None,
+            created_at=job.created_at,
+            clients=self.clients
+        )
+        descriptions, chunks, vector_ids = processed if processed else (None, None, {})
+        result, kept = await asyncio.to_thread(
+            run_in_session, self.session_factory, _finish_processing,
+            job, descriptions, chunks, vector_ids, processed is not None
+        )
+        if not kept:
+            await delete_vectors(vector_ids, self.clients)
+        self.last_file_ms = round((time.perf_counter() - started) * 1000, 2)
+        if result is None:
+            return None
+        if result["status"] == COMPLETED:
+            self.completed += 1
+            logger.info(f"Processed file {job.filename} in {self.last_file_ms} ms")
+        else:
+            self.failed += 1
+            logger.warning(f"Processing file {job.filename} failed")
+        if self.notify:
+            await self.notify(**result)
+        return result
+
+    async def _work(self) -> None:
+        while True:
+            file_id = await self._queue.get()
+            self.active += 1
+            try:
+                await self.process(file_id)
+            except Exception as e:
+                logger.error(f"Error processing file {file_id}: {e}", exc_info=True)
+            finally:
+                self.active -= 1
+                self._queued.discard(file_id)
+                self._queue.task_done()
+
+    async def start(self) -> None:
+        """Start the workers and queue the files left unfinished by the last run"""
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"file-processor-{i}")
+            for i in range(self.concurrency)
+        ]
+        try:
+            unfinished = await asyncio.to_thread(run_in_session, self.session_factory, _unfinished_file_ids)
+        except Exception as e:
+            logger.error(f"Could not load unfinished files, they are processed on the next start: {e}")
+            unfinished = []
+        for file_id in unfinished:
+            self.submit(file_id)
+        logger.info(f"File processor started with {self.concurrency} workers and {len(self._queued)} queued files")
+
+    async def stop(self) -> None:
+        # Files being processed stay in the processing state and are redone on the next start
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "active": self.active,
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+            "reused": self.reused,
+            "last_file_ms": self.last_file_ms,
+        }
+
+_processor: Optional[FileProcessor] = None
+
+async def start_file_processor(
+    session_factory: Callable[[], Session],
+    clients: AIClients,
+    upload_dir: str,
+    notify: Optional[Callable[..., Awaitable[None]]] = None
+) -> FileProcessor:
+    """Start the file processing workers; called from the application lifespan"""
+    global _processor
+    _processor = FileProcessor(session_factory, clients, upload_dir, notify=notify)
+    await _processor.start()
+    return _processor
+
+async def stop_file_processor() -> None:
+    global _processor
+    if _processor is not None:
+        await _processor.stop()
+    _processor = None
+
+def get_file_processor() -> Optional[FileProcessor]:
+    return _processor
+
+def enqueue_file(file_id: int) -> bool:
+    """Queue a committed file for processing; without a running processor it
+    stays pending and is picked up when one starts"""
+    if _processor is None:
+        return False
+    _processor.submit(file_id)
+    return True
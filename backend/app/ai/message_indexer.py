@@ -1,57 +1,324 @@
 import os
-from typing import Optional
-from datetime import datetime
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from datetime import datetime, timedelta, UTC
 from langchain.schema import Document
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.vectorstores import Pinecone
+from sqlalchemy import event, func, inspect, insert
+from sqlalchemy.orm import Session, joinedload
 import logging
 from app.models.message import Message
+from app.models.index_outbox import IndexOutbox
+from .clients import AIClients
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize embeddings for messages (1536 dimensions)
-embeddings_1536 = OpenAIEmbeddings(model="text-embedding-ada-002")
-
-async def index_message(message: Message) -> None:
-    """Index a single message in Pinecone."""
-    try:
-        # Create base metadata
-        metadata = {
-            'message_id': str(message.id),
-            'sender': message.sender.username,
-            'channel': message.channel.name,
-            'timestamp': message.created_at.isoformat(),
-            'is_bot': message.is_bot,
-            'has_attachments': message.has_attachments,
+# A batch is sent once it has this many messages, or once its oldest
+# message has waited this long
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+INDEX_BATCH_WAIT_MS = int(os.getenv("INDEX_BATCH_WAIT_MS", "500"))
+# Seconds between checks for entries written by other processes
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "2"))
+# Seconds a claimed batch stays invisible to other workers
+INDEX_LEASE_SECONDS = 120
+# Retry delays grow from the base, doubling per attempt, up to the cap
+INDEX_RETRY_BASE_SECONDS = 2.0
+INDEX_RETRY_MAX_SECONDS = 600.0
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+class OutboxEntry(NamedTuple):
+    id: int
+    message_id: int
+    operation: str
+
+def _utcnow() -> datetime:
+    # Naive UTC, as stored by the DateTime columns
+    return datetime.now(UTC).replace(tzinfo=None)
+
+def vector_id(message_id: int) -> str:
+    """Vector ID of a message; re-indexing a message overwrites its vector"""
+    return f"message-{message_id}"
+
+def message_document(message: Message) -> Document:
+    """Build the document indexed for a message, with its sender and channel"""
+    metadata = {
+        'message_id': str(message.id),
+        'sender': message.sender.username,
+        'channel': message.channel.name,
+        'channel_id': message.channel_id,
+        'timestamp': message.created_at.isoformat(),
+        'is_bot': message.is_bot,
+        'has_attachments': message.has_attachments,
+    }
+
+    # Only add parent_id if it exists
+    if message.parent_id:
+        metadata['parent_id'] = str(message.parent_id)
+
+    return Document(page_content=message.content, metadata=metadata)
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter for an entry that failed ``attempts`` times"""
+    delay = min(INDEX_RETRY_MAX_SECONDS, INDEX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+class MessageIndexWorker:
+    """Drains the index outbox into the Pinecone messages index in batches
+
+    Each batch embeds its messages in one call and upserts them in one
+    request, with vector IDs derived from the message IDs so retries and
+    edits overwrite instead of duplicating. Entries are leased while a
+    batch runs; failed entries are retried with exponential backoff.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], clients: AIClients, batch_size: int = INDEX_BATCH_SIZE, max_wait_ms: int = INDEX_BATCH_WAIT_MS):
+        self.session_factory = session_factory
+        self.clients = clients
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self.batches = 0
+        self.indexed = 0
+        self.deleted = 0
+        self.failures = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    # --- Outbox access (worker threads) -------------------------------------
+
+    def _ready(self) -> bool:
+        """Whether a batch is full, or its oldest due entry has waited long enough"""
+        db = self.session_factory()
+        try:
+            now = _utcnow()
+            due = db.query(IndexOutbox.id).filter(IndexOutbox.next_attempt_at <= now)
+            if due.limit(self.batch_size).count() >= self.batch_size:
+                return True
+            oldest = due.with_entities(func.min(IndexOutbox.created_at)).scalar()
+            return oldest is not None and now - oldest >= timedelta(milliseconds=self.max_wait_ms)
+        finally:
+            db.close()
+
+    def _claim(self) -> List[OutboxEntry]:
+        db = self.session_factory()
+        try:
+            now = _utcnow()
+            entries = (
+                db.query(IndexOutbox)
+                .filter(IndexOutbox.next_attempt_at <= now)
+                .order_by(IndexOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            claimed = [OutboxEntry(entry.id, entry.message_id, entry.operation) for entry in entries]
+            for entry in entries:
+                entry.next_attempt_at = now + timedelta(seconds=INDEX_LEASE_SECONDS)
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _load_messages(self, message_ids: List[int]) -> List[Message]:
+        db = self.session_factory()
+        try:
+            messages = (
+                db.query(Message)
+                .options(joinedload(Message.sender), joinedload(Message.channel))
+                .filter(Message.id.in_(message_ids))
+                .all()
+            )
+            return [message for message in messages if message.content]
+        finally:
+            db.close()
+
+    def _finish(self, entries: List[OutboxEntry], error: Optional[Exception]) -> None:
+        db = self.session_factory()
+        try:
+            ids = [entry.id for entry in entries]
+            if error is None:
+                db.query(IndexOutbox).filter(IndexOutbox.id.in_(ids)).delete(synchronize_session=False)
+            else:
+                now = _utcnow()
+                for entry in db.query(IndexOutbox).filter(IndexOutbox.id.in_(ids)):
+                    entry.attempts += 1
+                    entry.next_attempt_at = now + timedelta(seconds=retry_delay(entry.attempts))
+                    entry.last_error = str(error)[:1000]
+            db.commit()
+        finally:
+            db.close()
+
+    # --- Batches -------------------------------------------------------------
+
+    async def _apply(self, entries: List[OutboxEntry]) -> None:
+        # The latest entry of a message decides whether it is indexed or removed
+        operations: Dict[int, str] = {}
+        for entry in entries:
+            operations[entry.message_id] = entry.operation
+        upserts = [message_id for message_id, operation in operations.items() if operation == UPSERT]
+        deletes = [message_id for message_id, operation in operations.items() if operation == DELETE]
+
+        store = await asyncio.to_thread(getattr, self.clients, "messages_store")
+        if upserts:
+            messages = await asyncio.to_thread(self._load_messages, upserts)
+            if messages:
+                await store.aadd_documents(
+                    [message_document(message) for message in messages],
+                    ids=[vector_id(message.id) for message in messages],
+                    batch_size=len(messages),
+                    embedding_chunk_size=len(messages)
+                )
+                self.indexed += len(messages)
+        if deletes:
+            await asyncio.to_thread(store.delete, ids=[vector_id(message_id) for message_id in deletes])
+            self.deleted += len(deletes)
+
+    async def drain_once(self) -> int:
+        """Claim and apply one batch of due entries, returning how many were claimed"""
+        entries = await asyncio.to_thread(self._claim)
+        if not entries:
+            return 0
+        started = time.perf_counter()
+        error = None
+        try:
+            await self._apply(entries)
+        except Exception as e:
+            error = e
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Indexing batch of {len(entries)} outbox entries failed, will retry: {e}")
+        await asyncio.to_thread(self._finish, entries, error)
+        self.batches += 1
+        self.last_batch_size = len(entries)
+        self.last_batch_ms = round((time.perf_counter() - started) * 1000, 2)
+        return len(entries)
+
+    # --- Loop ----------------------------------------------------------------
+
+    def notify(self) -> None:
+        """Wake the worker up; safe to call from any thread"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        logger.info("Message index worker started")
+        while not self._stopping:
+            try:
+                if await asyncio.to_thread(self._ready):
+                    if await self.drain_once() == self.batch_size:
+                        continue
+                    await self._sleep(INDEX_POLL_SECONDS)
+                else:
+                    # Wait for more entries, or for the oldest to reach the batch window
+                    await self._sleep(min(INDEX_POLL_SECONDS, self.max_wait_ms / 1000))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Message index worker error: {e}")
+                await self._sleep(INDEX_POLL_SECONDS)
+        logger.info("Message index worker stopped")
+
+    def stop(self) -> None:
+        self._stopping = True
+        self.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "indexed": self.indexed,
+            "deleted": self.deleted,
+            "failures": self.failures,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": self.last_batch_ms,
+            "last_error": self.last_error,
         }
-        
-        # Only add parent_id if it exists
-        if message.parent_id:
-            metadata['parent_id'] = str(message.parent_id)
-
-        # Create document for the message
-        document = Document(
-            page_content=message.content,
-            metadata=metadata
-        )
 
-        # Get the message index name
-        message_index = os.getenv("PINECONE_INDEX_TWO")  # 1536 dimensions
-        if not message_index:
-            logger.error("PINECONE_INDEX_TWO environment variable not found")
-            return
-
-        # Upload to Pinecone
-        Pinecone.from_documents(
-            documents=[document],
-            embedding=embeddings_1536,
-            index_name=message_index,
-            namespace="messages"
+def outbox_stats(db: Session) -> Dict[str, Any]:
+    """Backlog of the index outbox and the age of its oldest entry"""
+    pending, oldest, retrying = db.query(
+        func.count(IndexOutbox.id),
+        func.min(IndexOutbox.created_at),
+        func.count(IndexOutbox.id).filter(IndexOutbox.attempts > 0)
+    ).one()
+    return {
+        "pending": pending,
+        "retrying": retrying,
+        "lag_seconds": round((_utcnow() - oldest).total_seconds(), 3) if oldest else 0.0,
+    }
+
+_worker: Optional[MessageIndexWorker] = None
+_worker_task: Optional[asyncio.Task] = None
+
+def start_index_worker(session_factory: Callable[[], Session], clients: AIClients) -> MessageIndexWorker:
+    """Start the outbox worker on the running event loop; called from the application lifespan"""
+    global _worker, _worker_task
+    _worker = MessageIndexWorker(session_factory, clients)
+    _worker_task = asyncio.create_task(_worker.run())
+    return _worker
+
+async def stop_index_worker() -> None:
+    global _worker, _worker_task
+    if _worker is not None:
+        _worker.stop()
+        try:
+            await asyncio.wait_for(_worker_task, INDEX_POLL_SECONDS + 5)
+        except asyncio.TimeoutError:
+            _worker_task.cancel()
+    _worker, _worker_task = None, None
+
+def get_index_worker() -> Optional[MessageIndexWorker]:
+    return _worker
+
+# --- Outbox writes -------------------------------------------------------------
+#
+# Entries are inserted by the flush that writes the message, so they commit
+# or roll back with it, whichever endpoint or task made the change.
+
+def _outbox_entries(session: Session) -> List[dict]:
+    entries = []
+    for obj in session.new:
+        if isinstance(obj, Message):
+            entries.append({"message_id": obj.id, "operation": UPSERT})
+    for obj in session.dirty:
+        if isinstance(obj, Message) and inspect(obj).attrs.content.history.has_changes():
+            entries.append({"message_id": obj.id, "operation": UPSERT})
+    for obj in session.deleted:
+        if isinstance(obj, Message):
+            entries.append({"message_id": obj.id, "operation": DELETE})
+    return entries
+
+@event.listens_for(Session, "after_flush")
+def _write_outbox(session: Session, flush_context) -> None:
+    entries = _outbox_entries(session)
+    if entries:
+        now = _utcnow()
+        session.connection().execute(
+            insert(IndexOutbox.__table__),
+            [{**entry, "attempts": 0, "next_attempt_at": now, "created_at": now} for entry in entries]
         )
-        logger.info(f"Successfully indexed message {message.id} in Pinecone")
+        session.info["index_outbox_written"] = True
+
+@event.listens_for(Session, "after_commit")
+def _notify_worker(session: Session) -> None:
+    if session.info.pop("index_outbox_written", False) and _worker is not None:
+        _worker.notify()
 
-    except Exception as e:
-        logger.error(f"Error indexing message {message.id} in Pinecone: {str(e)}")
-        # Don't raise the exception - we don't want to break message creation if indexing fails 
\ No newline at end of file
+@event.listens_for(Session, "after_rollback")
+def _discard_outbox_flag(session: Session) -> None:
+    session.info.pop("index_outbox_written", None)
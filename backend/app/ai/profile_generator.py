@@ -2,64 +2,78 @@ from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 from datetime import datetime, time, timedelta, UTC
 from collections import Counter
-from typing import List, Dict, Any
+from typing import Callable, Dict, Any, Optional
+import asyncio
 import logging
-from langchain_openai import ChatOpenAI
+import math
 from langchain.prompts import PromptTemplate
 from ..models.message import Message
 from ..models.user import User
-from ..models.file import File
+from ..models.user_activity_stats import UserActivityStats
+from ..services.activity_stats import get_activity_stats, hour_histogram, file_type_counts
+from ..services.sections import run_in_session
+from .clients import AIClients, get_ai_clients
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def check_and_update_profile(db: Session, target_user_id: int) -> None:
+# A profile is regenerated at most this often, and only after new activity
+PROFILE_MAX_AGE = timedelta(hours=1)
+
+def profile_is_stale(user: User, stats: Optional[UserActivityStats]) -> bool:
+    """Whether a user's profile is older than PROFILE_MAX_AGE and missing newer activity"""
+    if user.last_profile_generated is None:
+        return True
+    last_generated = user.last_profile_generated.replace(tzinfo=None)
+    if datetime.now(UTC).replace(tzinfo=None) - last_generated <= PROFILE_MAX_AGE:
+        return False
+    return stats is None or (stats.last_message_at is not None and stats.last_message_at > last_generated)
+
+def _stale_profile_prompt(db: Session, target_user_id: int) -> Optional[str]:
+    """The prompt for a new profile of the user, or None if theirs is recent or cannot be made"""
+    user = db.query(User).filter(User.id == target_user_id).first()
+    if not user:
+        logger.error(f"User {target_user_id} not found")
+        return None
+
+    stats = db.query(UserActivityStats).filter(UserActivityStats.user_id == target_user_id).first()
+    if not profile_is_stale(user, stats):
+        logger.info(f"Profile for user {target_user_id} is still recent, skipping generation")
+        return None
+    logger.info(f"Generating new profile for user {target_user_id}")
+    return build_profile_prompt(db, target_user_id)
+
+async def check_and_update_profile(
+    session_factory: Callable[[], Session],
+    target_user_id: int,
+    clients: Optional[AIClients] = None
+) -> None:
     """
     Check if a user's profile needs to be updated and generate a new one if needed.
-    A profile needs updating if it hasn't been generated in the last hour.
+    A profile needs updating if it hasn't been generated in the last hour and
+    the user has been active since. The database work runs in worker threads,
+    each on its own session, so only the LLM call is awaited on the event loop.
     """
     try:
-        user = db.query(User).filter(User.id == target_user_id).first()
-        if not user:
-            logger.error(f"User {target_user_id} not found")
+        prompt = await asyncio.to_thread(run_in_session, session_factory, _stale_profile_prompt, target_user_id)
+        if prompt is None:
             return
-
-        # Check if profile needs updating
-        current_time = datetime.now(UTC)
-        last_generated = user.last_profile_generated.replace(tzinfo=UTC) if user.last_profile_generated else None
-        
-        needs_update = (
-            last_generated is None or
-            (current_time - last_generated) > timedelta(hours=1)
-        )
-
-        if needs_update:
-            logger.info(f"Generating new profile for user {target_user_id}")
-            await generate_user_profile(db, target_user_id)
-            
-            # Update last_profile_generated timestamp
-            user.last_profile_generated = current_time
-            db.commit()
-            logger.info(f"Updated profile generation timestamp for user {target_user_id}")
-        else:
-            logger.info(f"Profile for user {target_user_id} is still recent, skipping generation")
-
+        description = await _describe_profile(prompt, clients)
+        await asyncio.to_thread(run_in_session, session_factory, save_profile, target_user_id, description)
     except Exception as e:
         logger.error(f"Error in check_and_update_profile for user {target_user_id}: {e}")
-        db.rollback()
 
-def analyze_activity_patterns(messages: List[Message]) -> Dict[str, Any]:
-    """Analyze user's activity patterns from their messages."""
-    if not messages:
+def analyze_activity_patterns(stats: UserActivityStats) -> Dict[str, Any]:
+    """Analyze user's activity patterns from their message hour histogram."""
+    if not stats.message_count:
         return {}
     
-    # Track message times
-    hour_counts = Counter([msg.created_at.hour for msg in messages])
+    hour_counts = hour_histogram(stats)
     
     # Determine most active hours (top 3)
     most_active_hours = sorted(
-        [(hour, count) for hour, count in hour_counts.items()],
+        [(hour, count) for hour, count in enumerate(hour_counts) if count],
         key=lambda x: x[1],
         reverse=True
     )[:3]
@@ -75,7 +89,9 @@ def analyze_activity_patterns(messages: List[Message]) -> Dict[str, Any]:
         else:
             return "night"
     
-    period_counts = Counter([hour_to_period(hour) for hour in hour_counts.keys()])
+    period_counts = Counter()
+    for hour, count in enumerate(hour_counts):
+        period_counts[hour_to_period(hour)] += count
     most_active_period = max(period_counts.items(), key=lambda x: x[1])[0]
     
     # Format active hours
@@ -89,123 +105,81 @@ def analyze_activity_patterns(messages: List[Message]) -> Dict[str, Any]:
         "active_hours": active_hours
     }
 
-def analyze_communication_style(messages: List[Message]) -> Dict[str, Any]:
-    """Analyze user's communication style from their messages."""
-    if not messages:
+def analyze_communication_style(stats: UserActivityStats) -> Dict[str, Any]:
+    """Analyze user's communication style from their message statistics."""
+    count = stats.message_count
+    if not count:
         return {}
     
-    # Calculate average message length
-    avg_length = sum(len(msg.content) for msg in messages) / len(messages)
-    
-    # Count messages with code blocks
-    code_messages = sum(1 for msg in messages if "```" in msg.content)
-    uses_code = code_messages > len(messages) * 0.1  # More than 10% of messages have code
-    
-    # Count messages with emojis (basic check)
-    emoji_messages = sum(1 for msg in messages if any(c in msg.content for c in "😀😊🙂👍"))
-    uses_emojis = emoji_messages > len(messages) * 0.1
+    # Average message length and its spread, from the length moments
+    avg_length = stats.length_sum / count
+    length_stddev = math.sqrt(max(stats.length_square_sum / count - avg_length ** 2, 0))
     
-    # Analyze message structure
-    short_messages = sum(1 for msg in messages if len(msg.content) < 50)
-    long_messages = sum(1 for msg in messages if len(msg.content) > 200)
+    # More than 10% of messages have code blocks or emojis
+    uses_code = stats.code_count > count * 0.1
+    uses_emojis = stats.emoji_count > count * 0.1
     
-    style = "concise" if short_messages > long_messages else "detailed"
+    style = "concise" if stats.short_count > stats.long_count else "detailed"
     
     return {
         "avg_message_length": avg_length,
+        "message_length_stddev": length_stddev,
         "uses_code_blocks": uses_code,
         "uses_emojis": uses_emojis,
         "communication_style": style
     }
 
-def analyze_file_patterns(files: List[File]) -> Dict[str, Any]:
-    """Analyze user's file sharing patterns."""
-    try:
-        if not files:
-            return {
-                "common_file_types": [],
-                "total_files": 0,
-                "avg_files_per_day": 0,
-                "shares_files": False
-            }
-        
-        # Track file types
-        file_type_counts = Counter()
-        for file in files:
-            try:
-                if hasattr(file, 'file_type') and file.file_type:
-                    main_type = file.file_type.split('/')[0]
-                    file_type_counts[main_type] += 1
-            except (AttributeError, ValueError) as e:
-                logger.warning(f"Could not process file type for file {file.id}: {e}")
-        
-        # Determine most common file categories
-        common_types = sorted(
-            [(ftype, count) for ftype, count in file_type_counts.items()],
-            key=lambda x: x[1],
-            reverse=True
-        )
-        
-        # Analyze file sharing frequency
-        try:
-            file_dates = [file.created_at.date() for file in files if hasattr(file, 'created_at')]
-            unique_days = len(set(file_dates))
-            total_files = len(files)
-            
-            # Calculate average files per active day
-            avg_files_per_day = total_files / unique_days if unique_days > 0 else 0
-        except Exception as e:
-            logger.warning(f"Error calculating file frequency: {e}")
-            unique_days = 0
-            total_files = len(files)
-            avg_files_per_day = 0
-        
-        return {
-            "common_file_types": [ftype for ftype, _ in common_types],
-            "total_files": total_files,
-            "avg_files_per_day": avg_files_per_day,
-            "shares_files": total_files > 0
-        }
-    except Exception as e:
-        logger.error(f"Error in analyze_file_patterns: {e}")
+def analyze_file_patterns(stats: UserActivityStats) -> Dict[str, Any]:
+    """Analyze user's file sharing patterns from their upload statistics."""
+    if not stats.file_count:
         return {
             "common_file_types": [],
             "total_files": 0,
             "avg_files_per_day": 0,
             "shares_files": False
         }
+    
+    # Determine most common file categories
+    common_types = sorted(
+        file_type_counts(stats).items(),
+        key=lambda x: x[1],
+        reverse=True
+    )
+    
+    # Calculate average files per active day
+    avg_files_per_day = stats.file_count / stats.file_days if stats.file_days else 0
+    
+    return {
+        "common_file_types": [ftype for ftype, _ in common_types],
+        "total_files": stats.file_count,
+        "avg_files_per_day": avg_files_per_day,
+        "shares_files": True
+    }
 
-async def generate_user_profile(db: Session, user_id: int) -> str:
-    """Generate a profile description for a user based on their message history."""
-    try:
-        # Get user and their last 50 messages
-        messages = (
-            db.query(Message)
-            .filter(Message.sender_id == user_id)
-            .order_by(Message.created_at.desc())
-            .limit(50)
-            .all()
-        )
-        
-        # Get user's files
-        files = (
-            db.query(File)
-            .filter(File.uploaded_by_id == user_id)
-            .order_by(File.created_at.desc())
-            .all()
-        )
-        
-        if not messages and not files:
-            return "Not enough history to generate a profile."
-        
-        # Analyze patterns
-        activity_patterns = analyze_activity_patterns(messages)
-        comm_style = analyze_communication_style(messages)
-        file_patterns = analyze_file_patterns(files)
-        
-        # Create prompt for GPT
-        prompt = PromptTemplate(
-            template="""Based on the user's message history and file sharing patterns, generate a natural description of their profile. Include their communication style, activity patterns, and apparent interests.
+def build_profile_prompt(db: Session, user_id: int) -> Optional[str]:
+    """The LLM prompt describing a user's activity, or None without enough history"""
+    # Patterns come from the running statistics; only the messages
+    # quoted in the prompt are read
+    stats = get_activity_stats(db, user_id)
+    messages = (
+        db.query(Message)
+        .filter(Message.sender_id == user_id)
+        .order_by(Message.created_at.desc())
+        .limit(10)
+        .all()
+    )
+    
+    if not stats.message_count and not stats.file_count:
+        return None
+    
+    # Analyze patterns
+    activity_patterns = analyze_activity_patterns(stats)
+    comm_style = analyze_communication_style(stats)
+    file_patterns = analyze_file_patterns(stats)
+    
+    # Create prompt for GPT
+    prompt = PromptTemplate(
+        template="""Based on the user's message history and file sharing patterns, generate a natural description of their profile. Include their communication style, activity patterns, and apparent interests.
 
 Analysis:
 - Most active during the {most_active_period}
@@ -229,69 +203,76 @@ Generate a natural, paragraph-form description that captures the user's personal
 5. Any notable patterns in their interactions
 
 Keep the description professional but conversational. Don't explicitly mention message counts or technical metrics.""",
-            input_variables=[
-                "most_active_period",
-                "active_hours",
-                "avg_length",
-                "comm_style",
-                "code_note",
-                "emoji_note",
-                "file_sharing_note",
-                "file_types",
-                "file_frequency",
-                "messages"
-            ]
-        )
-        
-        # Format messages for prompt
-        message_text = "\n".join([
-            f"- {msg.content[:100]}..." if len(msg.content) > 100 else f"- {msg.content}"
-            for msg in messages[:10]  # Only include first 10 messages in prompt
-        ])
-        
-        # Create file sharing notes
-        file_sharing_note = "Frequently shares files" if file_patterns.get("shares_files", False) else "Rarely shares files"
-        file_types = ", ".join(file_patterns.get("common_file_types", ["none"]))
-        file_frequency = f"Shares approximately {file_patterns.get('avg_files_per_day', 0):.1f} files per active day" if file_patterns.get("shares_files", False) else "No file sharing activity"
-        
-        # Create prompt variables
-        prompt_vars = {
-            "most_active_period": activity_patterns.get("most_active_period", "various times"),
-            "active_hours": ", ".join(activity_patterns.get("active_hours", [])),
-            "avg_length": comm_style.get("avg_message_length", 0),
-            "comm_style": comm_style.get("communication_style", "varied"),
-            "code_note": "Frequently shares code examples" if comm_style.get("uses_code_blocks") else "Rarely shares code",
-            "emoji_note": "Often uses emojis" if comm_style.get("uses_emojis") else "Rarely uses emojis",
-            "file_sharing_note": file_sharing_note,
-            "file_types": file_types,
-            "file_frequency": file_frequency,
-            "messages": message_text
-        }
-        
-        # Generate profile using GPT-4
-        llm = ChatOpenAI(
-            temperature=0.7,
-            model_name="gpt-4o-mini",
-            model_kwargs={
-                "response_format": { "type": "text" }
-            }
-        )
-        
-        result = llm.invoke(prompt.format(**prompt_vars))
-        logger.info(f"Generated profile content: {result.content[:100]}...")  # Log first 100 chars
-        
-        # Update user's description in database
-        user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            previous_description = user.description
-            user.description = result.content
-            db.commit()
-            logger.info(f"Updated profile description for user {user_id}. Previous length: {len(previous_description) if previous_description else 0}, New length: {len(result.content)}")
-        else:
-            logger.error(f"User {user_id} not found when trying to update description")
-        
-        return result.content
+        input_variables=[
+            "most_active_period",
+            "active_hours",
+            "avg_length",
+            "comm_style",
+            "code_note",
+            "emoji_note",
+            "file_sharing_note",
+            "file_types",
+            "file_frequency",
+            "messages"
+        ]
+    )
+    
+    # Format messages for prompt
+    message_text = "\n".join([
+        f"- {msg.content[:100]}..." if len(msg.content) > 100 else f"- {msg.content}"
+        for msg in messages
+    ])
+    
+    # Create file sharing notes
+    file_sharing_note = "Frequently shares files" if file_patterns.get("shares_files", False) else "Rarely shares files"
+    file_types = ", ".join(file_patterns.get("common_file_types", ["none"]))
+    file_frequency = f"Shares approximately {file_patterns.get('avg_files_per_day', 0):.1f} files per active day" if file_patterns.get("shares_files", False) else "No file sharing activity"
+    
+    # Create prompt variables
+    prompt_vars = {
+        "most_active_period": activity_patterns.get("most_active_period", "various times"),
+        "active_hours": ", ".join(activity_patterns.get("active_hours", [])),
+        "avg_length": comm_style.get("avg_message_length", 0),
+        "comm_style": comm_style.get("communication_style", "varied"),
+        "code_note": "Frequently shares code examples" if comm_style.get("uses_code_blocks") else "Rarely shares code",
+        "emoji_note": "Often uses emojis" if comm_style.get("uses_emojis") else "Rarely uses emojis",
+        "file_sharing_note": file_sharing_note,
+        "file_types": file_types,
+        "file_frequency": file_frequency,
+        "messages": message_text
+    }
+    
+    return prompt.format(**prompt_vars)
+
+async def _describe_profile(prompt: str, clients: Optional[AIClients] = None) -> str:
+    # Generate profile using the shared profile model
+    llm = (clients or get_ai_clients()).profile_llm
+    result = await llm.ainvoke(prompt)
+    logger.info(f"Generated profile content: {result.content[:100]}...")  # Log first 100 chars
+    return result.content
+
+def save_profile(db: Session, user_id: int, description: str) -> None:
+    """Store a generated profile description"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if user:
+        previous_description = user.description
+        user.description = description
+        user.last_profile_generated = datetime.now(UTC)
+        db.commit()
+        logger.info(f"Updated profile description for user {user_id}. Previous length: {len(previous_description) if previous_description else 0}, New length: {len(description)}")
+    else:
+        logger.error(f"User {user_id} not found when trying to update description")
+
+async def generate_user_profile(db: Session, user_id: int, clients: Optional[AIClients] = None) -> str:
+    """Generate a profile description for a user based on their message history."""
+    try:
+        prompt = build_profile_prompt(db, user_id)
+        if prompt is None:
+            return "Not enough history to generate a profile."
+        description = await _describe_profile(prompt, clients)
+        save_profile(db, user_id, description)
+        return description
         
     except Exception as e:
         logger.error(f"Error generating user profile: {e}")
-        raise 
\ No newline at end of file
+        raise
@@ -0,0 +1,163 @@
+import os
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+from datetime import datetime, UTC
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, aliased
+import logging
+from app.models.user import User
+from app.models.user_activity_stats import UserActivityStats
+from .clients import AIClients
+from .profile_generator import PROFILE_MAX_AGE, check_and_update_profile
+from ..services.sections import run_in_session
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds between passes over the users whose profiles are due
+PROFILE_REFRESH_INTERVAL_SECONDS = float(os.getenv("PROFILE_REFRESH_INTERVAL_SECONDS", "300"))
+# Profiles regenerated per pass; each one is an LLM call
+PROFILE_REFRESH_BATCH = int(os.getenv("PROFILE_REFRESH_BATCH", "10"))
+
+def _due_user_ids(db: Session, limit: int) -> List[int]:
+    """Users with a bot whose profile is missing, or old and behind their activity"""
+    bot = aliased(User)
+    cutoff = datetime.now(UTC).replace(tzinfo=None) - PROFILE_MAX_AGE
+    rows = (
+        db.query(User.id)
+        .join(bot, bot.username == User.username.concat("<bot>"))
+        .outerjoin(UserActivityStats, UserActivityStats.user_id == User.id)
+        .filter(
+            User.is_bot.isnot(True),
+            or_(
+                User.last_profile_generated.is_(None),
+                and_(
+                    User.last_profile_generated < cutoff,
+                    or_(
+                        UserActivityStats.user_id.is_(None),
+                        UserActivityStats.last_message_at > User.last_profile_generated
+                    )
+                )
+            )
+        )
+        .order_by(User.last_profile_generated.asc().nullsfirst())
+        .limit(limit)
+    )
+    return [row.id for row in rows]
+
+class ProfileRefresher:
+    """Regenerates the profiles that user bots answer with, in the background
+
+    Every ``interval`` seconds it refreshes up to ``batch_size`` profiles of
+    users who have a bot, oldest first, skipping users with no activity
+    since their last profile. Bot replies read the stored profile and only
+    ask for a refresh, so they never wait for one.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        clients: AIClients,
+        interval: float = PROFILE_REFRESH_INTERVAL_SECONDS,
+        batch_size: int = PROFILE_REFRESH_BATCH
+    ):
+        self.session_factory = session_factory
+        self.clients = clients
+        self.interval = interval
+        self.batch_size = batch_size
+        self._requested: Set[int] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.passes = 0
+        self.checked = 0
+        self.last_pass_ms = 0.0
+
+    def request(self, user_id: int) -> None:
+        """Check a user's profile on the next pass, which starts at once;
+        must be called on the refresher's event loop"""
+        self._requested.add(user_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def refresh_once(self) -> int:
+        """Refresh the requested and due profiles, returning how many were checked"""
+        requested, self._requested = self._requested, set()
+        due = await asyncio.to_thread(run_in_session, self.session_factory, _due_user_ids, self.batch_size)
+        user_ids = list(requested) + [user_id for user_id in due if user_id not in requested]
+        started = time.perf_counter()
+        for user_id in user_ids:
+            await check_and_update_profile(self.session_factory, user_id, self.clients)
+        self.passes += 1
+        self.checked += len(user_ids)
+        self.last_pass_ms = round((time.perf_counter() - started) * 1000, 2)
+        if user_ids:
+            logger.info(f"Checked {len(user_ids)} profiles in {self.last_pass_ms} ms")
+        return len(user_ids)
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        logger.info("Profile refresher started")
+        while not self._stopping:
+            # The first pass waits too, so starting the application stays cheap
+            await self._sleep(self.interval)
+            if self._stopping:
+                break
+            try:
+                await self.refresh_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Profile refresher error: {e}")
+        logger.info("Profile refresher stopped")
+
+    def stop(self) -> None:
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "passes": self.passes,
+            "checked": self.checked,
+            "requested": len(self._requested),
+            "last_pass_ms": self.last_pass_ms,
+        }
+
+_refresher: Optional[ProfileRefresher] = None
+_refresher_task: Optional[asyncio.Task] = None
+
+def start_profile_refresher(session_factory: Callable[[], Session], clients: AIClients) -> ProfileRefresher:
+    """Start the refresher on the running event loop; called from the application lifespan"""
+    global _refresher, _refresher_task
+    _refresher = ProfileRefresher(session_factory, clients)
+    _refresher_task = asyncio.create_task(_refresher.run())
+    return _refresher
+
+async def stop_profile_refresher() -> None:
+    global _refresher, _refresher_task
+    if _refresher is not None:
+        _refresher.stop()
+        try:
+            # Lets a pass in progress finish, unless it runs long
+            await asyncio.wait_for(_refresher_task, 30)
+        except asyncio.TimeoutError:
+            _refresher_task.cancel()
+    _refresher, _refresher_task = None, None
+
+def get_profile_refresher() -> Optional[ProfileRefresher]:
+    return _refresher
+
+def request_profile_refresh(user_id: int) -> bool:
+    """Ask for a user's profile to be checked soon, without waiting for it"""
+    if _refresher is None:
+        return False
+    _refresher.request(user_id)
+    return True
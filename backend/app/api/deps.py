@@ -1,10 +1,13 @@
-from typing import Generator
-from fastapi import Depends, HTTPException, status
+from typing import Callable, Generator, Optional, Type
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from ..auth.auth0 import verify_auth0_token
 from ..models.user import User
+from ..services.fieldsets import Fieldset
+from ..ai.clients import AIClients, get_ai_clients  # noqa: F401 - dependency for the shared AI clients
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -18,6 +21,21 @@ def get_db() -> Generator:
     finally:
         db.close()
 
+def get_session_factory() -> Callable[[], Session]:
+    """Dependency for endpoints that open their own sessions, e.g. to run queries concurrently"""
+    return SessionLocal
+
+def get_fieldset(schema: Type[BaseModel]) -> Callable[..., Fieldset]:
+    """Dependency factory for the ``fields=`` sparse fieldset query parameter"""
+    def dependency(
+        fields: Optional[str] = Query(None, description="Comma-separated list of fields to return")
+    ) -> Fieldset:
+        try:
+            return Fieldset(schema, fields)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return dependency
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
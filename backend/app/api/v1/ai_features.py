@@ -1,32 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import List, Optional, Tuple
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
-from langchain_community.embeddings import OpenAIEmbeddings
-from ..deps import get_current_user, get_db
+from ..deps import get_current_user, get_db, get_session_factory, get_ai_clients, AIClients
 from app.models.user import User
 from app.models.message import Message
 from app.models.bot_message_score import BotMessageScore
 from sqlalchemy.orm import Session
+from typing import Callable
 from datetime import datetime, UTC
 import os
+import asyncio
+import itertools
+import uuid
 from dotenv import load_dotenv
 import atexit
 from langsmith import Client
 import logging
 from .websockets import manager
-import asyncio
 from sqlalchemy.orm import joinedload
-from ...ai.message_indexer import index_message
+from ...services.inverted_index import index_saved_message
 from ...models.reaction import Reaction as ReactionModel
-from ...ai.context_generator import (
-    generate_lain_context,
-    generate_user_bot_context,
-    get_bot_scored_messages,
-    generate_bot_prompt
-)
-from ...ai.profile_generator import check_and_update_profile
+from ...ai.context_generator import get_bot_scored_messages, generate_bot_prompt
+from ...ai.bot_pipeline import gather_bot_context, stream_reply
+from ...ai.context_packer import packing_stats
+from ...ai.message_indexer import get_index_worker, outbox_stats
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -34,6 +31,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Seconds between checks whether the client waiting for a bot reply is still connected
+BOT_DISCONNECT_POLL_SECONDS = 0.25
+
 # Load and validate environment variables
 load_dotenv()
 
@@ -84,18 +84,44 @@ class ScoredMessage(BaseModel):
 class BotScoredMessages(BaseModel):
     highest_scored: Optional[ScoredMessage]
     lowest_scored: Optional[ScoredMessage]
+    top_scored: List[ScoredMessage] = []  # Best first
+    bottom_scored: List[ScoredMessage] = []  # Worst first, without those in top_scored
     bot_username: str
 
+async def _cancel_on_disconnect(http_request: Request, task: asyncio.Future) -> bool:
+    """Cancel the task once the client of the request disconnects; returns whether it did"""
+    while not task.done():
+        if await http_request.is_disconnected():
+            task.cancel()
+            return True
+        await asyncio.sleep(BOT_DISCONNECT_POLL_SECONDS)
+    return False
+
 @router.post("/message", response_model=MessageResponse)
 async def send_message_to_bot(
     request: MessageRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+    ai_clients: AIClients = Depends(get_ai_clients)
 ):
-    logger.info(f"Received message: {request.message} for channel: {request.channel_id}")
+    """Answer a message as Lain, or as the bot of an offline user
+
+    Context is gathered by the bot pipeline, whose independent stages run
+    concurrently, so the reply waits for the slowest stage rather than all
+    of them in turn. The reply is streamed to the channel as
+    ``BOT_MESSAGE_DELTA`` frames while it is generated, then saved and
+    broadcast as a message carrying the same ``streamId``. If the client
+    disconnects first, generation stops and nothing is saved.
+    """
+    # Message, prompt and reply contents are users' data, logged at DEBUG only
+    logger.info(f"Received bot message of {len(request.message)} characters for channel: {request.channel_id}")
+    logger.debug(f"Received message: {request.message}")
     
     # If target_user is specified, create or get bot user for that user
     bot_user = None
+    target_user = None
     if request.target_user:
         target_username = request.target_user
         
@@ -140,9 +166,6 @@ async def send_message_to_bot(
                 db.add(bot_user)
                 db.commit()
                 db.refresh(bot_user)
-            
-            # Generate/update profile for offline user
-            await check_and_update_profile(db, target_user.id)
     else:
         # Default to Lain bot if no target user specified
         bot_user = db.query(User).filter(User.username == "lain").first()
@@ -158,97 +181,59 @@ async def send_message_to_bot(
             db.commit()
             db.refresh(bot_user)
 
-    # Initialize embeddings for different dimensions
-    embeddings_1536 = OpenAIEmbeddings(model="text-embedding-ada-002")  # 1536 dimensions
-    embeddings_3072 = OpenAIEmbeddings(model="text-embedding-3-large")  # 3072 dimensions
-    logger.info("Initialized embeddings")
-
-    # Set up Pinecone vector stores for both messages and files
-    messages_index = os.getenv("PINECONE_INDEX_TWO")  # 1536 dimensions
-    files_index = os.getenv("PINECONE_INDEX")  # 3072 dimensions
-
-    # Messages vectorstore (1536 dimensions)
-    messages_vectorstore = PineconeVectorStore(
-        index_name=messages_index,
-        embedding=embeddings_1536,
-        namespace="messages"
+    # Gather retrievals, conversation history, scored messages and profile concurrently
+    bot_context = await gather_bot_context(
+        ai_clients,
+        session_factory,
+        request.message,
+        current_user,
+        bot_user,
+        target_user
     )
-    messages_retriever = messages_vectorstore.as_retriever(
-        search_kwargs={
-            "k": 10,
-            "filter": {"is_bot": False}  # Only retrieve non-bot messages
-        }
-    )
-    
-    # Files vectorstore (3072 dimensions)
-    files_chunks_vectorstore = PineconeVectorStore(
-        index_name=files_index,
-        embedding=embeddings_3072,
-        namespace="chunks"
-    )
-    files_descriptions_vectorstore = PineconeVectorStore(
-        index_name=files_index,
-        embedding=embeddings_3072,
-        namespace="descriptions"
-    )
-    files_chunks_retriever = files_chunks_vectorstore.as_retriever(
-        search_kwargs={"k": 3}  # Retrieve top 3 most relevant file chunks
-    )
-    files_descriptions_retriever = files_descriptions_vectorstore.as_retriever(
-        search_kwargs={"k": 2}  # Retrieve top 2 most relevant file descriptions
-    )
-    
-    logger.info("Initialized Pinecone vector stores")
-
-    # Retrieve relevant documents from all namespaces
-    message_docs = messages_retriever.invoke(request.message)
-    file_chunks = files_chunks_retriever.invoke(request.message)
-    file_descriptions = files_descriptions_retriever.invoke(request.message)
-    
-    logger.info(f"Retrieved {len(message_docs)} message documents, {len(file_chunks)} file chunks, and {len(file_descriptions)} file descriptions")
-
-    # Filter out duplicate messages and sort by timestamp
-    seen_messages = set()
-    unique_messages = []
-    for doc in message_docs:
-        msg_id = doc.metadata.get('message_id')
-        if msg_id not in seen_messages:
-            seen_messages.add(msg_id)
-            unique_messages.append(doc)
-    
-    message_docs_sorted = sorted(
-        unique_messages,
-        key=lambda x: x.metadata.get('timestamp', ''),
-        reverse=True
-    )[:5]  # Keep only the 5 most recent unique messages
 
     # Generate prompt with context
-    prompt_with_context = await generate_bot_prompt(
-        db=db,
-        current_user=current_user,
+    prompt_with_context = generate_bot_prompt(
+        username=current_user.username,
         request_message=request.message,
-        target_user=None if request.target_user and request.target_user.lower() == "lain" else request.target_user,
-        message_docs_sorted=message_docs_sorted,
-        file_chunks=file_chunks,
-        file_descriptions=file_descriptions
+        target_user=target_user.username if target_user else None,
+        combined_context=bot_context.context
     )
-    logger.info(f"Final prompt length: {len(prompt_with_context)}")
-    logger.info(f"Generated prompt with context: {prompt_with_context}")
-
-    # Query the LLM with more explicit instructions about temperature
-    llm = ChatOpenAI(
-        temperature=0.5,  # Reduced temperature for more focused responses
-        model_name="gpt-4o-mini",
-        model_kwargs={
-            "response_format": { "type": "text" }
-        }
-    )
-    results = llm.invoke(prompt_with_context)
-    logger.info(f"LLM response: {results.content}")
+    logger.info(f"Final prompt length: {len(prompt_with_context)} characters, {sum(bot_context.tokens.values())} context tokens")
+    logger.debug(f"Generated prompt with context: {prompt_with_context}")
+
+    # Stream the reply of the shared bot LLM (temperature 0.5 for focused responses)
+    stream_id = uuid.uuid4().hex
+    sequence = itertools.count()
+
+    async def send_delta(delta: str) -> None:
+        await manager.broadcast_bot_delta(
+            channel_id=request.channel_id,
+            stream_id=stream_id,
+            bot_user_id=bot_user.id,
+            delta=delta,
+            sequence=next(sequence),
+            parent_id=request.parent_message_id
+        )
+
+    generation = asyncio.ensure_future(stream_reply(ai_clients.bot_llm, prompt_with_context, send_delta))
+    watcher = asyncio.ensure_future(_cancel_on_disconnect(http_request, generation))
+    try:
+        reply = await generation
+    except BaseException:
+        # Clients drop the partial reply; nothing was saved
+        await manager.broadcast_bot_cancelled(request.channel_id, stream_id)
+        if watcher.done() and not watcher.cancelled() and watcher.result():
+            logger.info(f"Client disconnected, stopped bot reply {stream_id}")
+            raise HTTPException(status_code=499, detail="Client closed request")
+        raise
+    finally:
+        watcher.cancel()
+    logger.info(f"LLM response of {len(reply)} characters for bot reply {stream_id}")
+    logger.debug(f"LLM response: {reply}")
 
     # Create bot message in database
     bot_message = Message(
-        content=results.content,
+        content=reply,
         channel_id=request.channel_id,
         sender_id=bot_user.id,
         created_at=datetime.now(UTC),
@@ -259,19 +244,20 @@ async def send_message_to_bot(
     db.commit()
     db.refresh(bot_message)
 
-    # Refresh to load relationships needed for indexing
+    # Refresh to load relationships needed for broadcasting
     bot_message = db.query(Message).options(
         joinedload(Message.sender),
         joinedload(Message.channel)
     ).filter(Message.id == bot_message.id).first()
 
-    # Index the bot message in Pinecone (non-blocking)
-    asyncio.create_task(index_message(bot_message))
+    # Pinecone indexing goes through the index outbox written with the message
+    index_saved_message(bot_message)
 
     # Broadcast the bot message through WebSocket
     await manager.broadcast_message(
         channel_id=request.channel_id,
-        message=bot_message
+        message=bot_message,
+        stream_id=stream_id
     )
 
     # Add thumbs up/down reactions from the bot
@@ -306,7 +292,7 @@ async def send_message_to_bot(
 
     # Return the bot's response
     return MessageResponse(
-        response=results.content,
+        response=reply,
         message_id=str(bot_message.id)
     ) 
 
@@ -339,9 +325,8 @@ async def get_lain_messages(
     # Query for Lain's messages where parent messages belong to the target user
     messages = db.query(Message).filter(
         Message.sender_id == lain_user.id,
-        Message.parent_id.in_(
-            db.query(Message.id).filter(Message.sender_id == target_user_id)
-        )
+        Message.parent_sender_id == target_user_id,
+        Message.is_bot == True
     ).order_by(Message.created_at.desc()).limit(limit).all()
     
     return messages 
@@ -361,7 +346,7 @@ async def get_bot_scored_messages_endpoint(
     if not bot_user:
         raise HTTPException(status_code=404, detail="Bot user not found")
 
-    highest_message, lowest_message = await get_bot_scored_messages(db, bot_user_id)
+    highest_messages, lowest_messages = await get_bot_scored_messages(db, bot_user_id)
 
     # Convert to response model
     def convert_to_scored_message(msg_dict: Optional[dict]) -> Optional[ScoredMessage]:
@@ -376,7 +361,34 @@ async def get_bot_scored_messages_endpoint(
         )
 
     return BotScoredMessages(
-        highest_scored=convert_to_scored_message(highest_message),
-        lowest_scored=convert_to_scored_message(lowest_message),
+        highest_scored=convert_to_scored_message(highest_messages[0] if highest_messages else None),
+        lowest_scored=convert_to_scored_message(lowest_messages[0] if lowest_messages else None),
+        top_scored=[convert_to_scored_message(msg) for msg in highest_messages],
+        bottom_scored=[convert_to_scored_message(msg) for msg in lowest_messages],
         bot_username=bot_user.username
-    ) 
\ No newline at end of file
+    )
+
+@router.get("/bot/context-stats")
+async def get_bot_context_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the average tokens packed into bot prompts per context section, how often
+    each section was cut short or left out, and the token count cache counters.
+    """
+    return packing_stats()
+
+@router.get("/index/stats")
+async def get_index_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the message index outbox backlog and lag, and the indexing worker's counters.
+    """
+    worker = get_index_worker()
+    return {
+        **outbox_stats(db),
+        "worker_running": worker is not None,
+        **(worker.stats() if worker else {})
+    }
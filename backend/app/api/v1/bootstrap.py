@@ -0,0 +1,127 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from typing import Callable, Dict, List
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from ...schemas.user import User as UserSchema, UserPresence
+from ...schemas.message import Message as MessageSchema
+from ...models.channel import Channel as ChannelModel
+from ...models.message import Message as MessageModel
+from ...models.user import User
+from ..deps import get_current_user, get_session_factory
+from ...services.channel_access import accessible_channel_ids
+from ...services.read_state import channels_with_read_state
+from ...services import message_queries
+from ...services.fieldsets import Fieldset
+from ...services.sections import load_section
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+def load_channels(db: Session, user_id: int, limit: int) -> List[dict]:
+    """Accessible channels with the user's read state"""
+    user = db.get(User, user_id)
+    channels = (
+        db.query(ChannelModel)
+        .filter(ChannelModel.id.in_(accessible_channel_ids(user_id)))
+        .order_by(ChannelModel.updated_at.desc())
+        .limit(limit)
+        .all()
+    )
+    return [channel.model_dump(mode="json") for channel in channels_with_read_state(db, user, channels)]
+
+def load_users(db: Session, user_id: int, limit: int) -> List[dict]:
+    """Active users visible to the caller"""
+    fieldset = Fieldset(UserSchema)
+    users = db.query(User).options(*fieldset.options(User)).filter(User.is_active == True).limit(limit).all()
+    return [fieldset.dump(u).model_dump(mode="json") for u in users]
+
+def load_presence(db: Session, user_id: int) -> List[dict]:
+    """Presence information for active users"""
+    rows = (
+        db.query(User.id, User.username, User.status, User.last_seen)
+        .filter(User.is_active == True)
+        .all()
+    )
+    return [
+        UserPresence(
+            id=row.id,
+            username=row.username or "",
+            status=row.status or "offline",
+            last_seen=row.last_seen or datetime.utcnow()
+        ).model_dump(mode="json")
+        for row in rows
+    ]
+
+def load_recent_messages(db: Session, user_id: int, channel_count: int, message_limit: int) -> Dict[str, List[dict]]:
+    """First message page for the channels with the most recent activity
+
+    Each channel's latest message is a max lookup on the (channel_id, id)
+    index, so picking the channels does not scan their messages.
+    """
+    latest = (
+        select(func.max(MessageModel.id))
+        .where(MessageModel.channel_id == ChannelModel.id)
+        .correlate(ChannelModel)
+        .scalar_subquery()
+    )
+    recent_channels = (
+        db.query(ChannelModel.id)
+        .filter(ChannelModel.id.in_(accessible_channel_ids(user_id)), latest.isnot(None))
+        .order_by(latest.desc())
+        .limit(channel_count)
+        .all()
+    )
+    return {
+        str(channel_id): [
+            MessageSchema.model_validate(message).model_dump(mode="json")
+            for message in message_queries.get_channel_messages_page(db, channel_id, limit=message_limit)
+        ]
+        for channel_id, in recent_channels
+    }
+
+@router.get("/")
+async def bootstrap(
+    channel_limit: int = 100,
+    user_limit: int = 50,
+    message_channels: int = 3,
+    message_limit: int = 50,
+    current_user: User = Depends(get_current_user),
+    session_factory: Callable[[], Session] = Depends(get_session_factory)
+):
+    """Get everything the client needs on startup in one streamed response
+
+    The response is NDJSON: one ``{"section": ..., "data": ...}`` object per
+    line. The ``user`` section comes first; the ``channels``, ``users``,
+    ``presence`` and ``messages`` sections are loaded concurrently on separate
+    sessions and each is sent as soon as it is ready.
+
+    Args:
+        channel_limit: Maximum number of channels to return
+        user_limit: Maximum number of users to return
+        message_channels: Number of most recently active channels to preload messages for
+        message_limit: Maximum number of messages per preloaded channel
+    """
+    user_section = {
+        "section": "user",
+        "data": UserSchema.model_validate(current_user, from_attributes=True).model_dump(mode="json")
+    }
+    sections = [
+        # Loaders get the ID; ORM objects stay with the request's session
+        load_section("channels", session_factory, load_channels, current_user.id, channel_limit),
+        load_section("users", session_factory, load_users, current_user.id, user_limit),
+        load_section("presence", session_factory, load_presence, current_user.id),
+        load_section("messages", session_factory, load_recent_messages, current_user.id, message_channels, message_limit),
+    ]
+
+    async def stream():
+        yield json.dumps(user_section) + "\n"
+        for next_section in asyncio.as_completed(sections):
+            yield json.dumps(await next_section) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
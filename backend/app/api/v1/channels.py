@@ -5,36 +5,49 @@ from typing import List, Optional
 import logging
 from datetime import datetime, UTC
 
-from ...schemas.channel import Channel, ChannelCreate, ChannelUpdate, ChannelMember
+from ...schemas.channel import (
+    Channel, ChannelCreate, ChannelUpdate, ChannelMember,
+    ChannelWithReadState, ChannelReadUpdate, ChannelReadState
+)
 from ...schemas.user import User as UserSchema
-from ...models.channel import Channel as ChannelModel
+from ...models.channel import Channel as ChannelModel, channel_members
 from ...models.user import User
-from ...models.message import Message as MessageModel
-from ...schemas.message import Message as MessageSchema
-from ..deps import get_db, get_current_user
+from ..deps import get_db, get_current_user, get_fieldset
+from ...services.channel_access import can_access_channel
+from ...services.read_state import mark_channel_read, get_channel_read_states
+from ...services.fieldsets import Fieldset
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.get("/", response_model=List[Channel])
+# Response fields computed from read state rather than channel columns
+READ_STATE_FIELDS = tuple(set(ChannelWithReadState.model_fields) - set(Channel.model_fields))
+
+@router.get("/", response_model=List[ChannelWithReadState])
 async def get_channels(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     since: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
-    show_public: bool = True
+    show_public: bool = True,
+    fieldset: Fieldset = Depends(get_fieldset(ChannelWithReadState))
 ):
-    """Get all channels the current user has access to
+    """Get all channels the current user has access to, with read state
     
+    Each channel carries the caller's unread and mention counts and a preview
+    of its latest message. Read state is only computed when one of its fields
+    is requested.
+
     Args:
         since: Optional timestamp (in milliseconds) to get channels updated after
         skip: Number of channels to skip (for pagination)
         limit: Maximum number of channels to return
         show_public: Whether to include public channels
+        fields: Optional comma-separated list of fields to return
     """
     try:
-        query = db.query(ChannelModel)
+        query = db.query(ChannelModel).options(*fieldset.options(ChannelModel))
         if show_public:
             # Get public channels OR channels where user is a member
             query = query.filter(
@@ -53,7 +66,12 @@ async def get_channels(
         
         channels = query.order_by(ChannelModel.updated_at.desc()).offset(skip).limit(limit).all()
         logger.info(f"Loaded {len(channels)} channels (since={since}, skip={skip}, limit={limit})")
-        return channels
+        read_states = {}
+        if fieldset.wants(*READ_STATE_FIELDS):
+            read_states = get_channel_read_states(db, current_user, [channel.id for channel in channels])
+        return fieldset.respond(
+            fieldset.dump(channel, **read_states.get(channel.id, {})) for channel in channels
+        )
     except SQLAlchemyError as e:
         logger.error(f"Database error while fetching channels: {e}")
         raise HTTPException(
@@ -132,7 +150,7 @@ async def get_channel(
         )
     
     # Check if user has access (public channel or member)
-    if not channel.is_public and current_user.id not in [member.id for member in channel.members]:
+    if not can_access_channel(db, channel, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not a member of this private channel"
@@ -314,10 +332,16 @@ async def remove_channel_member(
 @router.get("/{channel_id}/members", response_model=List[UserSchema])
 async def get_channel_members(
     channel_id: int,
+    fieldset: Fieldset = Depends(get_fieldset(UserSchema)),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get channel members"""
+    """Get channel members
+
+    Args:
+        channel_id: ID of the channel
+        fields: Optional comma-separated list of fields to return
+    """
     db_channel = db.query(ChannelModel).filter(ChannelModel.id == channel_id).first()
     if not db_channel:
         raise HTTPException(
@@ -325,69 +349,59 @@ async def get_channel_members(
             detail="Channel not found"
         )
     
-    # For public channels, automatically add the user as a member if they're not already
-    if db_channel.is_public and current_user.id not in [m.id for m in db_channel.members]:
-        try:
-            db_channel.members.append(current_user)
-            db.commit()
-            db.refresh(db_channel)
-            logger.info(f"Added user {current_user.id} to public channel {channel_id}")
-        except SQLAlchemyError as e:
-            logger.error(f"Database error while adding member to public channel: {e}")
-            db.rollback()
-            # Continue even if adding fails - they can still view members
-    
-    # Check if user is a member for private channels
-    elif not db_channel.is_public and current_user.id not in [m.id for m in db_channel.members]:
+    # Public channels are visible to everyone; private channels only to members
+    if not can_access_channel(db, db_channel, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not a member of this channel"
         )
     
-    return db_channel.members
+    members = (
+        db.query(User)
+        .options(*fieldset.options(User))
+        .join(channel_members, channel_members.c.user_id == User.id)
+        .filter(channel_members.c.channel_id == channel_id)
+        .all()
+    )
+    return fieldset.respond(fieldset.dump(member) for member in members)
 
-@router.get("/{channel_id}/messages", response_model=List[MessageSchema])
-async def get_channel_messages(
+@router.post("/{channel_id}/read", response_model=ChannelReadState)
+async def mark_channel_as_read(
     channel_id: int,
-    skip: int = 0,
-    limit: int = 100,
+    read_update: ChannelReadUpdate = ChannelReadUpdate(),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get channel messages"""
+    """Advance the current user's read marker for a channel
+    
+    Args:
+        read_update: Optional message ID to mark as read; defaults to the latest message
+    """
     db_channel = db.query(ChannelModel).filter(ChannelModel.id == channel_id).first()
     if not db_channel:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Channel not found"
         )
-    
-    # For public channels, automatically add the user as a member if they're not already
-    if db_channel.is_public and current_user.id not in [m.id for m in db_channel.members]:
-        try:
-            db_channel.members.append(current_user)
-            db.commit()
-            db.refresh(db_channel)
-            logger.info(f"Added user {current_user.id} to public channel {channel_id}")
-        except SQLAlchemyError as e:
-            logger.error(f"Database error while adding member to public channel: {e}")
-            db.rollback()
-            # Continue even if adding fails - they can still view messages
-    
-    # Check if user is a member for private channels
-    elif not db_channel.is_public and current_user.id not in [m.id for m in db_channel.members]:
+
+    if not can_access_channel(db, db_channel, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not a member of this channel"
         )
-    
-    messages = (
-        db.query(MessageModel)
-        .filter(MessageModel.channel_id == channel_id)
-        .order_by(MessageModel.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
-    
-    return messages 
\ No newline at end of file
+
+    try:
+        read = mark_channel_read(db, current_user.id, channel_id, read_update.message_id)
+        return read
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except SQLAlchemyError as e:
+        logger.error(f"Database error while marking channel read: {e}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Could not update read state"
+        )
@@ -8,14 +8,19 @@ import os
 from datetime import datetime
 import aiofiles
 import shutil
+import hashlib
+import uuid
 
-from ...schemas.file import File, FileCreate
+from ...schemas.file import File, FileCreate, FileStatus
 from ...models.file import File as FileModel
 from ...models.message import Message
 from ...models.channel import Channel
 from ..deps import get_db, get_current_user
+from ...services.channel_access import can_access_channel
 from ...models.user import User
-from ...ai.file_handler import process_file
+from ...ai.file_processor import can_process, enqueue_file, PENDING, COMPLETED, SKIPPED
+from ...ai.file_handler import delete_vectors
+from ...services.upload_store import store_upload, release_upload, collect_upload, reuse_processed_content
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -76,7 +81,12 @@ async def upload_file(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Upload a file"""
+    """Upload a file
+
+    Returns once the file is stored. Its description and searchable chunks
+    are produced by the background file processor; poll
+    ``/{file_id}/status`` or wait for the ``FILE_PROCESSED`` WebSocket event.
+    """
     try:
         # Log incoming file information
         logger.info(f"Attempting to upload file: {file.filename}")
@@ -145,13 +155,13 @@ async def upload_file(
             
             # Check if user has access to the channel
             channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-            if not channel or current_user.id not in [member.id for member in channel.members]:
+            if not channel or not can_access_channel(db, channel, current_user.id):
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="Not authorized to upload to this channel"
                 )
 
-        # Generate unique filename
+        # Generate display filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         extension = ALLOWED_TYPES[file.content_type]
         
@@ -160,10 +170,12 @@ async def upload_file(
         # Clean the filename
         safe_original_filename = "".join(c for c in original_name if c.isalnum() or c in "._-")
         filename = f"{timestamp}_{safe_original_filename}{extension}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
+        # Written under a temporary name, then stored by content hash
+        file_path = os.path.join(UPLOAD_DIR, f".upload-{uuid.uuid4().hex}")
 
-        # Save file and track size
+        # Save file, tracking size and hashing the content as it streams
         file_size = 0
+        hasher = hashlib.sha256()
         try:
             with open(file_path, "wb") as buffer:
                 while chunk := await file.read(8192):
@@ -176,50 +188,41 @@ async def upload_file(
                             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                             detail=f"File too large. Maximum size: {MAX_FILE_SIZE / (1024 * 1024)}MB"
                         )
+                    hasher.update(chunk)
                     buffer.write(chunk)
         except Exception as e:
             # Clean up on error
             if os.path.exists(file_path):
                 os.remove(file_path)
             raise e
+        content_hash = hasher.hexdigest()
 
-        # Create database entry
-        db_file = FileModel(
-            filename=filename,
-            file_type=file.content_type,
-            file_size=file_size,
-            file_path=f"/uploads/{filename}",
-            message_id=message_id,  # Can be None
-            uploaded_by_id=current_user.id
-        )
-        
         try:
+            # Identical content is stored once, shared by reference
+            blob = store_upload(db, file_path, UPLOAD_DIR, content_hash, extension, file_size)
+
+            # Create database entry
+            db_file = FileModel(
+                filename=filename,
+                file_type=file.content_type,
+                file_size=file_size,
+                file_path=f"/uploads/{blob.storage_path}",
+                content_hash=content_hash,
+                message_id=message_id,  # Can be None
+                uploaded_by_id=current_user.id
+            )
             db.add(db_file)
             db.flush()  # Get the ID without committing
             
-            # Generate file description if applicable
-            if file.content_type.startswith(('text/', 'image/')) or file.content_type == 'application/pdf':
-                logger.info(f"Starting file description generation for {filename}")
-                try:
-                    description = await process_file(
-                        file_path=file_path,
-                        file_type=file.content_type,
-                        file_id=db_file.id,
-                        filename=filename,
-                        uploaded_by=current_user.username,
-                        message=None,
-                        created_at=db_file.created_at
-                    )
-                    if description:
-                        logger.info(f"Successfully generated description for {filename}")
-                        db_file.description = description[0] if isinstance(description, tuple) else description
-                    else:
-                        logger.warning(f"No description generated for {filename}")
-                except Exception as e:
-                    logger.error(f"Error generating file description for {filename}: {str(e)}", exc_info=True)
-                    # Continue without description if there's an error
-            else:
+            # Description generation and embedding run after the response,
+            # unless the same content was processed before
+            if not can_process(file.content_type):
                 logger.info(f"Skipping file description generation for unsupported type: {file.content_type}")
+                db_file.processing_status = SKIPPED
+            elif reuse_processed_content(db, db_file):
+                db_file.processing_status = COMPLETED
+            else:
+                db_file.processing_status = PENDING
             
             # Update message has_attachments if message_id is provided
             if message_id:
@@ -229,6 +232,8 @@ async def upload_file(
             
             db.commit()
             db.refresh(db_file)
+            if db_file.processing_status == PENDING:
+                enqueue_file(db_file.id)
             
             # Convert to response model
             return File(
@@ -240,11 +245,13 @@ async def upload_file(
                 description=db_file.description,  # Include description in response
                 message_id=db_file.message_id,
                 uploaded_by_id=db_file.uploaded_by_id,
+                processing_status=db_file.processing_status,
                 created_at=db_file.created_at,
                 updated_at=db_file.updated_at
             )
         except SQLAlchemyError as e:
-            # Clean up file if database operation fails
+            # The stored copy stays for the other files sharing it; an
+            # unreferenced one is replaced by the next identical upload
             if os.path.exists(file_path):
                 os.remove(file_path)
             db.rollback()
@@ -266,6 +273,46 @@ async def upload_file(
             detail=str(e)
         )
 
+@router.get("/{file_id}/status", response_model=FileStatus)
+async def get_file_status(
+    file_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the processing status of a file, with its description once processed"""
+    try:
+        file = db.query(FileModel).filter(FileModel.id == file_id).first()
+        if not file:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="File not found"
+            )
+
+        # Same access rules as downloading the file
+        if file.message_id:
+            message = db.query(Message).filter(Message.id == file.message_id).first()
+            if message:
+                channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
+                if not channel or not can_access_channel(db, channel, current_user.id):
+                    raise HTTPException(
+                        status_code=status.HTTP_403_FORBIDDEN,
+                        detail="Not authorized to access this file"
+                    )
+        elif file.uploaded_by_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to access this file"
+            )
+
+        return file
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error while fetching file status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Could not fetch file status"
+        )
+
 @router.get("/{file_id}", response_model=File)
 async def get_file(
     file_id: int,
@@ -285,7 +332,7 @@ async def get_file(
         message = db.query(Message).filter(Message.id == file.message_id).first()
         channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
         
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to access this file"
@@ -327,13 +374,12 @@ async def delete_file(
                 detail="Not authorized to delete this file"
             )
 
-        # Delete physical file
+        # Delete database entry; stored content goes with its last file
+        content_hash = file.content_hash
         file_path = os.path.join(UPLOAD_DIR, os.path.basename(file.file_path))
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-        # Delete database entry
         db.delete(file)
+        if content_hash:
+            release_upload(db, content_hash)
         
         # Update message has_attachments if this was the last file
         if file.message_id:
@@ -347,6 +393,14 @@ async def delete_file(
         
         db.commit()
 
+        # Delete physical file and vectors once no file references them
+        if content_hash:
+            released = collect_upload(db, content_hash, UPLOAD_DIR)
+            if released:
+                await delete_vectors(released.vector_ids)
+        elif os.path.exists(file_path):
+            os.remove(file_path)
+
     except HTTPException:
         raise
     except SQLAlchemyError as e:
@@ -381,7 +435,7 @@ async def get_channel_files(
                 detail="Channel not found"
             )
 
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to access this channel"
@@ -472,7 +526,7 @@ async def get_message_files(
 
         # Check if user has access to the channel
         channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-        if not channel or current_user.id not in [member.id for member in channel.members]:
+        if not channel or not can_access_channel(db, channel, current_user.id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to access these files"
@@ -510,7 +564,7 @@ async def download_file(
             message = db.query(Message).filter(Message.id == file.message_id).first()
             if message:
                 channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-                if not channel or current_user.id not in [member.id for member in channel.members]:
+                if not channel or not can_access_channel(db, channel, current_user.id):
                     raise HTTPException(
                         status_code=status.HTTP_403_FORBIDDEN,
                         detail="Not authorized to access this file"
@@ -1,20 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List, Optional
 import logging
 from datetime import datetime
 import asyncio
-from fastapi import BackgroundTasks
 
 from ...schemas.message import Message, MessageCreate, MessageUpdate, MessageReply
 from ...models.message import Message as MessageModel
 from ...models.channel import Channel
 from ...models.file import File as FileModel
-from ..deps import get_db, get_current_user
+from ..deps import get_db, get_current_user, get_fieldset
 from ...models.user import User
 from .websockets import manager
-from ...ai.message_indexer import index_message
+from ...services import message_queries
+from ...services.channel_access import can_access_channel, materialize_membership
+from ...services.fieldsets import Fieldset, heavy_column_options
+from ...services.inverted_index import index_saved_message, unindex_message
 
 router = APIRouter()
 channel_router = APIRouter()
@@ -26,16 +28,21 @@ async def get_channel_messages(
     since: Optional[int] = None,
     skip: int = 0,
     limit: int = 50,
+    fieldset: Fieldset = Depends(get_fieldset(Message)),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get messages from channel
+    """Get messages from channel, newest first
     
+    Reactions and files are only loaded when part of the response. File
+    descriptions are not included.
+
     Args:
         channel_id: ID of the channel
         since: Optional timestamp (in milliseconds) to get messages after
         skip: Number of messages to skip (for pagination)
         limit: Maximum number of messages to return
+        fields: Optional comma-separated list of fields to return
     """
     try:
         # Check channel exists and user has access
@@ -43,45 +50,19 @@ async def get_channel_messages(
         if not channel:
             raise HTTPException(status_code=404, detail="Channel not found")
         
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(status_code=403, detail="Not authorized to view this channel")
 
-        # Build base query
-        query = (
-            db.query(MessageModel)
-            .filter(MessageModel.channel_id == channel_id)
-            .filter(MessageModel.parent_id.is_(None))  # Only get top-level messages
-            .filter(MessageModel.sender_id.isnot(None))  # Filter out messages with null sender_id
-            .options(
-                joinedload(MessageModel.reactions),
-                joinedload(MessageModel.sender),
-                joinedload(MessageModel.files)
-            )
-        )
-
-        # Add since filter if provided
-        if since is not None:
-            since_datetime = datetime.fromtimestamp(since / 1000.0)  # Convert milliseconds to datetime
-            query = query.filter(MessageModel.created_at > since_datetime)
-            logger.debug(f"Filtering messages after {since_datetime}")
-
-        # Get total count for this query
-        total_count = query.count()
-
-        # Add ordering and pagination
-        messages = (
-            query
-            .order_by(MessageModel.created_at.desc())  # Most recent first
-            .offset(skip)
-            .limit(limit)
-            .all()
+        options = fieldset.options(MessageModel, {
+            "reactions": selectinload(MessageModel.reactions),
+            "files": selectinload(MessageModel.files).options(*heavy_column_options(FileModel)),
+        })
+        messages = message_queries.get_channel_messages_page(
+            db, channel_id, skip=skip, limit=limit, since=since, options=options
         )
 
-        # Log loaded messages
-        logger.info(f"Loaded {len(messages)} messages from channel {channel_id} (since={since}, skip={skip}, limit={limit}, total={total_count})")
-        
-        # Return messages in chronological order (oldest first)
-        return list(reversed(messages))
+        logger.info(f"Loaded {len(messages)} messages from channel {channel_id} (since={since}, skip={skip}, limit={limit})")
+        return fieldset.respond(fieldset.dump(message) for message in messages)
 
     except SQLAlchemyError as e:
         logger.error(f"Database error in get_channel_messages: {e}")
@@ -91,7 +72,6 @@ async def get_channel_messages(
 async def create_message(
     channel_id: int,
     message: MessageCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -110,22 +90,12 @@ async def create_message(
         if not channel:
             raise HTTPException(status_code=404, detail="Channel not found")
         
-        # For public channels, automatically add the user as a member if they're not already
-        if channel.is_public and current_user.id not in [m.id for m in channel.members]:
-            try:
-                channel.members.append(current_user)
-                db.commit()
-                db.refresh(channel)
-                logger.info(f"Added user {current_user.id} to public channel {channel_id}")
-            except SQLAlchemyError as e:
-                logger.error(f"Database error while adding member to public channel: {e}")
-                db.rollback()
-                # Continue even if adding fails - they can still post in public channels
-        
-        # For private channels, check if user is a member
-        elif not channel.is_public and current_user.id not in [m.id for m in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(status_code=403, detail="Not a member of this channel")
 
+        # Posting to a public channel makes the user an explicit member
+        materialize_membership(db, channel, current_user)
+
         # Create message
         db_message = MessageModel(
             content=content,  # Use potentially modified content
@@ -146,18 +116,13 @@ async def create_message(
             db.commit()
         
         # Refresh to load relationships
-        db_message = db.query(MessageModel).options(
-            joinedload(MessageModel.sender),
-            joinedload(MessageModel.files),
-            joinedload(MessageModel.channel)
-        ).filter(MessageModel.id == db_message.id).first()
+        db_message = message_queries.get_message_with_relations(db, db_message.id)
+
+        index_saved_message(db_message)
 
         # Broadcast the new message via WebSocket
         await manager.broadcast_message(channel_id, db_message)
 
-        # Start indexing in background without awaiting
-        background_tasks.add_task(index_message, db_message)
-
         return db_message
 
     except SQLAlchemyError as e:
@@ -191,6 +156,7 @@ async def update_message(
             raise HTTPException(status_code=403, detail="Not authorized to update this message")
 
         # Update message
+        old_content = db_message.content
         db_message.content = content  # Use potentially modified content
         db_message.updated_at = datetime.utcnow()
         
@@ -203,6 +169,7 @@ async def update_message(
         
         db.commit()
         db.refresh(db_message)
+        index_saved_message(db_message, old_content)
 
         # Broadcast the message update via WebSocket
         await manager.broadcast_message_update(
@@ -241,6 +208,7 @@ async def delete_message(
 
         db.delete(db_message)
         db.commit()
+        unindex_message(message_id)
 
     except SQLAlchemyError as e:
         logger.error(f"Database error in delete_message: {e}")
@@ -261,20 +229,10 @@ async def get_message_replies(
             raise HTTPException(status_code=404, detail="Message not found")
 
         channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(status_code=403, detail="Not authorized to view this message")
 
-        replies = (
-            db.query(MessageModel)
-            .filter(MessageModel.parent_id == message_id)
-            .options(
-                joinedload(MessageModel.reactions),
-                joinedload(MessageModel.sender),
-                joinedload(MessageModel.files)
-            )
-            .order_by(MessageModel.created_at)
-            .all()
-        )
+        replies = message_queries.get_message_replies(db, message_id)
         return replies
 
     except SQLAlchemyError as e:
@@ -285,7 +243,6 @@ async def get_message_replies(
 async def create_message_reply(
     message_id: int,
     reply: MessageReply,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -305,9 +262,12 @@ async def create_message_reply(
             raise HTTPException(status_code=404, detail="Parent message not found")
 
         channel = db.query(Channel).filter(Channel.id == parent_message.channel_id).first()
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(status_code=403, detail="Not authorized to reply to this message")
 
+        # Posting to a public channel makes the user an explicit member
+        materialize_membership(db, channel, current_user)
+
         # Create reply
         db_reply = MessageModel(
             content=content,  # Use potentially modified content
@@ -328,18 +288,13 @@ async def create_message_reply(
             db.commit()
         
         # Refresh to load relationships
-        db_reply = db.query(MessageModel).options(
-            joinedload(MessageModel.sender),
-            joinedload(MessageModel.files),
-            joinedload(MessageModel.channel)
-        ).filter(MessageModel.id == db_reply.id).first()
+        db_reply = message_queries.get_message_with_relations(db, db_reply.id)
+
+        index_saved_message(db_reply)
 
         # Broadcast the new reply via WebSocket
         await manager.broadcast_message(parent_message.channel_id, db_reply)
 
-        # Start indexing in background without awaiting
-        background_tasks.add_task(index_message, db_reply)
-
         return db_reply
 
     except SQLAlchemyError as e:
@@ -362,16 +317,11 @@ async def get_message_thread(
 
         # Check access
         channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(status_code=403, detail="Not authorized to view this thread")
 
         # Get thread messages
-        thread = [message] + (
-            db.query(MessageModel)
-            .filter(MessageModel.parent_id == message_id)
-            .order_by(MessageModel.created_at)
-            .all()
-        )
+        thread = [message] + message_queries.get_message_replies(db, message_id)
         return thread
 
     except SQLAlchemyError as e:
@@ -392,7 +342,7 @@ async def get_message(
             raise HTTPException(status_code=404, detail="Message not found")
 
         channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(status_code=403, detail="Not authorized to view this message")
 
         return message
@@ -415,7 +365,7 @@ async def get_message_position(
             raise HTTPException(status_code=404, detail="Message not found")
 
         channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(status_code=403, detail="Not authorized to view this message")
 
         # Count messages before this one in the same channel
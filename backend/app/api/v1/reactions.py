@@ -11,6 +11,8 @@ from ...models.message import Message
 from ...models.channel import Channel
 from ...models.bot_message_score import BotMessageScore
 from ..deps import get_db, get_current_user
+from ...services.channel_access import can_access_channel
+from ...services.bot_scores import bot_score_cache
 from ...models.user import User
 from .websockets import manager
 
@@ -50,6 +52,7 @@ async def update_bot_message_score(db: Session, message_id: int):
             db.add(bot_score)
         
         db.commit()
+        bot_score_cache.record(db, message.sender_id, message_id, score)
         logger.debug(f"Updated bot message score for message {message_id}: {score}")
         
     except SQLAlchemyError as e:
@@ -90,7 +93,7 @@ async def add_reaction(
 
         # Check channel access
         channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             logger.debug(f"User {current_user.id} not authorized to access channel {channel.id}")
             raise HTTPException(status_code=403, detail="Not authorized to react to this message")
 
@@ -215,7 +218,7 @@ async def remove_reaction_by_emoji(
 
         # Check channel access
         channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             logger.debug(f"User {current_user.id} not authorized to access channel {channel.id}")
             raise HTTPException(status_code=403, detail="Not authorized to react to this message")
 
@@ -290,7 +293,7 @@ async def get_reactions(
             raise HTTPException(status_code=404, detail="Channel not found")
             
         # Check if user is a member of the channel
-        if current_user.id not in [member.id for member in channel.members]:
+        if not can_access_channel(db, channel, current_user.id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to view reactions in this channel"
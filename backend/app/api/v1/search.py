@@ -1,20 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import or_, func, and_
-from typing import List
+from typing import Callable, List, Optional
+from functools import partial
+import asyncio
 import logging
+import time
 
 from ...schemas.search import (
     SearchParams,
     MessageSearchResult,
     FileSearchResult,
-    ChannelSearchResult
+    ChannelSearchResult,
+    SearchResponse,
+    SuggestResponse
 )
 from ...models.message import Message
 from ...models.file import File
-from ...models.channel import Channel, channel_members
-from ..deps import get_db, get_current_user
+from ...models.channel import Channel
+from ..deps import get_db, get_current_user, get_fieldset, get_session_factory
+from ...services.channel_access import load_accessible_channel_ids
+from ...services.fieldsets import Fieldset
+from ...services.fulltext import get_message_search_backend
+from ...services.trigram import get_trigram_backend
+from ...services.semantic import hybrid_search, reciprocal_rank_fusion
+from ...services.file_content import search_file_contents
+from ...services.sections import load_section, run_in_session
+from ...services.suggest import get_completion_index
+from ...services.search_cache import (
+    search_cache,
+    normalize_query,
+    channel_set_key,
+    channel_tag,
+    FILES_TAG,
+    CHANNELS_TAG
+)
 from ...models.user import User
 
 # Create router with explicit tags
@@ -23,61 +43,227 @@ router = APIRouter(
 )
 logger = logging.getLogger(__name__)
 
+def _cached(kind: str, query: str, channel_ids: List[int], fieldset: Fieldset, skip: int, limit: int, tags, compute) -> list:
+    """Serve a result page from the search cache, computing it on a miss
+
+    Entries are keyed by the normalized query and the caller's channel set,
+    so users with the same access share them.
+    """
+    key = (
+        kind,
+        normalize_query(query),
+        channel_set_key(channel_ids),
+        tuple(fieldset.requested or ()),
+        skip,
+        limit
+    )
+    return search_cache.get_or_compute(key, tags, compute)
+
+def find_messages(
+    db: Session,
+    query: str,
+    channel_ids: List[int],
+    fieldset: Fieldset,
+    skip: int = 0,
+    limit: int = 20,
+    mode: str = "lexical",
+    session_factory: Optional[Callable[[], Session]] = None
+) -> list:
+    """Ranked message search results in the given channels
+
+    ``mode="hybrid"`` fuses lexical and semantic retrieval, which run
+    concurrently on sessions from ``session_factory``.
+    """
+    def compute():
+        if mode == "hybrid":
+            hits = hybrid_search(
+                db,
+                session_factory,
+                query,
+                channel_ids,
+                skip=skip,
+                limit=limit,
+                options=fieldset.options(Message)
+            )
+        else:
+            hits = get_message_search_backend(db).search(
+                db,
+                query,
+                channel_ids,
+                skip=skip,
+                limit=limit,
+                options=fieldset.options(Message)
+            )
+        return [
+            fieldset.dump(hit.message, channel_name=hit.channel_name, rank=hit.rank, snippet=hit.snippet)
+            for hit in hits
+        ]
+    tags = [channel_tag(channel_id) for channel_id in channel_ids]
+    return _cached(f"messages:{mode}", query, channel_ids, fieldset, skip, limit, tags, compute)
+
+def find_files(db: Session, query: str, channel_ids: List[int], fieldset: Fieldset, skip: int = 0, limit: int = 20) -> list:
+    """File search results in the given channels
+
+    Name matches (trigram similarity) and document content matches
+    (full-text index on the extracted text) are fused by reciprocal rank.
+    """
+    def compute():
+        options = fieldset.options(File)
+        name_hits = get_trigram_backend(db).search_files(db, query, channel_ids, limit=skip + limit, options=options)
+        content_hits = search_file_contents(db, query, channel_ids, limit=skip + limit, options=options)
+
+        files = {hit.file.id: hit for hit in content_hits}
+        files.update({hit.file.id: hit for hit in name_hits})
+        scores = {hit.file.id: hit.score for hit in name_hits}
+        snippets = {hit.file.id: hit.snippet for hit in content_hits}
+        fused = reciprocal_rank_fusion([
+            [hit.file.id for hit in name_hits],
+            [hit.file.id for hit in content_hits]
+        ])
+        return [
+            fieldset.dump(
+                files[file_id].file,
+                channel_id=files[file_id].channel_id,
+                channel_name=files[file_id].channel_name,
+                score=scores.get(file_id),
+                snippet=snippets.get(file_id)
+            )
+            for file_id, _ in fused[skip:skip + limit]
+        ]
+    tags = [FILES_TAG] + [channel_tag(channel_id) for channel_id in channel_ids]
+    return _cached("files", query, channel_ids, fieldset, skip, limit, tags, compute)
+
+def find_channels(db: Session, query: str, channel_ids: List[int], fieldset: Fieldset, skip: int = 0, limit: int = 20) -> list:
+    """Trigram channel search results among the given channels"""
+    def compute():
+        hits = get_trigram_backend(db).search_channels(
+            db,
+            query,
+            channel_ids,
+            skip=skip,
+            limit=limit,
+            options=fieldset.options(Channel)
+        )
+        return [fieldset.dump(hit.channel, member_count=hit.member_count, score=hit.score) for hit in hits]
+    return _cached("channels", query, channel_ids, fieldset, skip, limit, [CHANNELS_TAG], compute)
+
+# "lexical" uses the full-text backend alone, "hybrid" adds semantic retrieval
+SEARCH_MODES = ("lexical", "hybrid")
+
+def _check_mode(mode: str) -> None:
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown search mode: {mode}")
+
+# Search types of the combined endpoint: finder and result schema
+SEARCH_TYPES = {
+    "messages": (find_messages, MessageSearchResult),
+    "files": (find_files, FileSearchResult),
+    "channels": (find_channels, ChannelSearchResult),
+}
+
+@router.get("/", response_model=SearchResponse)
+async def search(
+    q: str,
+    types: Optional[str] = None,
+    mode: str = "lexical",
+    message_limit: int = 20,
+    file_limit: int = 20,
+    channel_limit: int = 20,
+    current_user: User = Depends(get_current_user),
+    session_factory: Callable[[], Session] = Depends(get_session_factory)
+):
+    """Search messages, files and channels in one request
+
+    The caller's accessible channels are resolved once, then each requested
+    type is searched concurrently on its own session, so the response takes
+    as long as the slowest section. A failing section is reported in
+    ``errors`` without failing the others.
+
+    Args:
+        q: Search string
+        types: Comma-separated types to search (default: all of messages, files, channels)
+        mode: Message search mode, "lexical" or "hybrid"
+        message_limit: Maximum number of messages to return
+        file_limit: Maximum number of files to return
+        channel_limit: Maximum number of channels to return
+    """
+    _check_mode(mode)
+    requested = list(SEARCH_TYPES)
+    if types:
+        requested = list(dict.fromkeys(t.strip() for t in types.split(",") if t.strip()))
+        unknown = [t for t in requested if t not in SEARCH_TYPES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown search types: {', '.join(unknown)}")
+
+    if not q.strip():
+        return SearchResponse(**{name: [] for name in requested})
+
+    started = time.perf_counter()
+    try:
+        channel_ids = await asyncio.to_thread(run_in_session, session_factory, load_accessible_channel_ids, current_user.id)
+    except SQLAlchemyError as e:
+        logger.error(f"Database error in search: {e}")
+        raise HTTPException(status_code=500, detail="Search operation failed")
+
+    limits = {"messages": message_limit, "files": file_limit, "channels": channel_limit}
+    finders = {name: finder for name, (finder, _) in SEARCH_TYPES.items()}
+    finders["messages"] = partial(find_messages, mode=mode, session_factory=session_factory)
+    sections = await asyncio.gather(*(
+        load_section(
+            name,
+            session_factory,
+            finders[name],
+            q,
+            channel_ids,
+            Fieldset(SEARCH_TYPES[name][1]),
+            0,
+            limits[name]
+        )
+        for name in requested
+    ))
+
+    response = SearchResponse()
+    for section in sections:
+        name = section["section"]
+        response.timings[name] = section["elapsed_ms"]
+        if "error" in section:
+            response.errors[name] = section["error"]
+        setattr(response, name, section.get("data", []))
+    response.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    return response
+
 @router.get("/messages", response_model=List[MessageSearchResult])
 async def search_messages(
     query: str,
     skip: int = 0,
     limit: int = 20,
+    mode: str = "lexical",
+    fieldset: Fieldset = Depends(get_fieldset(MessageSearchResult)),
     db: Session = Depends(get_db),
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
     current_user: User = Depends(get_current_user)
 ):
-    """Search messages across all channels the user has access to"""
+    """Search messages across all channels the user has access to
+
+    Results are ranked by relevance and carry a highlighted snippet. The query
+    supports "exact phrases", prefix* matches and AND / OR / NOT (or -word).
+    With ``mode=hybrid`` the lexical results are fused with semantically
+    similar messages, and ``rank`` is the fused score.
+    """
+    _check_mode(mode)
     try:
         # Return empty list for empty query
         if not query.strip():
             return []
 
-        # Get all channels the user is a member of
-        user_channels = (
-            db.query(Channel.id)
-            .join(channel_members)
-            .filter(channel_members.c.user_id == current_user.id)
-            .subquery()
-        )
+        # Get all channels the user can access (public or member)
+        user_channels = load_accessible_channel_ids(db, current_user.id)
 
-        # Search messages in those channels
-        messages = (
-            db.query(
-                Message,
-                Channel.name.label('channel_name')
-            )
-            .join(Channel)
-            .filter(
-                and_(
-                    Message.channel_id.in_(user_channels),
-                    Message.content.ilike(f"%{query}%")
-                )
-            )
-            .order_by(Message.created_at.desc())
-            .offset(skip)
-            .limit(limit)
-            .all()
+        # Hybrid search waits on its two retrievals, so it runs off the event loop
+        results = await asyncio.to_thread(
+            find_messages, db, query, user_channels, fieldset, skip, limit, mode, session_factory
         )
-
-        # Convert to response model
-        results = [
-            MessageSearchResult(
-                id=msg.Message.id,
-                content=msg.Message.content,
-                created_at=msg.Message.created_at,
-                sender_id=msg.Message.sender_id,
-                channel_id=msg.Message.channel_id,
-                channel_name=msg.channel_name
-            )
-            for msg in messages
-        ]
-
-        return results
+        return fieldset.respond(results)
 
     except SQLAlchemyError as e:
         logger.error(f"Database error in search_messages: {e}")
@@ -88,62 +274,25 @@ async def search_files(
     query: str,
     skip: int = 0,
     limit: int = 20,
+    fieldset: Fieldset = Depends(get_fieldset(FileSearchResult)),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Search files across all channels the user has access to"""
+    """Search files across all channels the user has access to
+
+    Matches file names and types by trigram similarity, so small typos
+    still match, and the text extracted from documents by full-text search.
+    Content matches carry the best-matching passage as ``snippet``.
+    """
     try:
         # Return empty list for empty query
         if not query.strip():
             return []
 
-        # Get all channels the user is a member of
-        user_channels = (
-            db.query(Channel.id)
-            .join(channel_members)
-            .filter(channel_members.c.user_id == current_user.id)
-            .subquery()
-        )
+        # Get all channels the user can access (public or member)
+        user_channels = load_accessible_channel_ids(db, current_user.id)
 
-        # Search files in those channels
-        files = (
-            db.query(
-                File,
-                Channel.name.label('channel_name')
-            )
-            .select_from(File)
-            .join(Message, File.message_id == Message.id)
-            .join(Channel, Message.channel_id == Channel.id)
-            .filter(
-                and_(
-                    Message.channel_id.in_(user_channels),
-                    or_(
-                        File.filename.ilike(f"%{query}%"),
-                        File.file_type.ilike(f"%{query}%")
-                    )
-                )
-            )
-            .order_by(File.created_at.desc())
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
-
-        # Convert to response model
-        results = [
-            FileSearchResult(
-                id=file.File.id,
-                filename=file.File.filename,
-                file_type=file.File.file_type,
-                file_path=file.File.file_path,
-                created_at=file.File.created_at,
-                channel_id=file.File.message.channel_id,
-                channel_name=file.channel_name
-            )
-            for file in files
-        ]
-
-        return results
+        return fieldset.respond(find_files(db, query, user_channels, fieldset, skip, limit))
 
     except SQLAlchemyError as e:
         logger.error(f"Database error in search_files: {e}")
@@ -154,52 +303,58 @@ async def search_channels(
     query: str,
     skip: int = 0,
     limit: int = 20,
+    fieldset: Fieldset = Depends(get_fieldset(ChannelSearchResult)),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Search channels the user has access to"""
+    """Search channels the user has access to
+
+    Matches channel names and descriptions by trigram similarity, so small
+    typos still match. Results are ranked by similarity.
+    """
     try:
         # Return empty list for empty query
         if not query.strip():
             return []
 
-        # Search channels
-        channels = (
-            db.query(
-                Channel,
-                func.count(channel_members.c.user_id).label('member_count')
-            )
-            .join(channel_members)
-            .filter(
-                and_(
-                    channel_members.c.user_id == current_user.id,
-                    or_(
-                        Channel.name.ilike(f"%{query}%"),
-                        Channel.description.ilike(f"%{query}%")
-                    )
-                )
-            )
-            .group_by(Channel.id)
-            .order_by(Channel.name)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
-
-        # Convert to response model
-        results = [
-            ChannelSearchResult(
-                id=channel.Channel.id,
-                name=channel.Channel.name,
-                description=channel.Channel.description,
-                is_direct_message=channel.Channel.is_direct_message,
-                member_count=channel.member_count
-            )
-            for channel in channels
-        ]
+        user_channels = load_accessible_channel_ids(db, current_user.id)
 
-        return results
+        return fieldset.respond(find_channels(db, query, user_channels, fieldset, skip, limit))
 
     except SQLAlchemyError as e:
         logger.error(f"Database error in search_channels: {e}")
-        raise HTTPException(status_code=500, detail="Search operation failed") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Search operation failed") 
+
+@router.get("/suggest", response_model=SuggestResponse)
+async def suggest(
+    q: str,
+    limit: int = 5,
+    db: Session = Depends(get_db),
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+    current_user: User = Depends(get_current_user)
+):
+    """Complete a search prefix while the user types
+
+    Answered from an in-memory completion index of usernames, channel names,
+    filenames and frequent message words, so no search query hits the
+    database. Channels, files and words are limited to channels the user
+    can access.
+
+    Args:
+        q: Prefix typed so far
+        limit: Maximum number of completions per section
+    """
+    if limit < 1 or limit > 20:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 20")
+    try:
+        # The first request builds the index, which scans recent messages
+        index = await asyncio.to_thread(get_completion_index, db, session_factory)
+    except SQLAlchemyError as e:
+        logger.error(f"Database error building completion index: {e}")
+        raise HTTPException(status_code=500, detail="Search operation failed")
+    return index.suggest(current_user.id, q, limit)
+
+@router.get("/cache")
+async def get_search_cache_stats(current_user: User = Depends(get_current_user)):
+    """Get search cache size and hit/miss counters"""
+    return search_cache.stats()
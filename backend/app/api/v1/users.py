@@ -13,7 +13,8 @@ from ...schemas.user import (
     UserCreate
 )
 from ...models.user import User as UserModel
-from ..deps import get_db, get_current_user
+from ..deps import get_db, get_current_user, get_fieldset
+from ...services.fieldsets import Fieldset
 from ...auth.auth0 import verify_auth0_token, security
 from ...ai.profile_generator import generate_user_profile
 
@@ -182,19 +183,30 @@ async def update_current_user_info(
 async def get_users(
     skip: int = 0,
     limit: int = 50,
+    fieldset: Fieldset = Depends(get_fieldset(User)),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
-    """Get list of users"""
+    """Get list of users
+
+    The generated profile ``description`` is only returned when requested
+    with ``fields=``.
+
+    Args:
+        skip: Number of users to skip (for pagination)
+        limit: Maximum number of users to return
+        fields: Optional comma-separated list of fields to return
+    """
     try:
         users = (
             db.query(UserModel)
+            .options(*fieldset.options(UserModel))
             .filter(UserModel.is_active == True)
             .offset(skip)
             .limit(limit)
             .all()
         )
-        return users
+        return fieldset.respond(fieldset.dump(user) for user in users)
 
     except SQLAlchemyError as e:
         logger.error(f"Database error in get_users: {e}")
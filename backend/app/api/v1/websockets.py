@@ -1,5 +1,6 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
 from typing import Dict, Set, Optional
 import json
 import logging
@@ -14,6 +15,8 @@ from ...models.message import Message as MessageModel
 from ..deps import get_db
 from ...auth.auth0 import verify_auth0_token, get_user_id
 from ...schemas.message import MessageCreate, Message
+from ...services.channel_access import can_access_channel
+from ...services.read_state import mark_channel_read
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -194,8 +197,12 @@ class ConnectionManager:
         except Exception as e:
             logger.error(f"Error broadcasting to channel {channel_id}: {str(e)}")
 
-    async def broadcast_message(self, channel_id: int, message: MessageModel, exclude_user_id: Optional[int] = None):
-        """Broadcast a message to all users in a channel"""
+    async def broadcast_message(self, channel_id: int, message: MessageModel, exclude_user_id: Optional[int] = None, stream_id: Optional[str] = None):
+        """Broadcast a message to all users in a channel
+
+        ``stream_id`` marks the final message of a streamed bot reply, so
+        clients can replace the reply they built from its deltas.
+        """
         try:
             # Get the sender information from the message
             sender = message.sender
@@ -256,6 +263,9 @@ class ConnectionManager:
                     "message": store_message
                 }
             
+            if stream_id:
+                message_dict["streamId"] = stream_id
+            
             logger.debug(f"Broadcasting message with timestamps - created: {created_at}, updated: {updated_at}")
             await self.broadcast_to_channel(
                 channel_id,
@@ -278,6 +288,50 @@ class ConnectionManager:
             }
         )
 
+    async def broadcast_bot_delta(self, channel_id: int, stream_id: str, bot_user_id: int, delta: str, sequence: int, parent_id: Optional[int] = None):
+        """Broadcast the next chunk of a bot reply that is still being generated"""
+        await self.broadcast_to_channel(
+            channel_id,
+            {
+                "type": "BOT_MESSAGE_DELTA",
+                "channelId": str(channel_id),
+                "streamId": stream_id,
+                "userId": str(bot_user_id),
+                "parentId": str(parent_id) if parent_id else None,
+                "sequence": sequence,
+                "delta": delta
+            }
+        )
+
+    async def broadcast_bot_cancelled(self, channel_id: int, stream_id: str):
+        """Broadcast that a streamed bot reply stopped before it was saved"""
+        await self.broadcast_to_channel(
+            channel_id,
+            {
+                "type": "BOT_MESSAGE_CANCELLED",
+                "channelId": str(channel_id),
+                "streamId": stream_id
+            }
+        )
+
+    async def broadcast_file_processed(self, file_id: int, status: str, description: Optional[str], uploaded_by_id: int, message_id: Optional[int] = None, channel_id: Optional[int] = None):
+        """Tell the file's channel, or its uploader if it is not attached to a message yet, that processing finished"""
+        event = {
+            "type": "FILE_PROCESSED",
+            "fileId": str(file_id),
+            "messageId": str(message_id) if message_id else None,
+            "channelId": str(channel_id) if channel_id else None,
+            "status": status,
+            "description": description
+        }
+        if channel_id:
+            await self.broadcast_to_channel(channel_id, event)
+        elif uploaded_by_id in self.active_connections:
+            try:
+                await self.active_connections[uploaded_by_id].send_json(event)
+            except Exception as e:
+                logger.error(f"Error sending file status to user {uploaded_by_id}: {str(e)}")
+
     async def broadcast_reaction(self, channel_id: int, message_id: str, reaction: dict, is_add: bool = True):
         """Broadcast a reaction update to all users in a channel"""
         try:
@@ -403,6 +457,26 @@ async def websocket_endpoint(
                         }
                         await manager.broadcast_reaction(channel_id, message_id, reaction, is_add=False)
                         continue
+
+                    if message_type == "mark_read":
+                        channel_id = int(data["channelId"])
+                        message_id = int(data["messageId"]) if data.get("messageId") else None
+                        channel = db.query(Channel).filter(Channel.id == channel_id).first()
+                        if not channel or not can_access_channel(db, channel, user.id):
+                            logger.error(f"User {user.id} cannot mark channel {channel_id} as read")
+                            continue
+                        try:
+                            read = mark_channel_read(db, user.id, channel_id, message_id)
+                        except SQLAlchemyError as e:
+                            db.rollback()
+                            logger.error(f"Database error marking channel {channel_id} as read: {e}")
+                            continue
+                        await websocket.send_json({
+                            "type": "READ_STATE_UPDATED",
+                            "channelId": str(channel_id),
+                            "lastReadMessageId": str(read.last_read_message_id) if read.last_read_message_id else None
+                        })
+                        continue
                         
                 except WebSocketDisconnect:
                     break
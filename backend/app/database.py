@@ -67,9 +67,14 @@ def init_db(create_test_data: bool = False):
     from .models.channel import Channel
     from .models.message import Message
     from .models.file import File
+    from .models.file_chunk import FileChunk
     from .models.presence import Presence
     from .models.reaction import Reaction
     from .models.bot_message_score import BotMessageScore
+    from .models.channel_read import ChannelRead
+    from .models.index_outbox import IndexOutbox
+    from .models.upload_blob import UploadBlob
+    from .models.user_activity_stats import UserActivityStats
     from .auth.security import RefreshToken
     
     # Check if tables exist by trying to query the User table
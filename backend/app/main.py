@@ -1,10 +1,16 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
-from .api.v1 import users, channels, messages, files, reactions, search, websockets, ai_features
+from .api.v1 import users, channels, messages, files, reactions, search, websockets, ai_features, bootstrap
 from .auth.router import router as auth_router
-from .database import init_db
+from .database import init_db, SessionLocal
+from .services.inverted_index import save_snapshot as save_search_index
+from .ai.clients import start_ai_clients, stop_ai_clients
+from .ai.message_indexer import start_index_worker, stop_index_worker
+from .ai.file_processor import start_file_processor, stop_file_processor
+from .ai.profile_refresher import start_profile_refresher, stop_profile_refresher
 import logging
 import os
 from dotenv import load_dotenv
@@ -26,7 +32,31 @@ app_logger.setLevel(logging.DEBUG)  # More detailed for our app code
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
-app = FastAPI(title="Chat API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared AI clients, so requests reuse connections and vector store handles
+    app.state.ai_clients = start_ai_clients()
+    # Drains the index outbox into the vector index
+    if os.getenv("INDEX_WORKER_ENABLED", "true").lower() == "true":
+        start_index_worker(SessionLocal, app.state.ai_clients)
+    # Describes and embeds uploaded files after their upload has returned
+    if os.getenv("FILE_PROCESSOR_ENABLED", "true").lower() == "true":
+        await start_file_processor(
+            SessionLocal, app.state.ai_clients, files.UPLOAD_DIR,
+            notify=websockets.manager.broadcast_file_processed
+        )
+    # Regenerates the profiles user bots answer with, away from bot requests
+    if os.getenv("PROFILE_REFRESHER_ENABLED", "true").lower() == "true":
+        start_profile_refresher(SessionLocal, app.state.ai_clients)
+    yield
+    await stop_profile_refresher()
+    await stop_file_processor()
+    await stop_index_worker()
+    await stop_ai_clients()
+    # Persist the in-process search index, if enabled, for a fast restart
+    save_search_index()
+
+app = FastAPI(title="Chat API", version="1.0.0", lifespan=lifespan)
 
 # Initialize database tables
 # Only create test data if we're in development mode
@@ -67,6 +97,7 @@ app.include_router(files.router, prefix="/api/files", tags=["files"])
 app.include_router(reactions.router, prefix="/api/messages", tags=["reactions"])
 app.include_router(search.router, prefix="/api/search", tags=["search"])
 app.include_router(ai_features.router, prefix="/api/ai", tags=["ai"])
+app.include_router(bootstrap.router, prefix="/api/bootstrap", tags=["bootstrap"])
 
 # Mount WebSocket router without prefix to avoid path duplication
 app_logger.debug("Mounting WebSocket router")
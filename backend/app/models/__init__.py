@@ -3,4 +3,9 @@ from .channel import Channel
 from .message import Message
 from .reaction import Reaction
 from .file import File
-from .presence import Presence 
\ No newline at end of file
+from .file_chunk import FileChunk
+from .presence import Presence
+from .channel_read import ChannelRead
+from .index_outbox import IndexOutbox
+from .upload_blob import UploadBlob
+from .user_activity_stats import UserActivityStats
\ No newline at end of file
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, ForeignKey, Float
+from sqlalchemy import Column, Integer, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from ..database import Base
 
 class BotMessageScore(Base):
     __tablename__ = "bot_message_scores"
+    __table_args__ = (
+        # A bot's best and worst replies, read when its cached examples load
+        Index("ix_bot_message_scores_bot_user_id_score", "bot_user_id", "score", "message_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     message_id = Column(Integer, ForeignKey("messages.id"), nullable=False)
@@ -20,7 +20,7 @@ class Channel(Base):
     is_direct_message = Column(Boolean, default=False)
     is_public = Column(Boolean, default=True)
     created_at = Column(DateTime, default=lambda: datetime.now(UTC))
-    updated_at = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
+    updated_at = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC), index=True)
     created_by_id = Column(Integer, ForeignKey("users.id"))
 
     # Set up relationships
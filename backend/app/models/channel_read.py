@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from ..database import Base
+from datetime import datetime, UTC
+
+class ChannelRead(Base):
+    __tablename__ = "channel_reads"
+    __table_args__ = (
+        UniqueConstraint("user_id", "channel_id", name="uq_channel_reads_user_channel"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
+    last_read_message_id = Column(Integer, ForeignKey("messages.id"), nullable=True)
+    updated_at = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
+
+    # Relationships
+    user = relationship("User")
+    channel = relationship("Channel")
@@ -11,12 +11,22 @@ class File(Base):
     file_path = Column(String)
     file_type = Column(String)
     file_size = Column(Integer)
+    # SHA-256 of the content, the key of its UploadBlob
+    content_hash = Column(String(64), nullable=True, index=True)
     description = Column(Text, nullable=True)
+    # pending, processing, completed, failed or skipped (type not processed)
+    processing_status = Column(String, nullable=False, default="pending")
     uploaded_by_id = Column(Integer, ForeignKey("users.id"))
     message_id = Column(Integer, ForeignKey("messages.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
 
     # Relationships
     uploaded_by = relationship("User", back_populates="files")
-    message = relationship("Message", back_populates="files") 
\ No newline at end of file
+    message = relationship("Message", back_populates="files")
+    chunks = relationship(
+        "FileChunk",
+        back_populates="file",
+        order_by="FileChunk.chunk_index",
+        cascade="all, delete-orphan"
+    ) 
\ No newline at end of file
@@ -0,0 +1,47 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Text, UniqueConstraint, DDL, event
+from sqlalchemy.orm import relationship
+from ..database import Base
+from datetime import datetime, UTC
+
+class FileChunk(Base):
+    """A chunk of text extracted from an uploaded document, for content search"""
+    __tablename__ = "file_chunks"
+    __table_args__ = (
+        UniqueConstraint("file_id", "chunk_index", name="uq_file_chunks_file_chunk"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+
+    # Relationships
+    file = relationship("File", back_populates="chunks")
+
+# Full-text index over chunk content, built the same way as the message
+# index in models/message.py. Alembic revision 7a3c9e5f1b24 creates these
+# objects on existing databases.
+POSTGRES_FULLTEXT_DDL = [
+    "ALTER TABLE file_chunks ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_file_chunks_search_vector ON file_chunks USING GIN (search_vector)",
+]
+
+SQLITE_FULLTEXT_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS file_chunks_fts USING fts5("
+    "content, content='file_chunks', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS file_chunks_fts_ai AFTER INSERT ON file_chunks BEGIN "
+    "INSERT INTO file_chunks_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS file_chunks_fts_ad AFTER DELETE ON file_chunks BEGIN "
+    "INSERT INTO file_chunks_fts(file_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS file_chunks_fts_au AFTER UPDATE OF content ON file_chunks BEGIN "
+    "INSERT INTO file_chunks_fts(file_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO file_chunks_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+for statement in POSTGRES_FULLTEXT_DDL:
+    event.listen(FileChunk.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_FULLTEXT_DDL:
+    event.listen(FileChunk.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(FileChunk.__table__, "before_drop", DDL("DROP TABLE IF EXISTS file_chunks_fts").execute_if(dialect="sqlite"))
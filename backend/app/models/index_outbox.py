@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from ..database import Base
+from datetime import datetime, UTC
+
+class IndexOutbox(Base):
+    """Pending vector index change for a message
+
+    Written in the same transaction as the message change and removed once
+    the indexer has applied it, so no change is lost if the process stops
+    in between. ``message_id`` has no foreign key: delete entries outlive
+    their message.
+    """
+    __tablename__ = "index_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(Integer, nullable=False, index=True)
+    operation = Column(String, nullable=False)  # "upsert" or "delete"
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=lambda: datetime.now(UTC), index=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(UTC))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index, DDL, event, inspect, select, text
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.hybrid import hybrid_property
 from ..database import Base
@@ -6,6 +6,16 @@ from datetime import datetime, UTC
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Serves per-channel "latest message" and "messages after last read" lookups
+        Index("ix_messages_channel_id_id", "channel_id", "id"),
+        # Serves the latest replies of a bot to a user, for bot conversation history
+        Index(
+            "ix_messages_bot_conversations", "sender_id", "parent_sender_id", "created_at",
+            postgresql_where=text("is_bot"),
+            sqlite_where=text("is_bot = 1")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text)
@@ -14,6 +24,10 @@ class Message(Base):
     sender_id = Column(Integer, ForeignKey("users.id"))
     channel_id = Column(Integer, ForeignKey("channels.id"))
     parent_id = Column(Integer, ForeignKey("messages.id"), nullable=True)  # For threads/replies
+    # Sender of the parent message, copied by the ORM on insert and when
+    # parent_id changes; no foreign key, so it does not add a second join
+    # path to users. Core and bulk inserts skip the hooks and must set it.
+    parent_sender_id = Column(Integer, nullable=True)
     has_attachments = Column(Boolean, nullable=False, default=False)  # Ensure column is created with default value
     is_bot = Column(Boolean, nullable=False, default=False)  # Add is_bot field
     
@@ -23,4 +37,47 @@ class Message(Base):
     reactions = relationship("Reaction", back_populates="message")
     files = relationship("File", back_populates="message")
     replies = relationship("Message", backref=backref("parent", remote_side=[id]))
-    bot_scores = relationship("BotMessageScore", back_populates="message") 
\ No newline at end of file
+    bot_scores = relationship("BotMessageScore", back_populates="message")
+
+@event.listens_for(Message, "before_insert")
+def _copy_parent_sender(mapper, connection, target: Message) -> None:
+    if target.parent_id is not None and target.parent_sender_id is None:
+        target.parent_sender_id = connection.execute(
+            select(Message.sender_id).where(Message.id == target.parent_id)
+        ).scalar()
+
+@event.listens_for(Message, "before_update")
+def _recopy_parent_sender(mapper, connection, target: Message) -> None:
+    if not inspect(target).attrs.parent_id.history.has_changes():
+        return
+    target.parent_sender_id = None if target.parent_id is None else connection.execute(
+        select(Message.sender_id).where(Message.id == target.parent_id)
+    ).scalar()
+
+# Full-text search index. The search backends in services/fulltext.py rely on
+# these objects; Alembic revision 9c4e2b7d1a03 creates them on existing
+# databases, the DDL below covers databases built with create_all.
+POSTGRES_FULLTEXT_DDL = [
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+]
+
+# External-content FTS5 table kept in sync with messages by triggers
+SQLITE_FULLTEXT_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+for statement in POSTGRES_FULLTEXT_DDL:
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_FULLTEXT_DDL:
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Message.__table__, "before_drop", DDL("DROP TABLE IF EXISTS messages_fts").execute_if(dialect="sqlite"))
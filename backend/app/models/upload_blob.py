@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from ..database import Base
+from datetime import datetime, UTC
+
+class UploadBlob(Base):
+    """Stored content of uploads, shared by every file with the same bytes
+
+    Keyed by the SHA-256 of the content; ``ref_count`` is the number of
+    files pointing at it, and the blob and its disk file go with the last
+    one. Also holds what processing derived from the content, so a
+    duplicate upload reuses it instead of calling the models again;
+    ``processing_started_at`` is the claim of the one file running that
+    processing, which the others wait for.
+    """
+    __tablename__ = "upload_blobs"
+
+    content_hash = Column(String(64), primary_key=True)
+    storage_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    description = Column(Text, nullable=True)
+    chunks = Column(Text, nullable=True)  # JSON list of extracted text chunks
+    vector_ids = Column(Text, nullable=True)  # JSON object of store name -> vector IDs
+    processing_started_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(UTC))
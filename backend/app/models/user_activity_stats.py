@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, Text, Date, DateTime, ForeignKey
+from ..database import Base
+
+class UserActivityStats(Base):
+    """Running totals of a user's messages and files, for profile generation
+
+    Updated by the flush that inserts each message or file, so profiles
+    read a fixed-size row instead of scanning the user's history. Created
+    from a one-time scan of that history the first time it is needed.
+    """
+    __tablename__ = "user_activity_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    hour_counts = Column(Text, nullable=False)  # JSON list of 24 message counts, by UTC hour
+    length_sum = Column(Integer, nullable=False, default=0)
+    length_square_sum = Column(Integer, nullable=False, default=0)
+    short_count = Column(Integer, nullable=False, default=0)  # Messages under 50 characters
+    long_count = Column(Integer, nullable=False, default=0)  # Messages over 200 characters
+    code_count = Column(Integer, nullable=False, default=0)
+    emoji_count = Column(Integer, nullable=False, default=0)
+    last_message_at = Column(DateTime, nullable=True)
+    file_count = Column(Integer, nullable=False, default=0)
+    file_type_counts = Column(Text, nullable=False)  # JSON object of main MIME type -> count
+    file_days = Column(Integer, nullable=False, default=0)  # Distinct days with uploads
+    last_file_day = Column(Date, nullable=True)
@@ -24,4 +24,28 @@ class Channel(ChannelBase):
     created_at: datetime
     created_by_id: Optional[int] = None
     
-    model_config = ConfigDict(from_attributes=True) 
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True) 
+
+class LastMessagePreview(BaseModel):
+    id: int
+    content: Optional[str] = None
+    sender_id: Optional[int] = None
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ChannelWithReadState(Channel):
+    unread_count: int = 0
+    mention_count: int = 0
+    last_read_message_id: Optional[int] = None
+    last_message: Optional[LastMessagePreview] = None
+
+class ChannelReadUpdate(BaseModel):
+    message_id: Optional[int] = Field(default=None, description="ID of the last read message; defaults to the latest message")
+
+class ChannelReadState(BaseModel):
+    channel_id: int
+    last_read_message_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
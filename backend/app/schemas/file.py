@@ -16,7 +16,15 @@ class File(FileBase):
     id: int
     message_id: Optional[int] = None
     uploaded_by_id: int
+    processing_status: str = "pending"
     created_at: datetime
     updated_at: datetime
 
-    model_config = ConfigDict(from_attributes=True, populate_by_name=True) 
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class FileStatus(BaseModel):
+    id: int
+    processing_status: str
+    description: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True) 
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class SearchParams(BaseModel):
@@ -14,6 +14,8 @@ class MessageSearchResult(BaseModel):
     sender_id: int
     channel_id: int
     channel_name: str  # Include channel context
+    rank: Optional[float] = None  # Relevance score, higher is better
+    snippet: Optional[str] = None  # Content excerpt with matches highlighted
     
     class Config:
         from_attributes = True
@@ -26,6 +28,8 @@ class FileSearchResult(BaseModel):
     created_at: datetime
     channel_id: int
     channel_name: str
+    score: Optional[float] = None  # Trigram similarity of the name, higher is better
+    snippet: Optional[str] = None  # Matching document text with matches highlighted
     
     class Config:
         from_attributes = True
@@ -36,6 +40,44 @@ class ChannelSearchResult(BaseModel):
     description: Optional[str] = None
     is_direct_message: bool
     member_count: int
+    score: Optional[float] = None  # Trigram similarity, higher is better
     
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class SearchResponse(BaseModel):
+    """Combined result of ``GET /api/search``
+
+    Sections that were not requested are ``None``. ``timings`` holds each
+    section's duration in milliseconds and ``errors`` any section that failed.
+    """
+    messages: Optional[List[MessageSearchResult]] = None
+    files: Optional[List[FileSearchResult]] = None
+    channels: Optional[List[ChannelSearchResult]] = None
+    timings: Dict[str, float] = {}
+    errors: Dict[str, str] = {}
+    elapsed_ms: float = 0.0
+
+class UserSuggestion(BaseModel):
+    id: int
+    username: str
+
+class ChannelSuggestion(BaseModel):
+    id: int
+    name: str
+
+class FileSuggestion(BaseModel):
+    id: int
+    filename: str
+    channel_id: int
+
+class TermSuggestion(BaseModel):
+    term: str
+    count: int  # Occurrences in the channels the user can access
+
+class SuggestResponse(BaseModel):
+    """Completions for a search prefix, from ``GET /api/search/suggest``"""
+    users: List[UserSuggestion] = []
+    channels: List[ChannelSuggestion] = []
+    files: List[FileSuggestion] = []
+    terms: List[TermSuggestion] = []
@@ -0,0 +1,160 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Dict, Iterable, Optional
+from datetime import datetime, UTC
+import json
+import logging
+
+from ..models.message import Message
+from ..models.file import File
+from ..models.user_activity_stats import UserActivityStats
+
+logger = logging.getLogger(__name__)
+
+SHORT_MESSAGE_LENGTH = 50
+LONG_MESSAGE_LENGTH = 200
+EMOJI_CHARACTERS = "😀😊🙂👍"
+
+_stats_table = UserActivityStats.__table__
+
+def _empty_values() -> Dict[str, Any]:
+    return {
+        "message_count": 0,
+        "hour_counts": [0] * 24,
+        "length_sum": 0,
+        "length_square_sum": 0,
+        "short_count": 0,
+        "long_count": 0,
+        "code_count": 0,
+        "emoji_count": 0,
+        "last_message_at": None,
+        "file_count": 0,
+        "file_type_counts": {},
+        "file_days": 0,
+        "last_file_day": None,
+    }
+
+def _add_message(values: Dict[str, Any], content: str, created_at: datetime) -> None:
+    length = len(content)
+    values["message_count"] += 1
+    values["hour_counts"][created_at.hour] += 1
+    values["length_sum"] += length
+    values["length_square_sum"] += length * length
+    values["short_count"] += length < SHORT_MESSAGE_LENGTH
+    values["long_count"] += length > LONG_MESSAGE_LENGTH
+    values["code_count"] += "```" in content
+    values["emoji_count"] += any(c in content for c in EMOJI_CHARACTERS)
+    created_at = created_at.replace(tzinfo=None)
+    if values["last_message_at"] is None or created_at > values["last_message_at"]:
+        values["last_message_at"] = created_at
+
+def _add_file(values: Dict[str, Any], file_type: Optional[str], created_at: datetime) -> None:
+    values["file_count"] += 1
+    if file_type:
+        main_type = file_type.split('/')[0]
+        values["file_type_counts"][main_type] = values["file_type_counts"].get(main_type, 0) + 1
+    # Uploads arrive in time order, so a new day is one after the last
+    day = created_at.date()
+    if values["last_file_day"] is None or day > values["last_file_day"]:
+        values["file_days"] += 1
+        values["last_file_day"] = day
+
+def _to_row(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **values,
+        "hour_counts": json.dumps(values["hour_counts"]),
+        "file_type_counts": json.dumps(values["file_type_counts"]),
+    }
+
+def _from_row(row: Any) -> Dict[str, Any]:
+    values = {key: getattr(row, key) for key in _empty_values()}
+    values["hour_counts"] = json.loads(row.hour_counts)
+    values["file_type_counts"] = json.loads(row.file_type_counts)
+    return values
+
+def build_activity_stats(db: Session, user_id: int) -> UserActivityStats:
+    """Compute a user's statistics from their whole history and store them
+
+    A one-time scan; from then on each insert updates the row.
+    """
+    values = _empty_values()
+    messages = (
+        db.query(Message.content, Message.created_at)
+        .filter(Message.sender_id == user_id, Message.is_bot.isnot(True), Message.content.isnot(None))
+        .yield_per(1000)
+    )
+    for content, created_at in messages:
+        _add_message(values, content, created_at)
+    files = (
+        db.query(File.file_type, File.created_at)
+        .filter(File.uploaded_by_id == user_id)
+        .order_by(File.created_at)
+        .yield_per(1000)
+    )
+    for file_type, created_at in files:
+        _add_file(values, file_type, created_at)
+
+    stats = UserActivityStats(user_id=user_id, **_to_row(values))
+    db.add(stats)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Built concurrently by another session
+        db.rollback()
+        return db.query(UserActivityStats).filter(UserActivityStats.user_id == user_id).one()
+    logger.info(f"Built activity statistics for user {user_id} from {values['message_count']} messages and {values['file_count']} files")
+    return stats
+
+def get_activity_stats(db: Session, user_id: int) -> UserActivityStats:
+    """A user's activity statistics, built from their history if they have none yet"""
+    stats = db.query(UserActivityStats).filter(UserActivityStats.user_id == user_id).first()
+    return stats if stats is not None else build_activity_stats(db, user_id)
+
+def hour_histogram(stats: UserActivityStats) -> list:
+    return json.loads(stats.hour_counts)
+
+def file_type_counts(stats: UserActivityStats) -> Dict[str, int]:
+    return json.loads(stats.file_type_counts)
+
+# --- Updates on insert ----------------------------------------------------------
+#
+# Applied by the flush that inserts the message or file, so the totals commit
+# or roll back with it. Users without a row yet are left to the scan that
+# creates it, which also sees these inserts.
+
+def _new_activity(session: Session) -> Dict[int, list]:
+    activity: Dict[int, list] = {}
+    for obj in session.new:
+        if isinstance(obj, Message) and obj.content and not obj.is_bot and obj.sender_id:
+            activity.setdefault(obj.sender_id, []).append(obj)
+        elif isinstance(obj, File) and obj.uploaded_by_id:
+            activity.setdefault(obj.uploaded_by_id, []).append(obj)
+    return activity
+
+def _apply(values: Dict[str, Any], objects: Iterable[Any]) -> None:
+    for obj in objects:
+        created_at = obj.created_at or datetime.now(UTC)
+        if isinstance(obj, Message):
+            _add_message(values, obj.content, created_at)
+        else:
+            _add_file(values, obj.file_type, created_at)
+
+@event.listens_for(Session, "after_flush")
+def _update_activity_stats(session: Session, flush_context) -> None:
+    activity = _new_activity(session)
+    if not activity:
+        return
+    connection = session.connection()
+    for user_id, objects in activity.items():
+        # Locked, as concurrent inserts by one user would lose counts
+        row = connection.execute(
+            select(_stats_table).where(_stats_table.c.user_id == user_id).with_for_update()
+        ).first()
+        if row is None:
+            continue
+        values = _from_row(row)
+        _apply(values, objects)
+        connection.execute(
+            update(_stats_table).where(_stats_table.c.user_id == user_id).values(**_to_row(values))
+        )
@@ -0,0 +1,195 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, aliased
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+import logging
+import os
+import threading
+
+from ..models.message import Message
+from ..models.bot_message_score import BotMessageScore
+
+logger = logging.getLogger(__name__)
+
+# Best and worst scored replies kept per bot
+BOT_SCORED_EXAMPLES = int(os.getenv("BOT_SCORED_EXAMPLES", "3"))
+
+class ScoredExamples(NamedTuple):
+    highest: List[dict]  # Best first
+    lowest: List[dict]  # Worst first, without the messages in ``highest``
+
+class _Extremes(NamedTuple):
+    top: List[dict]
+    bottom: List[dict]
+
+# Sort keys; lower sorts first. Ties go to the older message, matching the
+# order of the (bot_user_id, score, message_id) index.
+def _top_key(example: dict) -> Tuple[float, int]:
+    return (-example['score'], -example['message_id'])
+
+def _bottom_key(example: dict) -> Tuple[float, int]:
+    return (example['score'], example['message_id'])
+
+def _example_query(db: Session):
+    parent = aliased(Message)
+    return (
+        db.query(
+            BotMessageScore.score,
+            Message.id,
+            Message.content,
+            Message.created_at,
+            parent.content.label('parent_content')
+        )
+        .join(Message, BotMessageScore.message_id == Message.id)
+        .outerjoin(parent, Message.parent_id == parent.id)
+    )
+
+def _to_example(row: Any) -> dict:
+    return {
+        'message_id': row.id,
+        'message': row.content,
+        'parent_message': row.parent_content,
+        'score': row.score,
+        'created_at': row.created_at
+    }
+
+def load_extremes(db: Session, bot_user_id: int, k: int) -> _Extremes:
+    """A bot's k best and k worst scored replies, read through the score index"""
+    base = _example_query(db).filter(BotMessageScore.bot_user_id == bot_user_id)
+    top = base.order_by(BotMessageScore.score.desc(), BotMessageScore.message_id.desc()).limit(k).all()
+    bottom = base.order_by(BotMessageScore.score.asc(), BotMessageScore.message_id.asc()).limit(k).all()
+    return _Extremes([_to_example(row) for row in top], [_to_example(row) for row in bottom])
+
+def _place(examples: List[dict], example: dict, k: int, key: Callable[[dict], Any]) -> Optional[List[dict]]:
+    """Apply a changed score to a sorted k-extreme list
+
+    Returns None when the list cannot be updated without reading the
+    messages beyond it: a full list's member moving past its last entry
+    may be overtaken by one of them.
+    """
+    full = len(examples) >= k
+    known = any(e['message_id'] == example['message_id'] for e in examples)
+    if known:
+        if full and key(example) > key(examples[-1]):
+            return None
+        rest = [e for e in examples if e['message_id'] != example['message_id']]
+    else:
+        if full and key(example) > key(examples[-1]):
+            return examples
+        rest = examples
+    return sorted(rest + [example], key=key)[:k]
+
+class BotScoreCache:
+    """In-process cache of each bot's best and worst scored replies
+
+    Entries are loaded on first use and then kept current by ``record``,
+    which applies each score change to the cached sets, so prompts and the
+    scored-messages endpoint cost one lookup. Thread-safe, since prompt
+    stages run in worker threads.
+    """
+
+    def __init__(self, k: int = BOT_SCORED_EXAMPLES):
+        self.k = k
+        self._lock = threading.Lock()
+        self._entries: Dict[int, _Extremes] = {}
+        # Bumped by every change, so sets loaded across one are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+        self.reloads = 0
+
+    def get(self, db: Session, bot_user_id: int) -> ScoredExamples:
+        with self._lock:
+            entry = self._entries.get(bot_user_id)
+            generation = self._generation
+            if entry is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            entry = load_extremes(db, bot_user_id, self.k)
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[bot_user_id] = entry
+        highest_ids = {example['message_id'] for example in entry.top}
+        return ScoredExamples(
+            list(entry.top),
+            [example for example in entry.bottom if example['message_id'] not in highest_ids]
+        )
+
+    def record(self, db: Session, bot_user_id: int, message_id: int, score: float) -> None:
+        """Apply a committed score change of one of the bot's replies"""
+        with self._lock:
+            self._generation += 1
+            cached = bot_user_id in self._entries
+        if not cached:
+            return
+        row = _example_query(db).filter(BotMessageScore.message_id == message_id, BotMessageScore.bot_user_id == bot_user_id).first()
+        with self._lock:
+            self._generation += 1
+            entry = self._entries.get(bot_user_id)
+            if entry is None:
+                return
+            if row is None:
+                del self._entries[bot_user_id]
+                return
+            example = {**_to_example(row), 'score': score}
+            top = _place(entry.top, example, self.k, _top_key)
+            bottom = _place(entry.bottom, example, self.k, _bottom_key)
+            if top is None or bottom is None:
+                # Reloaded on next use
+                del self._entries[bot_user_id]
+                self.reloads += 1
+            else:
+                self._entries[bot_user_id] = _Extremes(top, bottom)
+                self.updates += 1
+
+    def invalidate(self, bot_user_ids: Set[int]) -> None:
+        with self._lock:
+            self._generation += 1
+            for bot_user_id in bot_user_ids:
+                self._entries.pop(bot_user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bots": len(self._entries),
+                "k": self.k,
+                "hits": self.hits,
+                "misses": self.misses,
+                "updates": self.updates,
+                "reloads": self.reloads,
+            }
+
+bot_score_cache = BotScoreCache()
+
+# --- Write-driven invalidation ------------------------------------------------
+#
+# Edited or deleted bot replies drop their bot's entry once the transaction
+# commits; score changes go through ``record`` instead.
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_bots(session: Session, flush_context) -> None:
+    bots = session.info.setdefault("bot_score_cache_bots", set())
+    for obj in session.dirty:
+        # Only content; reactions on a reply mark it dirty too
+        if isinstance(obj, Message) and obj.is_bot and inspect(obj).attrs.content.history.has_changes():
+            bots.add(obj.sender_id)
+    for obj in session.deleted:
+        if isinstance(obj, Message) and obj.is_bot:
+            bots.add(obj.sender_id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_bots(session: Session) -> None:
+    bots = session.info.pop("bot_score_cache_bots", None)
+    if bots:
+        bot_score_cache.invalidate(bots)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_bots(session: Session) -> None:
+    session.info.pop("bot_score_cache_bots", None)
@@ -0,0 +1,52 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import exists, and_, or_, select
+from typing import List
+import logging
+
+from ..models.channel import Channel, channel_members
+from ..models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Public channels are readable by everyone without a channel_members row.
+# Membership rows exist for private channels and are materialized for public
+# channels only when a user first posts, so read endpoints never write.
+
+def is_channel_member(db: Session, channel_id: int, user_id: int) -> bool:
+    """Check channel membership without loading the full member list"""
+    return db.query(
+        exists().where(
+            and_(
+                channel_members.c.channel_id == channel_id,
+                channel_members.c.user_id == user_id
+            )
+        )
+    ).scalar()
+
+def can_access_channel(db: Session, channel: Channel, user_id: int) -> bool:
+    """A user can access a channel if it is public or they are a member"""
+    return bool(channel.is_public) or is_channel_member(db, channel.id, user_id)
+
+def accessible_channel_ids(user_id: int):
+    """Select the IDs of all channels a user can access, for use in ``IN`` filters"""
+    member_channels = select(channel_members.c.channel_id).where(channel_members.c.user_id == user_id)
+    return select(Channel.id).where(
+        or_(
+            Channel.is_public == True,
+            Channel.id.in_(member_channels)
+        )
+    )
+
+def load_accessible_channel_ids(db: Session, user_id: int) -> List[int]:
+    """IDs of all channels a user can access, resolved to a list"""
+    return list(db.execute(accessible_channel_ids(user_id)).scalars())
+
+def materialize_membership(db: Session, channel: Channel, user: User) -> None:
+    """Add a posting user to a public channel's member list
+
+    Called from write paths only. The row is added to the current transaction
+    and committed together with the write that needed it.
+    """
+    if channel.is_public and not is_channel_member(db, channel.id, user.id):
+        db.execute(channel_members.insert().values(channel_id=channel.id, user_id=user.id))
+        logger.info(f"Added user {user.id} to public channel {channel.id} on first post")
@@ -0,0 +1,117 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, defer
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import Any, Dict, Iterable, List, Optional, Type, Union, get_args
+import logging
+
+from ..models.user import User
+from ..models.file import File
+
+logger = logging.getLogger(__name__)
+
+# Large text columns that list endpoints skip unless a client asks for them
+# with ``fields=``. Single-object endpoints still return them.
+DEFERRED_COLUMNS = {
+    User: ("description",),
+    File: ("description",),
+}
+
+def heavy_column_options(model) -> list:
+    """``defer`` options for the model's heavy columns"""
+    return [defer(getattr(model, name)) for name in DEFERRED_COLUMNS.get(model, ())]
+
+def _nested_schema(annotation) -> Optional[Type[BaseModel]]:
+    """Find the pydantic model inside annotations like ``List[File]`` or ``Optional[User]``"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in get_args(annotation):
+        nested = _nested_schema(arg)
+        if nested is not None:
+            return nested
+    return None
+
+def loaded_fields(obj, schema: Type[BaseModel], skip_heavy: bool = False) -> Dict[str, Any]:
+    """Read the schema's fields from an ORM instance without triggering lazy loads
+
+    Deferred columns and relationships that were not eager-loaded are left
+    out, so the schema default applies to them. With ``skip_heavy``, heavy
+    columns are left out even if the instance already has them loaded, e.g.
+    because it was loaded earlier in the same session.
+    """
+    state = inspect(obj)
+    skipped = DEFERRED_COLUMNS.get(state.mapper.class_, ()) if skip_heavy else ()
+    data = {}
+    for name, field in schema.model_fields.items():
+        if name not in state.mapper.attrs or name in state.unloaded or name in skipped:
+            continue
+        value = getattr(obj, name)
+        nested = _nested_schema(field.annotation)
+        if nested is not None and value is not None:
+            if isinstance(value, list):
+                value = [loaded_fields(item, nested, skip_heavy) for item in value]
+            else:
+                value = loaded_fields(value, nested, skip_heavy)
+        data[name] = value
+    return data
+
+class Fieldset:
+    """The set of response fields a client asked for with ``fields=``
+
+    When no fields are requested the full response schema is returned, minus
+    the model's heavy columns, which are deferred at the SQL level.
+    """
+
+    def __init__(self, schema: Type[BaseModel], fields: Optional[str] = None):
+        self.schema = schema
+        self.requested: Optional[List[str]] = None
+        if fields:
+            requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+            unknown = [f for f in requested if f not in schema.model_fields]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            self.requested = requested or None
+
+    def wants(self, *names: str) -> bool:
+        """Whether any of the given fields is part of the response"""
+        return self.requested is None or any(name in self.requested for name in names)
+
+    def options(self, model, relationships: Optional[Dict[str, Any]] = None) -> list:
+        """Loader options for ``model``
+
+        Selects only the requested columns with ``load_only``, or defers the
+        model's heavy columns when no fields were requested. ``relationships``
+        maps field names to eager-load options, which are applied only for
+        fields that are part of the response.
+        """
+        options = []
+        if self.requested is None:
+            options.extend(heavy_column_options(model))
+        else:
+            mapper = inspect(model)
+            columns = [getattr(model, name) for name in self.requested if name in mapper.column_attrs]
+            if not columns:
+                columns = [getattr(model, mapper.get_property_by_column(mapper.primary_key[0]).key)]
+            options.append(load_only(*columns))
+        for name, option in (relationships or {}).items():
+            if self.wants(name):
+                options.append(option)
+        return options
+
+    def dump(self, obj, **extra) -> Union[BaseModel, Dict[str, Any]]:
+        """Serialize an ORM instance, plus computed ``extra`` values, for the response"""
+        data = {**loaded_fields(obj, self.schema, skip_heavy=self.requested is None), **extra}
+        if self.requested is None:
+            return self.schema.model_validate(data)
+        return {
+            name: data[name] if name in data else self.schema.model_fields[name].get_default(call_default_factory=True)
+            for name in self.requested
+        }
+
+    def respond(self, items: Iterable[Any]):
+        """Return items as-is, or as a plain JSON response that bypasses the full response model"""
+        items = list(items)
+        if self.requested is None:
+            return items
+        return JSONResponse(content=jsonable_encoder(items))
@@ -0,0 +1,79 @@
+from sqlalchemy.orm import Session
+from typing import List, NamedTuple, Optional, Sequence
+import logging
+
+from ..models.file import File
+from ..models.file_chunk import FileChunk
+from ..models.message import Message
+from ..models.channel import Channel
+from .fulltext import get_fulltext_backend, parse_query
+
+logger = logging.getLogger(__name__)
+
+# Matching chunks fetched per requested file; the best chunk of each file
+# becomes its snippet
+CHUNKS_PER_FILE = 5
+
+class FileContentHit(NamedTuple):
+    file: File
+    channel_id: int
+    channel_name: str
+    rank: float
+    snippet: Optional[str]
+
+def save_file_chunks(db: Session, file: File, chunks: Sequence[str]) -> None:
+    """Store the text chunks extracted from a file, replacing any earlier ones"""
+    file.chunks = [
+        FileChunk(chunk_index=index, content=chunk)
+        for index, chunk in enumerate(chunks)
+        if chunk and chunk.strip()
+    ]
+    logger.info(f"Stored {len(file.chunks)} text chunks for file {file.id}")
+
+def search_file_contents(
+    db: Session,
+    text: str,
+    channel_ids,
+    limit: int = 20,
+    options: Optional[list] = None
+) -> List[FileContentHit]:
+    """Files whose extracted text matches the query, best first
+
+    Uses the full-text index on ``file_chunks`` with the same query syntax as
+    message search. Each file appears once, with its best-matching chunk as
+    the snippet.
+
+    Args:
+        text: Search string
+        channel_ids: Channel IDs, or a select of them, to search in
+        limit: Maximum number of files to return
+        options: Loader options for the File entity
+    """
+    node = parse_query(text)
+    if node is None:
+        return []
+
+    backend = get_fulltext_backend(db, FileChunk)
+    query = (
+        db.query(File, Message.channel_id.label("channel_id"), Channel.name.label("channel_name"))
+        .select_from(FileChunk)
+        .join(File, FileChunk.file_id == File.id)
+        .join(Message, File.message_id == Message.id)
+        .join(Channel, Message.channel_id == Channel.id)
+    )
+    query, match, rank, snippet = backend.apply(query, node)
+    rows = (
+        query
+        .add_columns(rank.label("rank"), snippet.label("snippet"))
+        .options(*(options or []))
+        .filter(Message.channel_id.in_(channel_ids), match)
+        .order_by(*([rank.desc()] if backend.ranked else []), File.id.desc(), FileChunk.chunk_index)
+        .limit(limit * CHUNKS_PER_FILE)
+        .all()
+    )
+
+    hits = {}
+    for row in rows:
+        if row.File.id not in hits:
+            hits[row.File.id] = FileContentHit(row.File, row.channel_id, row.channel_name, float(row.rank or 0), row.snippet)
+    return list(hits.values())[:limit]
@@ -0,0 +1,377 @@
+from sqlalchemy import and_, or_, not_, func, literal, literal_column, table, column, inspect, true
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, Query
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+import logging
+import os
+import re
+
+from ..models.message import Message
+from ..models.channel import Channel
+
+logger = logging.getLogger(__name__)
+
+# Markers around matched terms in search snippets. Snippets contain raw
+# message text, so clients must escape them before rendering the markers.
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# Approximate number of words around the matches in a snippet
+SNIPPET_WORDS = 12
+# "sql" uses the database's full-text index, "memory" the in-process inverted index
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "sql").lower()
+
+# --- Query syntax -----------------------------------------------------------
+#
+# Words are ANDed by default. Supported syntax:
+#   "exact phrase"      phrase match
+#   deploy*             prefix match
+#   a OR b, a AND b     boolean operators (upper case only)
+#   NOT a, -a           exclusion
+#   ( ... )             grouping
+
+class Term(NamedTuple):
+    word: str
+    prefix: bool = False
+
+class Phrase(NamedTuple):
+    words: Tuple[str, ...]
+
+class Not(NamedTuple):
+    node: "Node"
+
+class And(NamedTuple):
+    nodes: Tuple["Node", ...]
+
+class Or(NamedTuple):
+    nodes: Tuple["Node", ...]
+
+Node = Union[Term, Phrase, Not, And, Or]
+
+_TOKEN_RE = re.compile(r'"([^"]*)"?|(\()|(\))|(\S+?)(?=[\s()"]|$)')
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    for phrase, open_paren, close_paren, word in _TOKEN_RE.findall(text):
+        if open_paren:
+            tokens.append(("(", open_paren))
+        elif close_paren:
+            tokens.append((")", close_paren))
+        elif word in ("AND", "OR", "NOT"):
+            tokens.append((word, word))
+        elif word:
+            if word.startswith("-") and len(word) > 1:
+                tokens.append(("NOT", "-"))
+                word = word[1:]
+            tokens.append(("WORD", word))
+        else:
+            tokens.append(("PHRASE", phrase))
+    return tokens
+
+def words(text: str) -> List[str]:
+    """Lower-cased word tokens, as the query parser splits them"""
+    return _WORD_RE.findall(text.lower())
+
+def _word_node(word: str) -> Optional[Node]:
+    words = _WORD_RE.findall(word.lower())
+    if not words:
+        return None
+    if len(words) == 1:
+        return Term(words[0], prefix=word.endswith("*"))
+    # Punctuated tokens like "don't" or "v2.1" match as a phrase
+    return Phrase(tuple(words))
+
+class _Parser:
+    """Recursive-descent parser: OR binds loosest, then AND, then NOT.
+
+    Malformed input never raises; dangling operators and unbalanced
+    parentheses are ignored.
+    """
+
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def next(self) -> Tuple[str, str]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self) -> Optional[Node]:
+        nodes = []
+        while self.peek() is not None:
+            node = self.parse_or()
+            if node is not None:
+                nodes.append(node)
+            if self.peek() == ")":
+                self.next()
+        return _combine(And, nodes)
+
+    def parse_or(self) -> Optional[Node]:
+        nodes = [self.parse_and()]
+        while self.peek() == "OR":
+            self.next()
+            nodes.append(self.parse_and())
+        return _combine(Or, [node for node in nodes if node is not None])
+
+    def parse_and(self) -> Optional[Node]:
+        nodes = []
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.next()
+                continue
+            node = self.parse_unary()
+            if node is not None:
+                nodes.append(node)
+        return _combine(And, nodes)
+
+    def parse_unary(self) -> Optional[Node]:
+        kind, value = self.next()
+        if kind == "NOT":
+            if self.peek() in (None, "OR", ")"):
+                return None
+            node = self.parse_unary()
+            return Not(node) if node is not None else None
+        if kind == "(":
+            node = self.parse_or()
+            if self.peek() == ")":
+                self.next()
+            return node
+        if kind == "PHRASE":
+            words = tuple(_WORD_RE.findall(value.lower()))
+            if not words:
+                return None
+            return Phrase(words) if len(words) > 1 else Term(words[0])
+        return _word_node(value)
+
+def _combine(kind, nodes: List[Node]) -> Optional[Node]:
+    if not nodes:
+        return None
+    if len(nodes) == 1:
+        return nodes[0]
+    return kind(tuple(nodes))
+
+def _has_positive(node: Node) -> bool:
+    """Whether a node can match on its own, i.e. is not only exclusions"""
+    if isinstance(node, Not):
+        return False
+    if isinstance(node, And):
+        return any(_has_positive(n) for n in node.nodes)
+    if isinstance(node, Or):
+        return all(_has_positive(n) for n in node.nodes)
+    return True
+
+def parse_query(text: str) -> Optional[Node]:
+    """Parse a search string, returning None if nothing searchable remains
+
+    Queries made only of exclusions (e.g. ``-foo``) would have to scan every
+    message, so they are treated as empty.
+    """
+    node = _Parser(text).parse()
+    if node is None or not _has_positive(node):
+        return None
+    return node
+
+# --- Backends ---------------------------------------------------------------
+
+class SearchHit(NamedTuple):
+    message: Message
+    channel_name: str
+    rank: float
+    snippet: Optional[str]
+
+class FullTextBackend:
+    """Common interface for message full-text search
+
+    Subclasses translate a parsed query into a match condition, a relevance
+    score (higher is better) and a highlighted snippet for their database.
+    """
+
+    name = "base"
+    # Whether the backend produces a relevance score to order by
+    ranked = True
+
+    def __init__(self, model=Message):
+        # Indexed model; it must have a ``content`` column
+        self.model = model
+        self.table_name = model.__tablename__
+
+    def apply(self, query: Query, node: Node) -> Tuple[Query, object, object, object]:
+        """Return the query with any joins added, plus match, rank and snippet expressions"""
+        raise NotImplementedError
+
+    def search(
+        self,
+        db: Session,
+        text: str,
+        channel_ids,
+        skip: int = 0,
+        limit: int = 20,
+        options: Optional[list] = None
+    ) -> List[SearchHit]:
+        """Search messages in the given channels, best matches first
+
+        Args:
+            text: Search string in the syntax described above
+            channel_ids: Channel IDs, or a select of them, to search in
+            skip: Number of results to skip (for pagination)
+            limit: Maximum number of results to return
+            options: Loader options for the Message entity
+        """
+        node = parse_query(text)
+        if node is None:
+            return []
+
+        query = db.query(Message).join(Channel, Message.channel_id == Channel.id)
+        query, match, rank, snippet = self.apply(query, node)
+        rows = (
+            query
+            .with_entities(
+                Message,
+                Channel.name.label("channel_name"),
+                rank.label("rank"),
+                snippet.label("snippet")
+            )
+            .options(*(options or []))
+            .filter(Message.channel_id.in_(channel_ids), match)
+            .order_by(*([rank.desc()] if self.ranked else []), Message.created_at.desc(), Message.id.desc())
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        return [SearchHit(row.Message, row.channel_name, float(row.rank or 0), row.snippet) for row in rows]
+
+class PostgresFullText(FullTextBackend):
+    """``tsvector`` column with a GIN index, ranked with ``ts_rank``"""
+
+    name = "postgresql"
+    config = "english"
+
+    def to_tsquery(self, node: Node) -> str:
+        # Words only contain \w characters, so quoting them is safe
+        if isinstance(node, Term):
+            return f"'{node.word}'" + (":*" if node.prefix else "")
+        if isinstance(node, Phrase):
+            return "(" + " <-> ".join(f"'{word}'" for word in node.words) + ")"
+        if isinstance(node, Not):
+            return "!" + self.to_tsquery(node.node)
+        separator = " & " if isinstance(node, And) else " | "
+        return "(" + separator.join(self.to_tsquery(n) for n in node.nodes) + ")"
+
+    def apply(self, query: Query, node: Node):
+        tsquery = func.to_tsquery(self.config, self.to_tsquery(node))
+        search_vector = literal_column(f"{self.table_name}.search_vector")
+        match = search_vector.op("@@")(tsquery)
+        rank = func.ts_rank(search_vector, tsquery)
+        snippet = func.ts_headline(
+            self.config,
+            self.model.content,
+            tsquery,
+            f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, "
+            f"MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS // 2}, MaxFragments=2"
+        )
+        return query, match, rank, snippet
+
+class SQLiteFullText(FullTextBackend):
+    """FTS5 virtual table ranked with bm25, for development and tests"""
+
+    name = "sqlite"
+
+    def __init__(self, model=Message):
+        super().__init__(model)
+        self.fts_name = f"{self.table_name}_fts"
+        self.fts = table(self.fts_name, column("rowid"), column("rank"))
+
+    def to_match(self, node: Node) -> Optional[str]:
+        """Render an FTS5 MATCH expression
+
+        FTS5 has no unary NOT, so exclusions are attached to the positive
+        part of the enclosing AND as ``a NOT b``. Exclusion-only branches
+        cannot be expressed and are dropped.
+        """
+        if isinstance(node, Term):
+            return f'"{node.word}"' + ("*" if node.prefix else "")
+        if isinstance(node, Phrase):
+            return '"' + " ".join(node.words) + '"'
+        if isinstance(node, Not):
+            return None
+        if isinstance(node, Or):
+            parts = [p for p in (self.to_match(n) for n in node.nodes) if p]
+            return "(" + " OR ".join(parts) + ")" if parts else None
+        positive = [p for p in (self.to_match(n) for n in node.nodes if not isinstance(n, Not)) if p]
+        if not positive:
+            return None
+        expression = "(" + " AND ".join(positive) + ")"
+        for n in node.nodes:
+            if isinstance(n, Not):
+                excluded = self.to_match(n.node)
+                if excluded:
+                    expression = f"({expression} NOT {excluded})"
+        return expression
+
+    def apply(self, query: Query, node: Node):
+        expression = self.to_match(node)
+        query = query.join(self.fts, self.fts.c.rowid == self.model.id)
+        match = literal_column(self.fts_name).op("MATCH")(expression) if expression else ~true()
+        # bm25 scores are negative, lower is better
+        rank = -self.fts.c.rank
+        snippet = func.snippet(
+            literal_column(self.fts_name), 0, HIGHLIGHT_START, HIGHLIGHT_END, "…", SNIPPET_WORDS
+        )
+        return query, match, rank, snippet
+
+class IlikeFullText(FullTextBackend):
+    """Unindexed substring matching, used when no full-text index exists"""
+
+    name = "ilike"
+    ranked = False
+
+    def to_condition(self, node: Node):
+        if isinstance(node, Term):
+            return self.model.content.ilike(f"%{node.word}%")
+        if isinstance(node, Phrase):
+            return self.model.content.ilike("%" + " ".join(node.words) + "%")
+        if isinstance(node, Not):
+            return not_(self.to_condition(node.node))
+        combine = and_ if isinstance(node, And) else or_
+        return combine(*(self.to_condition(n) for n in node.nodes))
+
+    def apply(self, query: Query, node: Node):
+        # No relevance signal, so results fall back to newest first
+        return query, self.to_condition(node), literal(0.0), func.substr(self.model.content, 1, 200)
+
+_backends: Dict[Tuple[Engine, type], FullTextBackend] = {}
+
+def _detect_backend(engine: Engine, model) -> FullTextBackend:
+    inspector = inspect(engine)
+    table_name = model.__tablename__
+    if engine.dialect.name == "postgresql":
+        if any(col["name"] == "search_vector" for col in inspector.get_columns(table_name)):
+            return PostgresFullText(model)
+    elif engine.dialect.name == "sqlite":
+        if inspector.has_table(f"{table_name}_fts"):
+            return SQLiteFullText(model)
+    logger.warning(f"No full-text index on {table_name} found for {engine.dialect.name}, falling back to ILIKE search")
+    return IlikeFullText(model)
+
+def get_message_search_backend(db: Session) -> FullTextBackend:
+    """Get the configured message search backend
+
+    ``SEARCH_BACKEND=memory`` selects the in-process inverted index; anything
+    else uses the database's full-text index.
+    """
+    if SEARCH_BACKEND == "memory":
+        from .inverted_index import get_inverted_index
+        return get_inverted_index(db)
+    return get_fulltext_backend(db)
+
+def get_fulltext_backend(db: Session, model=Message) -> FullTextBackend:
+    """Get the full-text backend for a model in the session's database, detected once per engine"""
+    key = (db.get_bind(), model)
+    if key not in _backends:
+        _backends[key] = _detect_backend(key[0], model)
+        logger.info(f"Using {_backends[key].name} full-text search backend for {model.__tablename__}")
+    return _backends[key]
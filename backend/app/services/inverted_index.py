@@ -0,0 +1,441 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import heapq
+import logging
+import math
+import os
+import pickle
+import threading
+
+from ..models.message import Message
+from ..models.channel import Channel
+from .fulltext import (
+    FullTextBackend, SearchHit, Node, Term, Phrase, Not, And, Or,
+    parse_query, words, HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_WORDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Where the index is snapshotted on shutdown and reloaded from on startup
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "search_index.snapshot")
+SNAPSHOT_VERSION = 1
+# Messages loaded per query when building or catching up the index
+SYNC_BATCH_SIZE = 1000
+
+def _encode(ids: Iterable[int]) -> array:
+    """Delta-encode a sorted sequence of message IDs"""
+    deltas = array("I")
+    previous = 0
+    for message_id in ids:
+        deltas.append(message_id - previous)
+        previous = message_id
+    return deltas
+
+def _decode(deltas: array) -> array:
+    return array("I", accumulate(deltas))
+
+class InvertedIndex(FullTextBackend):
+    """In-process inverted index over message content
+
+    Each term maps to a delta-encoded ``array('I')`` of message IDs. Message
+    IDs are allocated in increasing order, so new messages are appended to
+    their posting lists without decoding them. A dense ``array('I')`` indexed
+    by message ID holds each message's channel (0 once deleted) and scopes
+    results to the channels a user can access.
+
+    The index only produces candidates: every hit is checked against the
+    current database row before it is returned, so a stale posting (a
+    deleted or edited message) can cost time but never produces a wrong
+    result.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__(Message)
+        self._lock = threading.RLock()
+        self._postings: Dict[str, array] = {}
+        self._last_ids: Dict[str, int] = {}
+        self._doc_channels = array("I")
+        self._sorted_terms: Optional[List[str]] = None
+        self._deleted = 0
+        self.document_count = 0
+        self.max_message_id = 0
+        self.synced_at: Optional[datetime] = None
+
+    # --- Updates ---------------------------------------------------------
+
+    def add(self, message_id: int, channel_id: int, content: Optional[str], old_content: Optional[str] = None) -> None:
+        """Index a new or edited message
+
+        For edits, pass the previous content so that terms which no longer
+        occur are removed from their posting lists.
+        """
+        terms = set(words(content or ""))
+        with self._lock:
+            if old_content:
+                for term in set(words(old_content)) - terms:
+                    self._remove_posting(term, message_id)
+            if message_id >= len(self._doc_channels):
+                self._doc_channels.extend([0] * (message_id + 1 - len(self._doc_channels)))
+            if not self._doc_channels[message_id]:
+                self.document_count += 1
+            self._doc_channels[message_id] = channel_id
+            self.max_message_id = max(self.max_message_id, message_id)
+            for term in terms:
+                self._add_posting(term, message_id)
+
+    def remove(self, message_id: int) -> None:
+        """Drop a deleted message; its postings are purged on the next snapshot"""
+        with self._lock:
+            if message_id < len(self._doc_channels) and self._doc_channels[message_id]:
+                self._doc_channels[message_id] = 0
+                self.document_count -= 1
+                self._deleted += 1
+
+    def _add_posting(self, term: str, message_id: int) -> None:
+        last = self._last_ids.get(term)
+        if last is None:
+            self._postings[term] = array("I", [message_id])
+            self._last_ids[term] = message_id
+            self._sorted_terms = None
+        elif message_id > last:
+            self._postings[term].append(message_id - last)
+            self._last_ids[term] = message_id
+        elif message_id < last:
+            # Out-of-order insert, e.g. an edited older message
+            ids = list(_decode(self._postings[term]))
+            position = bisect_left(ids, message_id)
+            if position == len(ids) or ids[position] != message_id:
+                insort(ids, message_id)
+                self._postings[term] = _encode(ids)
+
+    def _remove_posting(self, term: str, message_id: int) -> None:
+        if term not in self._postings:
+            return
+        ids = list(_decode(self._postings[term]))
+        position = bisect_left(ids, message_id)
+        if position < len(ids) and ids[position] == message_id:
+            del ids[position]
+            if ids:
+                self._postings[term] = _encode(ids)
+                self._last_ids[term] = ids[-1]
+            else:
+                del self._postings[term]
+                del self._last_ids[term]
+                self._sorted_terms = None
+
+    def sync(self, db: Session) -> int:
+        """Index messages created or edited since the last sync
+
+        Used to build the index from scratch and to catch up after loading a
+        snapshot. Returns the number of messages indexed.
+        """
+        started = datetime.utcnow()
+        conditions = [Message.id > self.max_message_id]
+        if self.synced_at is not None:
+            conditions.append(Message.updated_at > self.synced_at)
+        query = (
+            db.query(Message.id, Message.channel_id, Message.content)
+            .filter(or_(*conditions))
+            .order_by(Message.id)
+            .yield_per(SYNC_BATCH_SIZE)
+        )
+        count = 0
+        for message_id, channel_id, content in query:
+            self.add(message_id, channel_id, content)
+            count += 1
+        self.synced_at = started
+        return count
+
+    # --- Snapshots -------------------------------------------------------
+
+    def compact(self) -> None:
+        """Remove deleted messages from all posting lists"""
+        with self._lock:
+            if not self._deleted:
+                return
+            channels = self._doc_channels
+            for term in list(self._postings):
+                ids = [i for i in _decode(self._postings[term]) if channels[i]]
+                if ids:
+                    self._postings[term] = _encode(ids)
+                    self._last_ids[term] = ids[-1]
+                else:
+                    del self._postings[term]
+                    del self._last_ids[term]
+            self._sorted_terms = None
+            self._deleted = 0
+
+    def save(self, path: str) -> None:
+        """Write a snapshot, replacing any previous one atomically"""
+        self.compact()
+        with self._lock:
+            snapshot = {
+                "version": SNAPSHOT_VERSION,
+                "max_message_id": self.max_message_id,
+                "synced_at": self.synced_at,
+                "document_count": self.document_count,
+                "doc_channels": self._doc_channels.tobytes(),
+                "postings": {term: ids.tobytes() for term, ids in self._postings.items()},
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved search index snapshot with {self.document_count} messages to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "InvertedIndex":
+        """Load a snapshot written by ``save``. Only load trusted files."""
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported search index snapshot version {snapshot.get('version')}")
+        index = cls()
+        index.max_message_id = snapshot["max_message_id"]
+        index.synced_at = snapshot["synced_at"]
+        index.document_count = snapshot["document_count"]
+        index._doc_channels.frombytes(snapshot["doc_channels"])
+        for term, data in snapshot["postings"].items():
+            postings = array("I")
+            postings.frombytes(data)
+            index._postings[term] = postings
+            index._last_ids[term] = sum(postings)
+        return index
+
+    # --- Queries ---------------------------------------------------------
+
+    def _ids(self, term: str) -> Set[int]:
+        postings = self._postings.get(term)
+        return set(accumulate(postings)) if postings else set()
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        terms = self._sorted_terms
+        ids = set()
+        for position in range(bisect_left(terms, prefix), len(terms)):
+            if not terms[position].startswith(prefix):
+                break
+            ids |= self._ids(terms[position])
+        return ids
+
+    def _evaluate(self, node: Node, leaves: List[Tuple[Set[int], int]]) -> Set[int]:
+        """Candidate IDs for a node; collects positive leaves for scoring"""
+        if isinstance(node, Term):
+            ids = self._prefix_ids(node.word) if node.prefix else self._ids(node.word)
+        elif isinstance(node, Phrase):
+            sets = sorted((self._ids(word) for word in node.words), key=len)
+            ids = set.intersection(*sets)
+        elif isinstance(node, And):
+            positive = [self._evaluate(n, leaves) for n in node.nodes if not isinstance(n, Not)]
+            if not positive:
+                return set()
+            ids = set.intersection(*sorted(positive, key=len))
+            for n in node.nodes:
+                if isinstance(n, Not) and ids:
+                    ids -= self._evaluate(n.node, [])
+            return ids
+        elif isinstance(node, Or):
+            ids = set()
+            for n in node.nodes:
+                if not isinstance(n, Not):
+                    ids |= self._evaluate(n, leaves)
+            return ids
+        else:
+            return set()
+        leaves.append((ids, len(ids)))
+        return ids
+
+    def _ranked(self, candidates: Set[int], scores: Dict[int, float], wanted: int) -> Iterator[int]:
+        """Yield candidates best first, sorting everything only if needed"""
+        key = lambda message_id: (-scores.get(message_id, 0.0), -message_id)
+        window = max(wanted * 2, 100)
+        if len(candidates) <= window:
+            yield from sorted(candidates, key=key)
+            return
+        top = heapq.nsmallest(window, candidates, key=key)
+        yield from top
+        yield from sorted(candidates.difference(top), key=key)
+
+    def search(
+        self,
+        db: Session,
+        text: str,
+        channel_ids,
+        skip: int = 0,
+        limit: int = 20,
+        options: Optional[list] = None
+    ) -> List[SearchHit]:
+        node = parse_query(text)
+        if node is None:
+            return []
+
+        if isinstance(channel_ids, (list, set, tuple)):
+            allowed = set(channel_ids)
+        else:
+            allowed = set(db.execute(channel_ids).scalars())
+
+        wanted = skip + limit
+        scores: Dict[int, float] = {}
+        with self._lock:
+            channels = self._doc_channels
+            total = max(self.document_count, 1)
+            if isinstance(node, Term) and not node.prefix:
+                # Single term: every match scores the same, so walk the
+                # posting list newest first instead of materializing it
+                ids = _decode(self._postings.get(node.word, array("I")))
+                default_score = math.log(1 + total / max(len(ids), 1))
+                ranked = (i for i in reversed(ids) if channels[i] in allowed)
+            else:
+                leaves: List[Tuple[Set[int], int]] = []
+                candidates = self._evaluate(node, leaves)
+                candidates = {i for i in candidates if i < len(channels) and channels[i] in allowed}
+                default_score = 0.0
+
+                # Sum of idf over the query terms each message matches
+                for ids, document_frequency in leaves:
+                    idf = math.log(1 + total / max(document_frequency, 1))
+                    for message_id in ids & candidates:
+                        scores[message_id] = scores.get(message_id, 0.0) + idf
+                ranked = self._ranked(candidates, scores, wanted)
+
+        hits: List[SearchHit] = []
+        batch: List[int] = []
+        for message_id in ranked:
+            batch.append(message_id)
+            if len(batch) >= max(limit, 50):
+                hits.extend(self._verify(db, node, batch, scores, default_score, options))
+                batch = []
+                if len(hits) >= wanted:
+                    break
+        if batch and len(hits) < wanted:
+            hits.extend(self._verify(db, node, batch, scores, default_score, options))
+        return hits[skip:wanted]
+
+    def _verify(
+        self,
+        db: Session,
+        node: Node,
+        batch: List[int],
+        scores: Dict[int, float],
+        default_score: float,
+        options
+    ) -> List[SearchHit]:
+        """Load a batch of candidates in rank order, dropping stale ones"""
+        rows = (
+            db.query(Message, Channel.name.label("channel_name"))
+            .join(Channel, Message.channel_id == Channel.id)
+            .options(*(options or []))
+            .filter(Message.id.in_(batch))
+            .all()
+        )
+        by_id = {row.Message.id: row for row in rows}
+        hits = []
+        for message_id in batch:
+            row = by_id.get(message_id)
+            if row is None:
+                self.remove(message_id)
+                continue
+            # Check the current content: the message may have been edited
+            # since it was indexed. Sparse fieldsets may not load it.
+            content = row.Message.__dict__.get("content")
+            if content is None:
+                content = db.query(Message.content).filter(Message.id == message_id).scalar() or ""
+            tokens = words(content)
+            if not _matches(node, tokens, set(tokens)):
+                continue
+            score = scores.get(message_id, default_score)
+            hits.append(SearchHit(row.Message, row.channel_name, score, _snippet(node, content)))
+        return hits
+
+def _matches(node: Node, tokens: List[str], token_set: Set[str]) -> bool:
+    """Evaluate a query against a message's tokens"""
+    if isinstance(node, Term):
+        if node.prefix:
+            return any(token.startswith(node.word) for token in token_set)
+        return node.word in token_set
+    if isinstance(node, Phrase):
+        size = len(node.words)
+        return any(tuple(tokens[i:i + size]) == node.words for i in range(len(tokens) - size + 1))
+    if isinstance(node, Not):
+        return not _matches(node.node, tokens, token_set)
+    if isinstance(node, And):
+        return all(_matches(n, tokens, token_set) for n in node.nodes)
+    return any(_matches(n, tokens, token_set) for n in node.nodes)
+
+def _positive_terms(node: Node) -> List[Term]:
+    if isinstance(node, Term):
+        return [node]
+    if isinstance(node, Phrase):
+        return [Term(word) for word in node.words]
+    if isinstance(node, (And, Or)):
+        return [term for n in node.nodes for term in _positive_terms(n)]
+    return []
+
+def _snippet(node: Node, content: str) -> str:
+    """Highlight query terms in a window of words around the first match"""
+    terms = _positive_terms(node)
+
+    def is_match(chunk: str) -> bool:
+        return any(
+            token.startswith(term.word) if term.prefix else token == term.word
+            for token in words(chunk)
+            for term in terms
+        )
+
+    chunks = content.split()
+    first = next((i for i, chunk in enumerate(chunks) if is_match(chunk)), 0)
+    start = max(0, first - SNIPPET_WORDS // 2)
+    window = chunks[start:start + SNIPPET_WORDS]
+    snippet = " ".join(f"{HIGHLIGHT_START}{chunk}{HIGHLIGHT_END}" if is_match(chunk) else chunk for chunk in window)
+    if start > 0:
+        snippet = "…" + snippet
+    if start + SNIPPET_WORDS < len(chunks):
+        snippet += "…"
+    return snippet
+
+_index: Optional[InvertedIndex] = None
+_index_lock = threading.Lock()
+
+def get_inverted_index(db: Session) -> InvertedIndex:
+    """Get the process-wide index, loading the snapshot or building it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = None
+                if os.path.exists(SEARCH_INDEX_PATH):
+                    try:
+                        index = InvertedIndex.load(SEARCH_INDEX_PATH)
+                    except Exception as e:
+                        logger.error(f"Could not load search index snapshot {SEARCH_INDEX_PATH}: {e}")
+                index = index or InvertedIndex()
+                indexed = index.sync(db)
+                logger.info(f"Search index ready with {index.document_count} messages ({indexed} indexed on startup)")
+                _index = index
+    return _index
+
+def index_saved_message(message: Message, old_content: Optional[str] = None) -> None:
+    """Update the index after a message is created or edited, if the index is in use"""
+    if _index is not None:
+        _index.add(message.id, message.channel_id, message.content, old_content)
+
+def unindex_message(message_id: int) -> None:
+    """Update the index after a message is deleted, if the index is in use"""
+    if _index is not None:
+        _index.remove(message_id)
+
+def save_snapshot() -> None:
+    """Snapshot the index to ``SEARCH_INDEX_PATH``, if the index is in use"""
+    if _index is not None:
+        try:
+            _index.save(SEARCH_INDEX_PATH)
+        except OSError as e:
+            logger.error(f"Could not save search index snapshot: {e}")
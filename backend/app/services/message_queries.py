@@ -0,0 +1,77 @@
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import List, Optional
+from datetime import datetime
+import logging
+
+from ..models.message import Message
+
+logger = logging.getLogger(__name__)
+
+def message_load_options() -> list:
+    """Eager-load options for serializing messages.
+
+    The sender is a many-to-one and is joined into the page query. Reactions and
+    files are collections, so each one is fetched with a single ``IN`` query for
+    the whole page instead of multiplying rows in a JOIN.
+    """
+    return [
+        joinedload(Message.sender),
+        selectinload(Message.reactions),
+        selectinload(Message.files),
+    ]
+
+def get_channel_messages_page(
+    db: Session,
+    channel_id: int,
+    skip: int = 0,
+    limit: int = 50,
+    since: Optional[int] = None,
+    options: Optional[list] = None
+) -> List[Message]:
+    """Get a page of channel messages, newest first, with relations loaded
+
+    Args:
+        channel_id: ID of the channel
+        skip: Number of messages to skip (for pagination)
+        limit: Maximum number of messages to return
+        since: Optional timestamp (in milliseconds) to get messages after
+        options: Loader options to use instead of ``message_load_options()``
+    """
+    query = (
+        db.query(Message)
+        .filter(Message.channel_id == channel_id)
+        .filter(Message.sender_id.isnot(None))  # Filter out messages with null sender_id
+        .options(*(message_load_options() if options is None else options))
+    )
+
+    if since is not None:
+        since_datetime = datetime.fromtimestamp(since / 1000.0)  # Convert milliseconds to datetime
+        query = query.filter(Message.created_at > since_datetime)
+        logger.debug(f"Filtering messages after {since_datetime}")
+
+    return (
+        query
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+def get_message_replies(db: Session, message_id: int) -> List[Message]:
+    """Get replies to a message in chronological order, with relations loaded"""
+    return (
+        db.query(Message)
+        .filter(Message.parent_id == message_id)
+        .options(*message_load_options())
+        .order_by(Message.created_at)
+        .all()
+    )
+
+def get_message_with_relations(db: Session, message_id: int) -> Optional[Message]:
+    """Get a single message with sender, channel, reactions and files loaded"""
+    return (
+        db.query(Message)
+        .options(*message_load_options(), joinedload(Message.channel))
+        .filter(Message.id == message_id)
+        .first()
+    )
@@ -0,0 +1,165 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, and_, or_, select
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional
+from datetime import datetime, UTC
+import logging
+import re
+
+from ..models.message import Message
+from ..models.channel_read import ChannelRead
+from ..models.user import User
+from ..models.channel import Channel
+from ..schemas.channel import Channel as ChannelSchema, ChannelWithReadState
+
+logger = logging.getLogger(__name__)
+
+# Number of characters of the latest message included in channel previews
+PREVIEW_LENGTH = 100
+
+def mark_channel_read(
+    db: Session,
+    user_id: int,
+    channel_id: int,
+    message_id: Optional[int] = None
+) -> ChannelRead:
+    """Advance a user's read marker for a channel
+
+    The marker only moves forward, so out-of-order updates from several
+    clients cannot make already-read messages unread again. When no message
+    is given, the latest message in the channel is used.
+
+    Raises:
+        ValueError: If the message does not belong to the channel
+    """
+    if message_id is None:
+        message_id = (
+            db.query(func.max(Message.id))
+            .filter(Message.channel_id == channel_id)
+            .scalar()
+        )
+    elif not db.query(Message.id).filter(
+        Message.id == message_id,
+        Message.channel_id == channel_id
+    ).first():
+        raise ValueError(f"Message {message_id} is not in channel {channel_id}")
+
+    reads = db.query(ChannelRead).filter(ChannelRead.user_id == user_id, ChannelRead.channel_id == channel_id)
+    if reads.first() is None:
+        try:
+            with db.begin_nested():
+                db.add(ChannelRead(user_id=user_id, channel_id=channel_id, last_read_message_id=message_id))
+        except IntegrityError:
+            # Created by a concurrent first read; advanced below instead
+            pass
+    if message_id is not None:
+        # Conditional, so concurrent updates cannot move the marker back
+        reads.filter(or_(
+            ChannelRead.last_read_message_id.is_(None),
+            ChannelRead.last_read_message_id < message_id
+        )).update(
+            {ChannelRead.last_read_message_id: message_id, ChannelRead.updated_at: datetime.now(UTC)},
+            synchronize_session=False
+        )
+
+    db.commit()
+    read = reads.populate_existing().one()
+    logger.debug(f"User {user_id} read channel {channel_id} up to message {read.last_read_message_id}")
+    return read
+
+def mention_pattern(username: str) -> re.Pattern:
+    """Matches ``@username`` as a whole word, so ``@bob`` does not match ``@bobby``"""
+    return re.compile(rf"(?<![\w@])@{re.escape(username)}(?!\w)", re.IGNORECASE)
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def get_channel_read_states(db: Session, user: User, channel_ids: List[int]) -> Dict[int, dict]:
+    """Get unread counts, mention counts and a last-message preview per channel
+
+    The latest message of each channel is a max lookup on the
+    (channel_id, id) index, and only messages after the user's read marker
+    are counted, as index range scans, so the cost follows the unread
+    messages rather than the channels' history. Channels without messages
+    are omitted from the result.
+    """
+    if not channel_ids:
+        return {}
+
+    latest = (
+        select(func.max(Message.id))
+        .where(Message.channel_id == Channel.id)
+        .correlate(Channel)
+        .scalar_subquery()
+    )
+    markers = (
+        db.query(Channel.id, latest.label("last_message_id"), ChannelRead.last_read_message_id)
+        .outerjoin(ChannelRead, and_(ChannelRead.channel_id == Channel.id, ChannelRead.user_id == user.id))
+        .filter(Channel.id.in_(channel_ids))
+        .all()
+    )
+    markers = [row for row in markers if row.last_message_id is not None]
+
+    # One index range per channel with messages after its read marker
+    ranges = [
+        and_(Message.channel_id == row.id, Message.id > (row.last_read_message_id or 0))
+        for row in markers
+        if row.last_message_id > (row.last_read_message_id or 0)
+    ]
+    unread_counts: Dict[int, int] = {}
+    mention_counts: Dict[int, int] = {}
+    if ranges:
+        unread = and_(or_(*ranges), Message.sender_id != user.id)
+        unread_counts = dict(
+            db.query(Message.channel_id, func.count(Message.id))
+            .filter(unread)
+            .group_by(Message.channel_id)
+            .all()
+        )
+        if user.username:
+            # LIKE narrows the candidates; the word boundary is checked here
+            pattern = mention_pattern(user.username)
+            candidates = (
+                db.query(Message.channel_id, Message.content)
+                .filter(unread, Message.content.ilike(f"%@{_escape_like(user.username)}%", escape="\\"))
+            )
+            for channel_id, content in candidates:
+                if pattern.search(content):
+                    mention_counts[channel_id] = mention_counts.get(channel_id, 0) + 1
+
+    last_messages = {
+        row.id: row
+        for row in db.query(
+            Message.id,
+            func.substr(Message.content, 1, PREVIEW_LENGTH).label("content"),
+            Message.sender_id,
+            Message.created_at
+        ).filter(Message.id.in_([row.last_message_id for row in markers]))
+    }
+
+    states = {}
+    for row in markers:
+        last_message = last_messages.get(row.last_message_id)
+        states[row.id] = {
+            "unread_count": unread_counts.get(row.id, 0),
+            "mention_count": mention_counts.get(row.id, 0),
+            "last_read_message_id": row.last_read_message_id,
+            "last_message": {
+                "id": last_message.id,
+                "content": last_message.content,
+                "sender_id": last_message.sender_id,
+                "created_at": last_message.created_at
+            } if last_message else None
+        }
+    return states
+
+def channels_with_read_state(db: Session, user: User, channels: List[Channel]) -> List[ChannelWithReadState]:
+    """Attach the user's read state to a list of channels, preserving order"""
+    read_states = get_channel_read_states(db, user, [channel.id for channel in channels])
+    return [
+        ChannelWithReadState(
+            **ChannelSchema.model_validate(channel).model_dump(),
+            **read_states.get(channel.id, {})
+        )
+        for channel in channels
+    ]
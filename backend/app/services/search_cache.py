@@ -0,0 +1,188 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, NamedTuple, Optional, Set
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from ..models.message import Message
+from ..models.file import File
+from ..models.file_chunk import FileChunk
+from ..models.channel import Channel
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of cached result pages; 0 disables the cache
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+# Seconds a cached result page stays valid
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+
+# Invalidation tags. Message and file results depend on every channel that
+# was searched; channel results on any channel change.
+FILES_TAG = "files"
+CHANNELS_TAG = "channels"
+
+def channel_tag(channel_id: int) -> str:
+    return f"channel:{channel_id}"
+
+_OPERATORS = {"AND", "OR", "NOT"}
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace and case, keeping the upper-case boolean operators"""
+    return " ".join(word if word in _OPERATORS else word.lower() for word in text.split())
+
+def channel_set_key(channel_ids: Iterable[int]) -> str:
+    """Stable hash of a set of channel IDs, so users with the same access share entries"""
+    joined = ",".join(str(channel_id) for channel_id in sorted(set(channel_ids)))
+    return hashlib.sha1(joined.encode()).hexdigest()
+
+class _Entry(NamedTuple):
+    value: Any
+    expires_at: float
+    tags: frozenset
+
+class SearchCache:
+    """Bounded LRU cache of search result pages with TTL and tag invalidation
+
+    Each entry carries a set of tags; ``invalidate`` drops every entry with
+    one of the given tags. Thread-safe, since search sections run in worker
+    threads.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._tagged: Dict[str, Set[Hashable]] = {}
+        # Bumped by every invalidation, so results computed across one are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        for tag in entry.tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str], generation: Optional[int] = None) -> None:
+        """Store a value; skipped if an invalidation happened since ``generation``"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            tags = frozenset(tags)
+            self._entries[key] = _Entry(value, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, tags: Iterable[str], compute: Callable[[], Any]) -> Any:
+        if not self.enabled:
+            return compute()
+        value = self.get(key)
+        if value is None:
+            generation = self._generation
+            value = compute()
+            self.set(key, value, tags, generation)
+        return value
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        """Drop all entries carrying any of the tags, returning how many were dropped"""
+        with self._lock:
+            self._generation += 1
+            keys = set()
+            for tag in tags:
+                keys.update(self._tagged.get(tag, ()))
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tagged.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+search_cache = SearchCache()
+
+# --- Write-driven invalidation ------------------------------------------------
+#
+# Tags touched by a flush are collected on the session and invalidated once
+# the transaction commits, whichever endpoint or task made the change.
+
+def _tags_for(obj) -> Set[str]:
+    if isinstance(obj, Message):
+        return {channel_tag(obj.channel_id)} if obj.channel_id is not None else set()
+    if isinstance(obj, (File, FileChunk)):
+        return {FILES_TAG}
+    if isinstance(obj, Channel):
+        return {CHANNELS_TAG} | ({channel_tag(obj.id)} if obj.id is not None else set())
+    return set()
+
+@event.listens_for(Session, "after_flush")
+def _collect_search_tags(session: Session, flush_context) -> None:
+    tags = session.info.setdefault("search_cache_tags", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tags |= _tags_for(obj)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_search_cache(session: Session) -> None:
+    tags = session.info.pop("search_cache_tags", None)
+    if tags:
+        search_cache.invalidate(tags)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_search_tags(session: Session) -> None:
+    session.info.pop("search_cache_tags", None)
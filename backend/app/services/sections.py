@@ -0,0 +1,36 @@
+from sqlalchemy.orm import Session
+from typing import Any, Callable
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Helpers for endpoints that assemble a response from independent sections,
+# each loaded concurrently in a worker thread on its own session so that
+# the total latency is that of the slowest section.
+
+def run_in_session(session_factory: Callable[[], Session], loader: Callable, *args) -> Any:
+    """Call ``loader(db, *args)`` with a new session that is closed afterwards"""
+    db = session_factory()
+    try:
+        return loader(db, *args)
+    finally:
+        db.close()
+
+async def load_section(name: str, session_factory: Callable[[], Session], loader: Callable, *args) -> dict:
+    """Run a section loader in a worker thread with its own session
+
+    Returns ``{"section", "data", "elapsed_ms"}``, or ``{"section", "error",
+    "elapsed_ms"}`` if the loader failed, so one broken section does not
+    fail the whole response.
+    """
+    started = time.perf_counter()
+    try:
+        data = await asyncio.to_thread(run_in_session, session_factory, loader, *args)
+        section = {"section": name, "data": data}
+    except Exception as e:
+        logger.error(f"Error loading section {name}: {e}")
+        section = {"section": name, "error": f"Could not load {name}"}
+    section["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return section
@@ -0,0 +1,258 @@
+from sqlalchemy.orm import Session
+from langchain_core.embeddings import Embeddings
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import heapq
+import logging
+import math
+import os
+import threading
+
+from ..models.message import Message
+from ..models.channel import Channel
+from .fulltext import SearchHit, get_message_search_backend, words
+from .sections import run_in_session
+
+logger = logging.getLogger(__name__)
+
+# "pinecone" queries the messages vector store the bot uses, Pinecone or FAISS
+# depending on VECTOR_STORE_BACKEND; "local" embeds messages
+# on demand with the offline hashing embeddings, for development and tests
+SEMANTIC_BACKEND = os.getenv("SEMANTIC_BACKEND", "pinecone").lower()
+# Rank offset of reciprocal rank fusion; 60 is the value from the original paper
+RRF_K = 60
+# Results taken from each retriever before fusion
+HYBRID_CANDIDATES = 50
+# Seconds hybrid search waits for the vector retrieval once the lexical one
+# is done, before answering with the lexical results alone
+HYBRID_VECTOR_TIMEOUT = float(os.getenv("HYBRID_VECTOR_TIMEOUT", "2"))
+# Seconds hybrid search waits for the lexical retrieval, before answering
+# with the vector results alone
+HYBRID_LEXICAL_TIMEOUT = float(os.getenv("HYBRID_LEXICAL_TIMEOUT", "10"))
+# Vector retrievals running at once; searches finding them all busy skip it
+HYBRID_VECTOR_WORKERS = int(os.getenv("HYBRID_VECTOR_WORKERS", "4"))
+
+# --- Embedding providers ------------------------------------------------------
+
+class HashingEmbeddings(Embeddings):
+    """Offline embedding provider: feature-hashed bag of words
+
+    Texts sharing words get similar vectors. It has no notion of meaning, but
+    is deterministic and needs no API key, so it stands in for OpenAI
+    embeddings in tests and local development.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in words(text):
+            digest = hashlib.md5(word.encode()).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector] if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+# --- Vector retrievers ----------------------------------------------------------
+
+class VectorRetriever:
+    """Common interface for semantic message retrieval"""
+
+    name = "base"
+
+    def search(self, db: Session, text: str, channel_ids: Sequence[int], k: int) -> List[int]:
+        """IDs of the messages closest to the text in the given channels, best first"""
+        raise NotImplementedError
+
+class PineconeRetriever(VectorRetriever):
+    """The ``messages`` namespace of the vector store (``PINECONE_INDEX_TWO``), filtered by channel
+
+    Only vectors indexed with a ``channel_id`` in their metadata can match.
+    Uses the shared vector store of the AI clients unless given another.
+    """
+
+    name = "pinecone"
+
+    def __init__(self, store=None):
+        if store is None:
+            from ..ai.clients import get_ai_clients
+            store = get_ai_clients().messages_store
+        self.store = store
+
+    def search(self, db, text, channel_ids, k):
+        documents = self.store.similarity_search(
+            text,
+            k=k,
+            filter={"channel_id": {"$in": list(channel_ids)}}
+        )
+        return [int(document.metadata["message_id"]) for document in documents]
+
+class LocalVectorRetriever(VectorRetriever):
+    """Brute-force cosine similarity over the newest messages of the channels
+
+    Message vectors are cached by content, so each message is embedded once.
+    Only suitable for small databases.
+    """
+
+    name = "local"
+
+    def __init__(self, embeddings: Embeddings, max_messages: int = 10000):
+        self.embeddings = embeddings
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._vectors: Dict[int, Tuple[str, List[float]]] = {}
+
+    def _vector(self, message_id: int, content: str) -> List[float]:
+        with self._lock:
+            cached = self._vectors.get(message_id)
+        if cached is not None and cached[0] == content:
+            return cached[1]
+        vector = self.embeddings.embed_documents([content])[0]
+        with self._lock:
+            self._vectors[message_id] = (content, vector)
+        return vector
+
+    def search(self, db, text, channel_ids, k):
+        query_vector = self.embeddings.embed_query(text)
+        rows = (
+            db.query(Message.id, Message.content)
+            .filter(Message.channel_id.in_(channel_ids))
+            .order_by(Message.id.desc())
+            .limit(self.max_messages)
+            .all()
+        )
+        scored = (
+            (sum(q * v for q, v in zip(query_vector, self._vector(row.id, row.content or ""))), row.id)
+            for row in rows
+        )
+        return [message_id for score, message_id in heapq.nlargest(k, scored) if score > 0]
+
+_retriever: Optional[VectorRetriever] = None
+_retriever_lock = threading.Lock()
+
+def get_vector_retriever() -> VectorRetriever:
+    """Get the configured vector retriever, created on first use"""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            if SEMANTIC_BACKEND == "local":
+                _retriever = LocalVectorRetriever(HashingEmbeddings())
+            else:
+                _retriever = PineconeRetriever()
+            logger.info(f"Using {_retriever.name} vector retriever")
+        return _retriever
+
+# --- Hybrid search ---------------------------------------------------------------
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked ID lists, scoring each ID by the sum of ``1 / (k + rank)``"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+# The two retrievals of a hybrid search overlap, each on its own pool, so
+# vector retrievals still running after HYBRID_VECTOR_TIMEOUT never hold up
+# lexical ones. Every vector worker has a slot, taken without waiting, so
+# vector retrievals are never queued behind abandoned ones either.
+_lexical_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-lexical")
+_vector_executor = ThreadPoolExecutor(max_workers=HYBRID_VECTOR_WORKERS, thread_name_prefix="hybrid-vector")
+_vector_slots = threading.BoundedSemaphore(HYBRID_VECTOR_WORKERS)
+
+def _lexical_hits(db: Session, text: str, channel_ids: Sequence[int], k: int) -> List[Tuple[int, Optional[str]]]:
+    hits = get_message_search_backend(db).search(db, text, channel_ids, limit=k)
+    return [(hit.message.id, hit.snippet) for hit in hits]
+
+def _vector_hits(db: Session, text: str, channel_ids: Sequence[int], k: int) -> List[int]:
+    return get_vector_retriever().search(db, text, channel_ids, k)
+
+def _submit_vector_hits(
+    session_factory: Callable[[], Session], text: str, channel_ids: Sequence[int], k: int
+) -> Optional[Future]:
+    """Start a vector retrieval on a free worker, or return None when all are busy"""
+    if not _vector_slots.acquire(blocking=False):
+        return None
+    try:
+        future = _vector_executor.submit(run_in_session, session_factory, _vector_hits, text, channel_ids, k)
+    except Exception:
+        _vector_slots.release()
+        raise
+    future.add_done_callback(lambda _: _vector_slots.release())
+    return future
+
+def hybrid_search(
+    db: Session,
+    session_factory: Callable[[], Session],
+    text: str,
+    channel_ids: Sequence[int],
+    skip: int = 0,
+    limit: int = 20,
+    options: Optional[list] = None
+) -> List[SearchHit]:
+    """Search messages lexically and semantically, fused with reciprocal rank fusion
+
+    The two retrievals run concurrently on their own sessions. If the vector
+    retrieval fails, has no free worker, or is still running
+    ``HYBRID_VECTOR_TIMEOUT`` seconds after the lexical one finished,
+    results fall back to the lexical ranking; a lexical retrieval running
+    over ``HYBRID_LEXICAL_TIMEOUT`` seconds leaves the vector ranking alone.
+    Blocks on both, so async callers run it in a worker thread. ``rank`` is
+    the fused score; ``snippet`` is set for messages the lexical search found.
+
+    Args:
+        db: Session used to load the returned messages
+        session_factory: Creates the sessions for the two retrievals
+        text: Search string
+        channel_ids: IDs of the channels to search in
+        skip: Number of results to skip (for pagination)
+        limit: Maximum number of results to return
+        options: Loader options for the Message entity
+    """
+    channel_ids = list(channel_ids)
+    candidates = max(HYBRID_CANDIDATES, skip + limit)
+    lexical = _lexical_executor.submit(run_in_session, session_factory, _lexical_hits, text, channel_ids, candidates)
+    vector = _submit_vector_hits(session_factory, text, channel_ids, candidates)
+
+    try:
+        lexical_hits = lexical.result(timeout=HYBRID_LEXICAL_TIMEOUT)
+    except FutureTimeoutError:
+        logger.warning(f"Lexical retrieval took over {HYBRID_LEXICAL_TIMEOUT}s, using vector results only")
+        lexical_hits = []
+    vector_ids = []
+    if vector is None:
+        logger.warning("Every vector retrieval worker is busy, using lexical results only")
+    else:
+        try:
+            vector_ids = vector.result(timeout=HYBRID_VECTOR_TIMEOUT)
+        except FutureTimeoutError:
+            logger.warning(f"Vector retrieval took over {HYBRID_VECTOR_TIMEOUT}s, using lexical results only")
+        except Exception as e:
+            logger.error(f"Vector retrieval failed, using lexical results only: {e}")
+
+    fused = reciprocal_rank_fusion([[message_id for message_id, _ in lexical_hits], vector_ids])[skip:skip + limit]
+    if not fused:
+        return []
+
+    rows = (
+        db.query(Message, Channel.name.label("channel_name"))
+        .options(*(options or []))
+        .join(Channel, Message.channel_id == Channel.id)
+        .filter(Message.id.in_([message_id for message_id, _ in fused]), Message.channel_id.in_(channel_ids))
+        .all()
+    )
+    by_id = {row.Message.id: row for row in rows}
+    snippets = dict(lexical_hits)
+    return [
+        SearchHit(by_id[message_id].Message, by_id[message_id].channel_name, score, snippets.get(message_id))
+        for message_id, score in fused
+        if message_id in by_id
+    ]
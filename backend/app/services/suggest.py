@@ -0,0 +1,451 @@
+from sqlalchemy import event, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from bisect import bisect_left, insort
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+import heapq
+import logging
+import os
+import re
+import threading
+
+from ..models.user import User
+from ..models.channel import Channel, channel_members
+from ..models.file import File
+from ..models.message import Message
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which the index is rebuilt in the background, to pick up
+# writes made by other worker processes
+SUGGEST_REBUILD_SECONDS = int(os.getenv("SUGGEST_REBUILD_SECONDS", "600"))
+# Newest messages whose words seed the term completions
+SUGGEST_MESSAGE_SAMPLE = int(os.getenv("SUGGEST_MESSAGE_SAMPLE", "100000"))
+# Index entries examined per section, which bounds the cost of short prefixes
+SCAN_LIMIT = 2000
+# Words must be this long, and occur this often in accessible channels, to be suggested
+MIN_TERM_LENGTH = 3
+MIN_TERM_COUNT = 2
+STOP_WORDS = frozenset(
+    "the and for are but not you all any can had her was one our out has him his how its "
+    "who did get may new now old see way use she too let say that with have this will your "
+    "from they been were what when than then them into just like some could would there their "
+    "about which".split()
+)
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+def _keys(text: Optional[str]) -> Set[str]:
+    """Lookup keys of a name: the whole lower-cased name and each word in it"""
+    lowered = (text or "").lower().strip()
+    if not lowered:
+        return set()
+    return {lowered, *_WORD_RE.findall(lowered)}
+
+def _terms(text: Optional[str]) -> List[str]:
+    return [
+        word for word in _WORD_RE.findall((text or "").lower())
+        if len(word) >= MIN_TERM_LENGTH and word not in STOP_WORDS and not word.isdigit()
+    ]
+
+class PrefixIndex:
+    """Sorted array of ``(key, id)`` pairs answering prefix lookups with bisect"""
+
+    def __init__(self, pairs: Optional[List[Tuple[str, int]]] = None):
+        self._pairs = sorted(set(pairs or ()))
+
+    def add(self, item_id: int, text: Optional[str]) -> None:
+        for key in _keys(text):
+            pair = (key, item_id)
+            position = bisect_left(self._pairs, pair)
+            if position == len(self._pairs) or self._pairs[position] != pair:
+                self._pairs.insert(position, pair)
+
+    def remove(self, item_id: int, text: Optional[str]) -> None:
+        for key in _keys(text):
+            pair = (key, item_id)
+            position = bisect_left(self._pairs, pair)
+            if position < len(self._pairs) and self._pairs[position] == pair:
+                del self._pairs[position]
+
+    def scan(self, prefix: str) -> Iterator[int]:
+        """IDs with a key starting with the prefix, in key order, at most ``SCAN_LIMIT``"""
+        position = bisect_left(self._pairs, (prefix,))
+        end = min(len(self._pairs), position + SCAN_LIMIT)
+        while position < end and self._pairs[position][0].startswith(prefix):
+            yield self._pairs[position][1]
+            position += 1
+
+class CompletionIndex:
+    """Completions for usernames, channel names, filenames and message terms
+
+    Everything needed to answer a lookup, including channel access, is held
+    in memory, so suggestions never touch the database. The index is built
+    once from the database and then kept current from committed writes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.users = PrefixIndex()
+        self.channels = PrefixIndex()
+        self.files = PrefixIndex()
+        self._user_names: Dict[int, Tuple[str, Optional[str]]] = {}
+        self._channel_info: Dict[int, Tuple[str, bool]] = {}
+        self._channel_members: Dict[int, Set[int]] = {}
+        self._private_channels: Dict[int, Set[int]] = {}
+        self._file_info: Dict[int, Tuple[str, Optional[int]]] = {}
+        self._terms: List[str] = []
+        self._term_counts: Dict[str, Dict[int, int]] = {}
+        self.built_at: Optional[datetime] = None
+
+    # --- Building --------------------------------------------------------
+
+    @classmethod
+    def build(cls, db: Session) -> "CompletionIndex":
+        index = cls()
+        user_pairs, channel_pairs, file_pairs = [], [], []
+        for row in db.query(User.id, User.username, User.full_name).filter(User.is_active == True):
+            index._user_names[row.id] = (row.username, row.full_name)
+            user_pairs.extend((key, row.id) for key in _keys(row.username) | _keys(row.full_name))
+        for row in db.query(Channel.id, Channel.name, Channel.is_public):
+            index._channel_info[row.id] = (row.name, bool(row.is_public))
+            channel_pairs.extend((key, row.id) for key in _keys(row.name))
+        for channel_id, user_id in db.execute(select(channel_members.c.channel_id, channel_members.c.user_id)):
+            index._channel_members.setdefault(channel_id, set()).add(user_id)
+        for channel_id, members in index._channel_members.items():
+            index._set_members(channel_id, members)
+        files = (
+            db.query(File.id, File.filename, Message.channel_id)
+            .outerjoin(Message, File.message_id == Message.id)
+        )
+        for row in files:
+            index._file_info[row.id] = (row.filename, row.channel_id)
+            file_pairs.extend((key, row.id) for key in _keys(row.filename))
+        messages = (
+            db.query(Message.channel_id, Message.content)
+            .order_by(Message.id.desc())
+            .limit(SUGGEST_MESSAGE_SAMPLE)
+        )
+        for row in messages:
+            index._count_terms(row.channel_id, row.content, 1, sort=False)
+        index.users = PrefixIndex(user_pairs)
+        index.channels = PrefixIndex(channel_pairs)
+        index.files = PrefixIndex(file_pairs)
+        index._terms = sorted(index._term_counts)
+        index.built_at = datetime.utcnow()
+        return index
+
+    # --- Updates ---------------------------------------------------------
+
+    def _set_members(self, channel_id: int, members: Set[int]) -> None:
+        for user_id in self._channel_members.get(channel_id, set()) - members:
+            self._private_channels.get(user_id, set()).discard(channel_id)
+        self._channel_members[channel_id] = set(members)
+        is_public = self._channel_info.get(channel_id, ("", True))[1]
+        for user_id in members:
+            channels = self._private_channels.setdefault(user_id, set())
+            if is_public:
+                channels.discard(channel_id)
+            else:
+                channels.add(channel_id)
+
+    def upsert_user(self, user_id: int, username: Optional[str], full_name: Optional[str], is_active: bool) -> None:
+        with self._lock:
+            old = self._user_names.pop(user_id, None)
+            if old is not None:
+                self.users.remove(user_id, old[0])
+                self.users.remove(user_id, old[1])
+            if is_active and username:
+                self._user_names[user_id] = (username, full_name)
+                self.users.add(user_id, username)
+                self.users.add(user_id, full_name)
+
+    def remove_user(self, user_id: int) -> None:
+        self.upsert_user(user_id, None, None, False)
+
+    def upsert_channel(self, channel_id: int, name: Optional[str], is_public: bool, members: Optional[Set[int]] = None) -> None:
+        with self._lock:
+            old = self._channel_info.get(channel_id)
+            if old is not None:
+                self.channels.remove(channel_id, old[0])
+            self._channel_info[channel_id] = (name or "", bool(is_public))
+            self.channels.add(channel_id, name)
+            self._set_members(channel_id, members if members is not None else self._channel_members.get(channel_id, set()))
+
+    def remove_channel(self, channel_id: int) -> None:
+        with self._lock:
+            old = self._channel_info.pop(channel_id, None)
+            if old is not None:
+                self.channels.remove(channel_id, old[0])
+            self._set_members(channel_id, set())
+            del self._channel_members[channel_id]
+
+    def upsert_file(self, file_id: int, filename: Optional[str], channel_id: Optional[int]) -> None:
+        with self._lock:
+            old = self._file_info.get(file_id)
+            if old is not None:
+                self.files.remove(file_id, old[0])
+            self._file_info[file_id] = (filename or "", channel_id)
+            self.files.add(file_id, filename)
+
+    def remove_file(self, file_id: int) -> None:
+        with self._lock:
+            old = self._file_info.pop(file_id, None)
+            if old is not None:
+                self.files.remove(file_id, old[0])
+
+    def _count_terms(self, channel_id: Optional[int], text: Optional[str], delta: int, sort: bool = True) -> None:
+        if channel_id is None:
+            return
+        for term in _terms(text):
+            counts = self._term_counts.get(term)
+            if counts is None:
+                if delta < 0:
+                    continue
+                counts = self._term_counts[term] = {}
+                if sort:
+                    insort(self._terms, term)
+            count = counts.get(channel_id, 0) + delta
+            if count > 0:
+                counts[channel_id] = count
+            else:
+                counts.pop(channel_id, None)
+            # Emptied terms stay in the sorted array; lookups skip them
+
+    def count_terms(self, channel_id: Optional[int], text: Optional[str], delta: int) -> None:
+        with self._lock:
+            self._count_terms(channel_id, text, delta)
+
+    # --- Lookups ---------------------------------------------------------
+
+    def accessible_channels(self, user_id: int) -> Set[int]:
+        public = {channel_id for channel_id, (_, is_public) in self._channel_info.items() if is_public}
+        return public | self._private_channels.get(user_id, set())
+
+    def suggest(self, user_id: int, prefix: str, limit: int = 5) -> Dict[str, list]:
+        """Completions for a prefix, restricted to what the user can access"""
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return {"users": [], "channels": [], "files": [], "terms": []}
+        with self._lock:
+            channels = self.accessible_channels(user_id)
+            return {
+                "users": self._take(self.users.scan(prefix), limit, lambda user_id: (
+                    {"id": user_id, "username": self._user_names[user_id][0]}
+                    if user_id in self._user_names else None
+                )),
+                "channels": self._take(self.channels.scan(prefix), limit, lambda channel_id: (
+                    {"id": channel_id, "name": self._channel_info[channel_id][0]}
+                    if channel_id in channels else None
+                )),
+                "files": self._take(self.files.scan(prefix), limit, lambda file_id: (
+                    {"id": file_id, "filename": self._file_info[file_id][0], "channel_id": self._file_info[file_id][1]}
+                    if file_id in self._file_info and self._file_info[file_id][1] in channels else None
+                )),
+                "terms": self._top_terms(prefix, channels, limit),
+            }
+
+    def _take(self, ids: Iterator[int], limit: int, render: Callable[[int], Optional[dict]]) -> List[dict]:
+        results, seen = [], set()
+        for item_id in ids:
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            item = render(item_id)
+            if item is not None:
+                results.append(item)
+                if len(results) == limit:
+                    break
+        return results
+
+    def _top_terms(self, prefix: str, channels: Set[int], limit: int) -> List[dict]:
+        position = bisect_left(self._terms, prefix)
+        end = min(len(self._terms), position + SCAN_LIMIT)
+        candidates = []
+        while position < end and self._terms[position].startswith(prefix):
+            term = self._terms[position]
+            count = sum(n for channel_id, n in self._term_counts[term].items() if channel_id in channels)
+            if count >= MIN_TERM_COUNT:
+                candidates.append((count, term))
+            position += 1
+        return [{"term": term, "count": count} for count, term in heapq.nlargest(limit, candidates)]
+
+class _IndexSlot:
+    """The completion index of one database, with its background rebuild state"""
+
+    def __init__(self):
+        self.index: Optional[CompletionIndex] = None
+        # The first build, shared by the callers that arrive while it runs
+        self.building: Optional[Future] = None
+        self.rebuilding = False
+        # Changes committed while a rebuild runs, replayed onto the new index
+        self.replay: List[tuple] = []
+
+_slots: Dict[Engine, _IndexSlot] = {}
+_slots_lock = threading.Lock()
+
+def _rebuild(slot: _IndexSlot, session_factory: Callable[[], Session]) -> None:
+    db = session_factory()
+    try:
+        index = CompletionIndex.build(db)
+    except Exception as e:
+        logger.error(f"Could not rebuild completion index: {e}")
+        with _slots_lock:
+            slot.rebuilding = False
+            slot.replay.clear()
+        return
+    finally:
+        db.close()
+    with _slots_lock:
+        for change in slot.replay:
+            _apply(index, change)
+        slot.replay.clear()
+        slot.index = index
+        slot.rebuilding = False
+    logger.info("Rebuilt completion index")
+
+def _build_first(slot: _IndexSlot, build: Future, session_factory: Callable[[], Session]) -> None:
+    db = session_factory()
+    try:
+        index = CompletionIndex.build(db)
+    except Exception as e:
+        with _slots_lock:
+            slot.building = None
+            slot.rebuilding = False
+            slot.replay.clear()
+        build.set_exception(e)
+        return
+    finally:
+        db.close()
+    with _slots_lock:
+        for change in slot.replay:
+            _apply(index, change)
+        slot.replay.clear()
+        slot.index = index
+        slot.building = None
+        slot.rebuilding = False
+    build.set_result(index)
+    logger.info("Built completion index")
+
+def get_completion_index(db: Session, session_factory: Callable[[], Session]) -> CompletionIndex:
+    """Get the completion index of the session's database, building it on first use
+
+    The first build runs once on its own session; callers arriving while it
+    runs wait for it. Once the index is older than ``SUGGEST_REBUILD_SECONDS``
+    it is rebuilt in a background thread while the current one keeps
+    serving. Blocks during the first build, so async callers run it in a
+    worker thread.
+    """
+    engine = db.get_bind()
+    build = None
+    with _slots_lock:
+        slot = _slots.setdefault(engine, _IndexSlot())
+        index = slot.index
+        if index is None:
+            build = slot.building
+            if build is None:
+                build = slot.building = Future()
+                # Changes committed during the build are replayed onto it
+                slot.rebuilding = True
+                owner = True
+            else:
+                owner = False
+        start_rebuild = (
+            index is not None
+            and not slot.rebuilding
+            and (datetime.utcnow() - index.built_at).total_seconds() > SUGGEST_REBUILD_SECONDS
+        )
+        if start_rebuild:
+            slot.rebuilding = True
+    if build is not None:
+        if owner:
+            _build_first(slot, build, session_factory)
+        return build.result()
+    if start_rebuild:
+        threading.Thread(target=_rebuild, args=(slot, session_factory), name="suggest-rebuild", daemon=True).start()
+    return index
+
+# --- Write-driven updates ------------------------------------------------------
+#
+# Changes are captured at flush time, while the values are still loaded,
+# and applied to the index once the transaction commits.
+
+def _apply(index: CompletionIndex, change: tuple) -> None:
+    kind, args = change[0], change[1:]
+    if kind == "user":
+        index.upsert_user(*args)
+    elif kind == "user_removed":
+        index.remove_user(*args)
+    elif kind == "channel":
+        index.upsert_channel(*args)
+    elif kind == "channel_removed":
+        index.remove_channel(*args)
+    elif kind == "file":
+        index.upsert_file(*args)
+    elif kind == "file_removed":
+        index.remove_file(*args)
+    elif kind == "terms":
+        index.count_terms(*args)
+
+def _file_channel(session: Session, file: File) -> Optional[int]:
+    if file.message_id is None:
+        return None
+    return session.connection().execute(
+        select(Message.channel_id).where(Message.id == file.message_id)
+    ).scalar()
+
+def _changes_for(session: Session, obj, deleted: bool) -> List[tuple]:
+    if isinstance(obj, User):
+        return [("user_removed", obj.id)] if deleted else [("user", obj.id, obj.username, obj.full_name, bool(obj.is_active))]
+    if isinstance(obj, Channel):
+        if deleted:
+            return [("channel_removed", obj.id)]
+        members = None if "members" in inspect(obj).unloaded else {user.id for user in obj.members}
+        return [("channel", obj.id, obj.name, bool(obj.is_public), members)]
+    if isinstance(obj, File):
+        return [("file_removed", obj.id)] if deleted else [("file", obj.id, obj.filename, _file_channel(session, obj))]
+    if isinstance(obj, Message):
+        if deleted:
+            return [("terms", obj.channel_id, obj.content, -1)]
+        history = inspect(obj).attrs.content.history
+        if not history.has_changes():
+            return []
+        return [("terms", obj.channel_id, old, -1) for old in history.deleted] + [
+            ("terms", obj.channel_id, new, 1) for new in history.added
+        ]
+    return []
+
+def _slot_for(session: Session) -> Optional[_IndexSlot]:
+    slot = _slots.get(session.get_bind())
+    return slot if slot is not None and (slot.index is not None or slot.building is not None) else None
+
+@event.listens_for(Session, "after_flush")
+def _collect_completion_changes(session: Session, flush_context) -> None:
+    if _slot_for(session) is None:
+        return
+    changes = session.info.setdefault("completion_changes", [])
+    for obj in list(session.new) + list(session.dirty):
+        changes.extend(_changes_for(session, obj, deleted=False))
+    for obj in list(session.deleted):
+        changes.extend(_changes_for(session, obj, deleted=True))
+
+@event.listens_for(Session, "after_commit")
+def _apply_completion_changes(session: Session) -> None:
+    changes = session.info.pop("completion_changes", None)
+    slot = _slot_for(session) if changes else None
+    if slot is None:
+        return
+    with _slots_lock:
+        index = slot.index
+        if slot.rebuilding:
+            slot.replay.extend(changes)
+    if index is None:
+        return
+    for change in changes:
+        _apply(index, change)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_completion_changes(session: Session) -> None:
+    session.info.pop("completion_changes", None)
@@ -0,0 +1,354 @@
+from sqlalchemy import event, func, or_, literal, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, Query
+from datetime import datetime, timedelta
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+import heapq
+import logging
+import re
+import threading
+
+from ..models.file import File
+from ..models.message import Message
+from ..models.channel import Channel, channel_members
+
+logger = logging.getLogger(__name__)
+
+# Minimum share of the query's trigrams a field must contain to match.
+# 0.3 lets a single transposition or typo in a word through ("reprot" still
+# matches "report") while rejecting unrelated text.
+SIMILARITY_THRESHOLD = 0.3
+# Candidates taken from the in-process index, and how many of them are
+# checked against the ACL filter in SQL per round trip
+MAX_CANDIDATES = 1000
+CANDIDATE_BATCH = 200
+
+# Searched columns and their weights; a match in the name counts more than
+# one in the description or file type
+FILE_FIELDS = {"filename": 1.0, "file_type": 0.8}
+CHANNEL_FIELDS = {"name": 1.0, "description": 0.8}
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+def trigrams(value: Optional[str]) -> Set[str]:
+    """Trigrams of a string, extracted the way pg_trgm does it
+
+    Each lower-cased word is padded with two spaces in front and one behind,
+    so short words and word starts carry extra weight.
+    """
+    grams = set()
+    for word in _WORD_RE.findall((value or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def similarity(query_grams: Set[str], value: Optional[str]) -> float:
+    """Share of the query's trigrams found in the value (0..1)"""
+    if not query_grams:
+        return 0.0
+    return len(query_grams & trigrams(value)) / len(query_grams)
+
+def field_score(query_grams: Set[str], values: Dict[str, Optional[str]], weights: Dict[str, float]) -> float:
+    return max(weights[name] * similarity(query_grams, values.get(name)) for name in weights)
+
+class FileHit(NamedTuple):
+    file: File
+    channel_id: int
+    channel_name: str
+    score: float
+
+class ChannelHit(NamedTuple):
+    channel: Channel
+    member_count: int
+    score: float
+
+def _files_query(db: Session, channel_ids, options: Optional[list]) -> Query:
+    """Files in accessible channels, with their channel for the response"""
+    return (
+        db.query(
+            File,
+            Message.channel_id.label("channel_id"),
+            Channel.name.label("channel_name")
+        )
+        .options(*(options or []))
+        .select_from(File)
+        .join(Message, File.message_id == Message.id)
+        .join(Channel, Message.channel_id == Channel.id)
+        .filter(Message.channel_id.in_(channel_ids))
+    )
+
+def _channels_query(db: Session, channel_ids, options: Optional[list]) -> Query:
+    """Accessible channels with their member count"""
+    return (
+        db.query(
+            Channel,
+            func.count(channel_members.c.user_id).label("member_count")
+        )
+        .options(*(options or []))
+        .outerjoin(channel_members)
+        .filter(Channel.id.in_(channel_ids))
+        .group_by(Channel.id)
+    )
+
+class TrigramBackend:
+    """Common interface for typo-tolerant file and channel search"""
+
+    name = "base"
+
+    def search_files(self, db: Session, query: str, channel_ids, skip: int = 0, limit: int = 20, options: Optional[list] = None) -> List[FileHit]:
+        raise NotImplementedError
+
+    def search_channels(self, db: Session, query: str, channel_ids, skip: int = 0, limit: int = 20, options: Optional[list] = None) -> List[ChannelHit]:
+        raise NotImplementedError
+
+class PostgresTrigram(TrigramBackend):
+    """pg_trgm ``word_similarity`` served by GIN ``gin_trgm_ops`` indexes
+
+    The ``<%`` operator is what lets PostgreSQL use the indexes; its cut-off
+    is set to ``SIMILARITY_THRESHOLD`` for the current transaction.
+    """
+
+    name = "pg_trgm"
+
+    def _prepare(self, db: Session) -> None:
+        db.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+            {"threshold": str(SIMILARITY_THRESHOLD)}
+        )
+
+    def _match_and_score(self, query: str, columns: Dict[object, float]):
+        match = or_(*(literal(query).op("<%")(column) for column in columns))
+        score = func.greatest(*(
+            func.word_similarity(query, func.coalesce(column, "")) * weight
+            for column, weight in columns.items()
+        ))
+        return match, score
+
+    def search_files(self, db, query, channel_ids, skip=0, limit=20, options=None):
+        self._prepare(db)
+        match, score = self._match_and_score(query, {getattr(File, n): w for n, w in FILE_FIELDS.items()})
+        rows = (
+            _files_query(db, channel_ids, options)
+            .add_columns(score.label("score"))
+            .filter(match)
+            .order_by(score.desc(), File.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        return [FileHit(row.File, row.channel_id, row.channel_name, float(row.score)) for row in rows]
+
+    def search_channels(self, db, query, channel_ids, skip=0, limit=20, options=None):
+        self._prepare(db)
+        match, score = self._match_and_score(query, {getattr(Channel, n): w for n, w in CHANNEL_FIELDS.items()})
+        rows = (
+            _channels_query(db, channel_ids, options)
+            .add_columns(score.label("score"))
+            .filter(match)
+            .order_by(score.desc(), Channel.name)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        return [ChannelHit(row.Channel, row.member_count, float(row.score)) for row in rows]
+
+class TrigramIndex:
+    """In-process trigram index over some text columns of one table
+
+    Keeps a posting set of row IDs per (column, trigram), and the channel
+    each row belongs to, so candidates are limited to the caller's channels
+    before they are ranked. The index catches up with rows inserted or
+    updated since the last sync before each search, and every candidate is
+    re-scored against the current row, so deleted or edited rows never
+    produce wrong results. Deleted rows are dropped when a search finds
+    them gone, or when this process commits their deletion.
+    """
+
+    def __init__(self, model, fields: Dict[str, float], scope_column, join: Optional[tuple] = None):
+        self.model = model
+        self.fields = fields
+        self.scope_column = scope_column
+        self.join = join
+        self._lock = threading.Lock()
+        self._postings: Dict[Tuple[str, str], Set[int]] = {}
+        self._row_grams: Dict[int, Dict[str, Set[str]]] = {}
+        self._scopes: Dict[int, Optional[int]] = {}
+        self.max_id = 0
+        self.synced_at: Optional[datetime] = None
+
+    def _unindex_row(self, row_id: int) -> None:
+        for name, grams in self._row_grams.pop(row_id, {}).items():
+            for gram in grams:
+                posting = self._postings[(name, gram)]
+                posting.discard(row_id)
+                if not posting:
+                    del self._postings[(name, gram)]
+        self._scopes.pop(row_id, None)
+
+    def _index_row(self, row_id: int, scope: Optional[int], values: Dict[str, Optional[str]]) -> None:
+        self._unindex_row(row_id)
+        row_grams = {name: trigrams(values[name]) for name in self.fields}
+        for name, grams in row_grams.items():
+            for gram in grams:
+                self._postings.setdefault((name, gram), set()).add(row_id)
+        self._row_grams[row_id] = row_grams
+        self._scopes[row_id] = scope
+        self.max_id = max(self.max_id, row_id)
+
+    def remove(self, row_ids) -> None:
+        with self._lock:
+            for row_id in row_ids:
+                self._unindex_row(row_id)
+
+    def sync(self, db: Session) -> None:
+        # Rows updated while the previous sync ran are picked up again
+        started = datetime.utcnow() - timedelta(seconds=1)
+        columns = [getattr(self.model, name) for name in self.fields]
+        query = db.query(self.model.id, self.scope_column.label("scope"), *columns)
+        if self.join is not None:
+            query = query.outerjoin(*self.join)
+        # Separate range scans of the primary key and the updated_at index
+        rows = query.filter(self.model.id > self.max_id).all()
+        if self.synced_at is not None:
+            rows += query.filter(self.model.updated_at > self.synced_at, self.model.id <= self.max_id).all()
+        with self._lock:
+            for row in rows:
+                self._index_row(row.id, row.scope, {name: getattr(row, name) for name in self.fields})
+            self.synced_at = started
+
+    def candidates(self, query_grams: Set[str], channel_ids, limit: Optional[int] = None) -> List[int]:
+        """IDs of the best-matching rows in the given channels, best first"""
+        limit = limit or MAX_CANDIDATES
+        allowed = set(channel_ids)
+        scores: Dict[int, float] = {}
+        with self._lock:
+            for name, weight in self.fields.items():
+                counts = Counter()
+                for gram in query_grams:
+                    counts.update(self._postings.get((name, gram), ()))
+                # Fewer shared trigrams than this cannot reach the threshold
+                needed = SIMILARITY_THRESHOLD * len(query_grams) / weight
+                for row_id, count in counts.items():
+                    if count >= needed and self._scopes.get(row_id) in allowed:
+                        score = weight * count / len(query_grams)
+                        if score > scores.get(row_id, 0.0):
+                            scores[row_id] = score
+        return [row_id for row_id, _ in heapq.nlargest(limit, scores.items(), key=lambda item: item[1])]
+
+def _match_columns(model, fields: Dict[str, float]) -> list:
+    # Selected separately so scoring works whatever the fieldset loads
+    return [getattr(model, name).label(f"match_{name}") for name in fields]
+
+def _match_values(row, fields: Dict[str, float]) -> Dict[str, Optional[str]]:
+    return {name: getattr(row, f"match_{name}") for name in fields}
+
+class PythonTrigram(TrigramBackend):
+    """Pure-Python trigram search for databases without pg_trgm
+
+    Candidates come from the index best first, limited to the caller's
+    channels, and are checked against the ACL filter in batches, stopping
+    once a page of results is filled.
+    """
+
+    name = "python"
+
+    def __init__(self):
+        self.files = TrigramIndex(File, FILE_FIELDS, Message.channel_id, (Message, File.message_id == Message.id))
+        self.channels = TrigramIndex(Channel, CHANNEL_FIELDS, Channel.id)
+
+    def _search(self, db: Session, index: TrigramIndex, query: str, channel_ids, fetch: Callable[[List[int]], list], row_id, make_hit, skip: int, limit: int, tiebreak) -> list:
+        grams = trigrams(query)
+        index.sync(db)
+        candidates = index.candidates(grams, channel_ids)
+        hits = []
+        for start in range(0, len(candidates), CANDIDATE_BATCH):
+            batch = candidates[start:start + CANDIDATE_BATCH]
+            found = set()
+            for row in fetch(batch):
+                found.add(row_id(row))
+                # Re-scored against the current row, in case it changed since the sync
+                score = field_score(grams, _match_values(row, index.fields), index.fields)
+                if score >= SIMILARITY_THRESHOLD:
+                    hits.append(make_hit(row, score))
+            # Candidates are all in accessible channels, so missing ones were deleted
+            index.remove(set(batch) - found)
+            if len(hits) >= skip + limit:
+                break
+        hits.sort(key=lambda hit: (-hit.score, tiebreak(hit)))
+        return hits[skip:skip + limit]
+
+    def search_files(self, db, query, channel_ids, skip=0, limit=20, options=None):
+        base = _files_query(db, channel_ids, options).add_columns(*_match_columns(File, FILE_FIELDS))
+        return self._search(
+            db,
+            self.files,
+            query,
+            channel_ids,
+            lambda ids: base.filter(File.id.in_(ids)).all(),
+            lambda row: row.File.id,
+            lambda row, score: FileHit(row.File, row.channel_id, row.channel_name, score),
+            skip,
+            limit,
+            lambda hit: -hit.file.id
+        )
+
+    def search_channels(self, db, query, channel_ids, skip=0, limit=20, options=None):
+        base = _channels_query(db, channel_ids, options).add_columns(*_match_columns(Channel, CHANNEL_FIELDS))
+        return self._search(
+            db,
+            self.channels,
+            query,
+            channel_ids,
+            lambda ids: base.filter(Channel.id.in_(ids)).all(),
+            lambda row: row.Channel.id,
+            lambda row, score: ChannelHit(row.Channel, row.member_count, score),
+            skip,
+            limit,
+            lambda hit: hit.channel.name or ""
+        )
+
+_backends: Dict[Engine, TrigramBackend] = {}
+
+def _detect_backend(db: Session) -> TrigramBackend:
+    engine = db.get_bind()
+    if engine.dialect.name == "postgresql":
+        installed = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+        if installed:
+            return PostgresTrigram()
+        logger.warning("pg_trgm is not installed, falling back to in-process trigram search")
+    return PythonTrigram()
+
+def get_trigram_backend(db: Session) -> TrigramBackend:
+    """Get the trigram search backend for the session's database, detected once per engine"""
+    engine = db.get_bind()
+    if engine not in _backends:
+        _backends[engine] = _detect_backend(db)
+        logger.info(f"Using {_backends[engine].name} trigram search backend")
+    return _backends[engine]
+
+# --- Deletions ------------------------------------------------------------------
+#
+# Rows deleted by this process leave the in-process indexes once the
+# transaction commits; those deleted elsewhere are dropped by the next
+# search that finds them gone.
+
+@event.listens_for(Session, "after_flush")
+def _collect_trigram_deletions(session: Session, flush_context) -> None:
+    deleted = session.info.setdefault("trigram_deletions", [])
+    for obj in session.deleted:
+        if isinstance(obj, (File, Channel)):
+            deleted.append((type(obj), obj.id))
+
+@event.listens_for(Session, "after_commit")
+def _apply_trigram_deletions(session: Session) -> None:
+    deleted = session.info.pop("trigram_deletions", None)
+    backend = _backends.get(session.get_bind()) if deleted else None
+    if not isinstance(backend, PythonTrigram):
+        return
+    backend.files.remove([row_id for model, row_id in deleted if model is File])
+    backend.channels.remove([row_id for model, row_id in deleted if model is Channel])
+
+@event.listens_for(Session, "after_rollback")
+def _discard_trigram_deletions(session: Session) -> None:
+    session.info.pop("trigram_deletions", None)
@@ -0,0 +1,180 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, NamedTuple, Optional
+from datetime import datetime, timedelta, UTC
+import json
+import logging
+import os
+
+from ..models.file import File
+from ..models.upload_blob import UploadBlob
+from .file_content import save_file_chunks
+
+logger = logging.getLogger(__name__)
+
+class ReleasedBlob(NamedTuple):
+    storage_path: str
+    vector_ids: Dict[str, List[str]]
+
+def blob_filename(content_hash: str, extension: str) -> str:
+    """Name of the stored copy of some content under the upload directory"""
+    return f"{content_hash}{extension}"
+
+def store_upload(
+    db: Session,
+    temp_path: str,
+    upload_dir: str,
+    content_hash: str,
+    extension: str,
+    file_size: int
+) -> UploadBlob:
+    """Take a reference to some content and move a hashed upload into storage
+
+    The temporary file replaces the stored copy of the same content, if
+    any, so the directory holds one file per distinct content. The
+    reference is part of the caller's transaction and is taken before the
+    file is moved: it locks the blob row, so ``collect_upload`` cannot
+    remove the stored copy from under it.
+    """
+    storage_path = blob_filename(content_hash, extension)
+    updated = (
+        db.query(UploadBlob)
+        .filter(UploadBlob.content_hash == content_hash)
+        .update({UploadBlob.ref_count: UploadBlob.ref_count + 1}, synchronize_session=False)
+    )
+    if not updated:
+        try:
+            with db.begin_nested():
+                db.add(UploadBlob(
+                    content_hash=content_hash,
+                    storage_path=storage_path,
+                    file_size=file_size,
+                    ref_count=1
+                ))
+        except IntegrityError:
+            # Inserted by a concurrent upload of the same content
+            db.query(UploadBlob).filter(UploadBlob.content_hash == content_hash).update(
+                {UploadBlob.ref_count: UploadBlob.ref_count + 1}, synchronize_session=False
+            )
+    os.replace(temp_path, os.path.join(upload_dir, storage_path))
+    return (
+        db.query(UploadBlob)
+        .populate_existing()
+        .filter(UploadBlob.content_hash == content_hash)
+        .one()
+    )
+
+def release_upload(db: Session, content_hash: str) -> None:
+    """Drop a file's reference to its content, as part of the caller's transaction
+
+    Once that has committed, ``collect_upload`` removes the content if no
+    file references it any more.
+    """
+    db.query(UploadBlob).filter(UploadBlob.content_hash == content_hash).update(
+        {UploadBlob.ref_count: UploadBlob.ref_count - 1}, synchronize_session=False
+    )
+
+def collect_upload(db: Session, content_hash: str, upload_dir: str) -> Optional[ReleasedBlob]:
+    """Remove content that no file references, and commit
+
+    The row is deleted only while its count is zero, which locks it, and
+    the stored copy is unlinked before that commits, so an upload taking a
+    new reference either waits and then stores the content afresh, or got
+    its reference in first and the copy stays. Returns the removed blob,
+    whose vectors the caller deletes.
+    """
+    blob = db.query(UploadBlob).filter(UploadBlob.content_hash == content_hash).first()
+    if blob is None:
+        return None
+    released = ReleasedBlob(blob.storage_path, json.loads(blob.vector_ids) if blob.vector_ids else {})
+    removed = (
+        db.query(UploadBlob)
+        .filter(UploadBlob.content_hash == content_hash, UploadBlob.ref_count <= 0)
+        .delete(synchronize_session=False)
+    )
+    if not removed:
+        db.rollback()
+        return None
+    stored = os.path.join(upload_dir, released.storage_path)
+    if os.path.exists(stored):
+        os.remove(stored)
+    db.commit()
+    return released
+
+def reuse_processed_content(db: Session, file: File) -> bool:
+    """Give a file the description and chunks derived earlier from the same content
+
+    Returns False when the content has not been processed yet.
+    """
+    if not file.content_hash:
+        return False
+    blob = (
+        db.query(UploadBlob)
+        .filter(UploadBlob.content_hash == file.content_hash, UploadBlob.processed_at.isnot(None))
+        .first()
+    )
+    if blob is None:
+        return False
+    file.description = blob.description
+    if blob.chunks:
+        save_file_chunks(db, file, json.loads(blob.chunks))
+    logger.info(f"Reused processed content {file.content_hash[:12]} for file {file.id}")
+    return True
+
+def claim_processing(db: Session, content_hash: str, stale_after: timedelta) -> bool:
+    """Claim the processing of some content for one file, as part of the caller's transaction
+
+    The conditional update locks the blob row, so of two files with the
+    same content only one gets the claim; the other waits until the
+    content is processed, or the claim is released or older than
+    ``stale_after`` (its process died). Returns False while another file
+    holds it, or once the content is processed.
+    """
+    now = datetime.now(UTC)
+    claimed = (
+        db.query(UploadBlob)
+        .filter(
+            UploadBlob.content_hash == content_hash,
+            UploadBlob.processed_at.is_(None),
+            or_(UploadBlob.processing_started_at.is_(None), UploadBlob.processing_started_at < now - stale_after)
+        )
+        .update({UploadBlob.processing_started_at: now}, synchronize_session=False)
+    )
+    if claimed:
+        return True
+    # Content without a blob row has no other file to wait for
+    return db.query(UploadBlob.content_hash).filter(UploadBlob.content_hash == content_hash).first() is None
+
+def release_processing(db: Session, content_hash: str) -> None:
+    """Give up the claim of a failed processing, so a waiting file runs it again"""
+    db.query(UploadBlob).filter(
+        UploadBlob.content_hash == content_hash, UploadBlob.processed_at.is_(None)
+    ).update({UploadBlob.processing_started_at: None}, synchronize_session=False)
+
+def remember_processed_content(
+    db: Session,
+    content_hash: str,
+    description: Optional[str],
+    chunks: Optional[List[str]],
+    vector_ids: Dict[str, List[str]]
+) -> bool:
+    """Keep what processing derived from some content for later duplicates
+
+    Returns False when the vectors are not kept: every file with the
+    content was deleted meanwhile, or another run, which took over a stale
+    claim, stored its outcome first. The caller then deletes them.
+    """
+    blob = (
+        db.query(UploadBlob)
+        .filter(UploadBlob.content_hash == content_hash)
+        .with_for_update()
+        .first()
+    )
+    if blob is None or blob.processed_at is not None:
+        return False
+    blob.description = description
+    blob.chunks = json.dumps(chunks) if chunks else None
+    blob.vector_ids = json.dumps(vector_ids) if vector_ids else None
+    blob.processed_at = datetime.now(UTC)
+    return True
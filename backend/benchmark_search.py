@@ -0,0 +1,230 @@
+"""Benchmark search: full-text and trigram backends vs. the old ILIKE scans.
+
+Seeds a synthetic corpus (one million messages by default) into the given
+database, then times a set of queries against the ILIKE scan, the database's
+full-text index and the in-process inverted index. File search is timed the
+same way, comparing the old ILIKE scan with trigram search for exact and
+misspelled file names. Finally the search-as-you-type completion index is
+timed for every prefix of a few words, as a user would type them.
+
+    python benchmark_search.py --database-url sqlite:///search_bench.db
+    python benchmark_search.py --database-url postgresql://... --messages 1000000
+
+Seeding is skipped when the database already holds enough messages.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///search_bench.db")
+
+from sqlalchemy import create_engine, func, insert, or_, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import User, Channel, Message, File
+from app.models.bot_message_score import BotMessageScore  # noqa: F401 - registers the mapper
+from app.services.fulltext import IlikeFullText, get_fulltext_backend
+from app.services.inverted_index import InvertedIndex
+from app.services.trigram import get_trigram_backend
+from app.services.suggest import CompletionIndex
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "po", "da", "fe", "gu", "hi", "ja"]
+EXTENSIONS = [("pdf", "application/pdf"), ("png", "image/png"), ("txt", "text/plain"), ("csv", "text/csv")]
+CHANNELS = 20
+BATCH_SIZE = 10000
+
+def build_vocabulary(rng: random.Random, size: int = 5000) -> list:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+def seed(session_factory, total: int, vocabulary: list, rng: random.Random) -> None:
+    db = session_factory()
+    try:
+        existing = db.query(func.count(Message.id)).scalar()
+        if existing >= total:
+            print(f"Corpus already has {existing} messages, skipping seeding")
+            return
+
+        user = db.query(User).filter(User.username == "bench").first()
+        if user is None:
+            user = User(username="bench", auth0_id="bench")
+            db.add(user)
+            db.flush()
+        channel_ids = [c.id for c in db.query(Channel.id).limit(CHANNELS)]
+        while len(channel_ids) < CHANNELS:
+            channel = Channel(name=f"bench-{len(channel_ids)}", created_by_id=user.id)
+            db.add(channel)
+            db.flush()
+            channel_ids.append(channel.id)
+        db.commit()
+
+        # Zipf-like word frequencies, as in natural text
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+        started = time.perf_counter()
+        for offset in range(existing, total, BATCH_SIZE):
+            rows = [
+                {
+                    "content": " ".join(rng.choices(vocabulary, weights=weights, k=rng.randint(5, 30))),
+                    "sender_id": user.id,
+                    "channel_id": rng.choice(channel_ids),
+                }
+                for _ in range(min(BATCH_SIZE, total - offset))
+            ]
+            db.execute(insert(Message), rows)
+            db.commit()
+            print(f"\rSeeded {offset + len(rows)}/{total} messages", end="", flush=True)
+        print(f"\nSeeding took {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+def seed_files(session_factory, total: int, vocabulary: list, rng: random.Random) -> None:
+    db = session_factory()
+    try:
+        existing = db.query(func.count(File.id)).scalar()
+        if existing >= total:
+            print(f"Corpus already has {existing} files, skipping seeding")
+            return
+
+        user_id = db.query(User.id).filter(User.username == "bench").scalar()
+        message_ids = [row.id for row in db.query(Message.id).order_by(Message.id).limit(total)]
+        for offset in range(existing, total, BATCH_SIZE):
+            rows = []
+            for message_id in message_ids[offset:offset + BATCH_SIZE]:
+                extension, file_type = rng.choice(EXTENSIONS)
+                filename = "_".join(rng.choices(vocabulary, k=rng.randint(1, 3))) + f".{extension}"
+                rows.append({
+                    "filename": filename,
+                    "file_type": file_type,
+                    "file_path": f"/files/{filename}",
+                    "file_size": rng.randint(1, 10_000_000),
+                    "message_id": message_id,
+                    "uploaded_by_id": user_id,
+                })
+            db.execute(insert(File), rows)
+            db.commit()
+            print(f"\rSeeded {offset + len(rows)}/{total} files", end="", flush=True)
+        print()
+    finally:
+        db.close()
+
+def ilike_file_search(db, query: str, channel_ids, limit: int = 20) -> list:
+    """File search as it was before trigram indexes"""
+    return (
+        db.query(File)
+        .join(Message, File.message_id == Message.id)
+        .filter(
+            Message.channel_id.in_(channel_ids),
+            or_(File.filename.ilike(f"%{query}%"), File.file_type.ilike(f"%{query}%"))
+        )
+        .order_by(File.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+def misspell(word: str, rng: random.Random) -> str:
+    """Swap two adjacent letters"""
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+def time_query(session_factory, search, query: str, runs: int) -> tuple:
+    timings = []
+    hits = []
+    channel_ids = select(Channel.id)
+    for _ in range(runs):
+        db = session_factory()
+        try:
+            started = time.perf_counter()
+            hits = search(db, query, channel_ids, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            db.close()
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return statistics.median(timings), p95, len(hits)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.environ["DATABASE_URL"])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+
+    vocabulary = build_vocabulary(rng)
+    seed(session_factory, args.messages, vocabulary, rng)
+    seed_files(session_factory, args.files, vocabulary, rng)
+
+    common, mid, rare = vocabulary[0], vocabulary[len(vocabulary) // 10], vocabulary[-1]
+    queries = {
+        "common term": common,
+        "rare term": rare,
+        "two terms": f"{mid} {rare}",
+        "phrase": f'"{common} {mid}"',
+        "prefix": f"{mid[:4]}*",
+        "boolean": f"({mid} OR {rare}) -{common}",
+    }
+
+    db = session_factory()
+    try:
+        fulltext = get_fulltext_backend(db)
+        memory = InvertedIndex()
+        started = time.perf_counter()
+        memory.sync(db)
+        print(f"Built inverted index over {memory.document_count} messages in {time.perf_counter() - started:.1f}s")
+        trigram = get_trigram_backend(db)
+        started = time.perf_counter()
+        trigram.search_files(db, "warmup", select(Channel.id))
+        print(f"Prepared {trigram.name} trigram search in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+    print(f"\n{'query':<14} {'backend':<11} {'median ms':>10} {'p95 ms':>10} {'hits':>5}")
+    for label, query in queries.items():
+        for backend in (IlikeFullText(), fulltext, memory):
+            median, p95, hits = time_query(session_factory, backend.search, query, args.runs)
+            print(f"{label:<14} {backend.name:<11} {median:>10.1f} {p95:>10.1f} {hits:>5}")
+
+    file_queries = {
+        "file name": f"{mid}.pdf",
+        "file typo": misspell(mid, rng),
+        "file type": "image/png",
+    }
+    file_backends = {"ilike": ilike_file_search, trigram.name: trigram.search_files}
+    print(f"\n{'query':<14} {'backend':<11} {'median ms':>10} {'p95 ms':>10} {'hits':>5}")
+    for label, query in file_queries.items():
+        for name, search in file_backends.items():
+            median, p95, hits = time_query(session_factory, search, query, args.runs)
+            print(f"{label:<14} {name:<11} {median:>10.1f} {p95:>10.1f} {hits:>5}")
+
+    db = session_factory()
+    try:
+        started = time.perf_counter()
+        completions = CompletionIndex.build(db)
+        print(f"\nBuilt completion index in {time.perf_counter() - started:.1f}s")
+        user_id = db.query(User.id).scalar()
+    finally:
+        db.close()
+    timings = []
+    for word in (common, mid, rare, "user"):
+        for end in range(1, len(word) + 1):
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                completions.suggest(user_id, word[:end])
+                timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"Completions: median {statistics.median(timings):.2f} ms, p99 {p99:.2f} ms over {len(timings)} lookups")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,41 @@
 from fastapi.testclient import TestClient
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, UTC
 import pytest
-from unittest.mock import patch, MagicMock
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from langchain.storage import LocalFileStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from unittest.mock import AsyncMock, MagicMock
 from app.main import app
+from app.api.deps import get_ai_clients, get_current_user, get_session_factory
+from app.ai import bot_pipeline, profile_generator
+from app.api.v1 import ai_features
+from app.api.v1.websockets import manager
+from app.api.v1.reactions import update_bot_message_score
+from app.ai.embedding_cache import CachedEmbeddings
+from app.ai.faiss_store import FaissVectorStore
+from app.ai.context_packer import ContextSection, TokenCounter, pack_context, packing_stats
+from app.ai.context_generator import load_bot_scored_messages, load_conversation_context
+from app.ai.message_indexer import MessageIndexWorker, outbox_stats, vector_id
+from app.ai.profile_generator import analyze_activity_patterns, analyze_communication_style, analyze_file_patterns
+from app.ai.profile_refresher import ProfileRefresher
+from app.models.bot_message_score import BotMessageScore
+from app.models.channel import Channel
+from app.models.file import File
+from app.models.index_outbox import IndexOutbox
+from app.models.message import Message
+from app.models.reaction import Reaction
+from app.models.user import User
+from app.models.user_activity_stats import UserActivityStats
+from app.services.activity_stats import build_activity_stats
+from app.services.bot_scores import bot_score_cache
+from app.services.semantic import HashingEmbeddings
 
 client = TestClient(app)
 
@@ -15,34 +49,528 @@ def test_send_message_to_bot_unauthorized():
     response = client.post("/api/v1/ai/message", json={"message": "Hello"})
     assert response.status_code == 401
 
-@pytest.mark.asyncio
-@patch("app.api.v1.ai_features.OpenAIEmbeddings")
-@patch("app.api.v1.ai_features.PineconeVectorStore")
-@patch("app.api.v1.ai_features.ChatOpenAI")
-async def test_send_message_to_bot_authorized(mock_chat_openai, mock_vectorstore, mock_embeddings, authenticated_client):
-    """Test that authorized users can send messages and receive responses"""
-    # Mock the AI components
-    mock_retriever = MagicMock()
-    mock_vectorstore.return_value.as_retriever.return_value = mock_retriever
-    mock_retriever.invoke.return_value = [MagicMock(page_content="Test context")]
-    
-    mock_chat = MagicMock()
-    mock_chat_openai.return_value = mock_chat
-    mock_chat.invoke.return_value = MagicMock(content="Test response")
-
-    # Send request
-    response = authenticated_client.post(
-        "/api/v1/ai/message",
-        json={"message": "Hello"}
+@pytest.fixture
+def mock_ai_clients(test_user, test_db):
+    """Replace the shared AI clients with mocks, and sign in as the test user."""
+    clients = MagicMock()
+    retriever = MagicMock()
+    retriever.ainvoke = AsyncMock(return_value=[MagicMock(page_content="Test context", metadata={"message_id": "1"})])
+    clients.messages_store.as_retriever.return_value = retriever
+    clients.file_chunks_store.as_retriever.return_value = retriever
+    clients.file_descriptions_store.as_retriever.return_value = retriever
+
+    async def astream(prompt):
+        for token in ["Test", " resp", "onse"]:
+            yield MagicMock(content=token)
+    clients.bot_llm.astream = MagicMock(side_effect=astream)
+    app.dependency_overrides[get_ai_clients] = lambda: clients
+    app.dependency_overrides[get_current_user] = lambda: test_user
+    app.dependency_overrides[get_session_factory] = lambda: sessionmaker(bind=test_db.get_bind())
+    yield clients
+    app.dependency_overrides.pop(get_ai_clients, None)
+    app.dependency_overrides.pop(get_current_user, None)
+    app.dependency_overrides.pop(get_session_factory, None)
+
+def test_send_message_to_bot_authorized(test_client: TestClient, test_user_token: str, mock_ai_clients):
+    """Test that the bot answers through the shared AI clients instead of building its own"""
+    response = test_client.post(
+        "/api/ai/message",
+        json={"message": "Hello", "channel_id": 1},
+        headers={"Authorization": f"Bearer {test_user_token}"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["response"] == "Test response"
+    mock_ai_clients.bot_llm.astream.assert_called_once()
+    mock_ai_clients.messages_store.as_retriever.assert_called_once()
+
+    prompt = mock_ai_clients.bot_llm.astream.call_args.args[0]
+    assert "Test context" in prompt
+
+def test_send_message_to_bot_streams_deltas(monkeypatch, test_client: TestClient, test_user_token: str, mock_ai_clients):
+    """Test that the reply reaches the channel as deltas before the saved message"""
+    frames = []
+    async def record(channel_id, message, exclude_user_id=None):
+        frames.append(message)
+    monkeypatch.setattr(manager, "broadcast_to_channel", record)
+
+    response = test_client.post(
+        "/api/ai/message",
+        json={"message": "Hello", "channel_id": 1},
+        headers={"Authorization": f"Bearer {test_user_token}"}
     )
 
-    # Verify response
     assert response.status_code == 200
-    assert response.json() == {"response": "Test response"}
-
-    print(response)
-    # Verify mocks were called correctly
-    mock_embeddings.assert_called_once()
-    mock_vectorstore.assert_called_once()
-    mock_chat_openai.assert_called_once_with(temperature=0.7, model_name="gpt-4o-mini")
-    mock_chat.invoke.assert_called_once() 
\ No newline at end of file
+    deltas = [frame for frame in frames if frame["type"] == "BOT_MESSAGE_DELTA"]
+    final = next(frame for frame in frames if frame["type"] == "NEW_MESSAGE")
+    # The first token is sent on its own, the rest arrive within the coalescing interval
+    assert [frame["delta"] for frame in deltas] == ["Test", " response"]
+    assert [frame["sequence"] for frame in deltas] == [0, 1]
+    assert frames.index(deltas[-1]) < frames.index(final)
+    assert final["streamId"] == deltas[0]["streamId"]
+    assert final["message"]["content"] == "Test response"
+
+def test_bot_reply_cancelled_when_client_disconnects():
+    """Test that generation stops once the waiting client has gone"""
+    async def scenario():
+        generation = asyncio.ensure_future(asyncio.sleep(10))
+        http_request = MagicMock()
+        http_request.is_disconnected = AsyncMock(side_effect=[False, True])
+        cancelled = await ai_features._cancel_on_disconnect(http_request, generation)
+        await asyncio.sleep(0)
+        return cancelled, generation.cancelled()
+
+    assert asyncio.run(scenario()) == (True, True)
+
+def test_bot_pipeline_runs_stages_concurrently(monkeypatch, test_db, test_user, test_other_user):
+    """Test that context stages overlap and that a stage over its timeout is left out"""
+    monkeypatch.setattr(bot_pipeline, "BOT_STAGE_TIMEOUT", 0.5)
+
+    def store(delay, content):
+        async def ainvoke(query):
+            await asyncio.sleep(delay)
+            return [MagicMock(page_content=content, metadata={"message_id": content, "filename": content})]
+        retriever = MagicMock()
+        retriever.ainvoke = ainvoke
+        vector_store = MagicMock()
+        vector_store.as_retriever.return_value = retriever
+        return vector_store
+
+    clients = MagicMock()
+    clients.messages_store = store(0.3, "message hit")
+    clients.file_chunks_store = store(2.0, "slow chunk")
+    clients.file_descriptions_store = store(0.3, "description hit")
+
+    started = time.perf_counter()
+    result = asyncio.run(bot_pipeline.gather_bot_context(
+        clients, sessionmaker(bind=test_db.get_bind()), "hello", test_user, test_other_user
+    ))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0
+    assert "message hit" in result.context and "description hit" in result.context
+    assert "slow chunk" not in result.context
+    assert set(result.timings) == {"messages", "file_chunks", "file_descriptions", "conversation", "scored_messages"}
+    assert set(result.tokens) == {"messages", "file_descriptions"}
+
+class CountingEmbeddings(Embeddings):
+    """Fake provider that records every text it is asked to embed"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(self.delay)
+        return [[float(len(text)), 1.0] for text in texts]
+
+def test_embedding_cache_shares_concurrent_and_repeated_requests():
+    """Test that concurrent and repeated embeddings of one text make a single provider call"""
+    provider = CountingEmbeddings(delay=0.2)
+    embeddings = CachedEmbeddings(provider, "test-model")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        vectors = list(pool.map(embeddings.embed_query, ["same question"] * 3))
+    assert vectors == [[13.0, 1.0]] * 3
+    assert provider.calls == [["same question"]]
+
+    async def embed_concurrently():
+        return await asyncio.gather(embeddings.aembed_query("other  question"), embeddings.aembed_query("other question"))
+    assert asyncio.run(embed_concurrently()) == [[15.0, 1.0]] * 2
+    assert len(provider.calls) == 2
+
+    # Whitespace is normalized, and documents share entries with queries
+    assert embeddings.embed_documents([" same   question ", "new", "new"]) == [[13.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+    assert provider.calls[-1] == ["new"]
+    assert embeddings.stats()["misses"] == 3
+
+def test_embedding_cache_lru_and_disk_store(tmp_path):
+    """Test eviction from memory and that persisted embeddings survive a new cache"""
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, "test-model", max_entries=1, store=LocalFileStore(tmp_path))
+    embeddings.embed_query("first")
+    embeddings.embed_query("second")
+    assert embeddings.stats()["entries"] == 1
+
+    # Evicted from memory, still on disk
+    embeddings.embed_query("first")
+    assert embeddings.stats()["disk_hits"] == 1
+
+    restarted = CachedEmbeddings(provider, "test-model", store=LocalFileStore(tmp_path))
+    assert restarted.embed_query("second") == [6.0, 1.0]
+    assert len(provider.calls) == 2
+
+def test_index_outbox_written_with_messages_and_drained_in_one_batch(test_db, test_user):
+    """Test that message writes queue outbox entries that one batch indexes or removes"""
+    channel = Channel(name="indexing", created_by_id=test_user.id, members=[test_user])
+    test_db.add(channel)
+    test_db.commit()
+    messages = [Message(content=f"note {i}", channel_id=channel.id, sender_id=test_user.id) for i in range(3)]
+    test_db.add_all(messages)
+    test_db.commit()
+    messages[0].content = "note 0, edited"
+    test_db.commit()
+    test_db.delete(messages[1])
+    test_db.commit()
+
+    entries = test_db.query(IndexOutbox).order_by(IndexOutbox.id).all()
+    assert [(e.message_id, e.operation) for e in entries] == [
+        (messages[0].id, "upsert"), (messages[1].id, "upsert"), (messages[2].id, "upsert"),
+        (messages[0].id, "upsert"), (messages[1].id, "delete"),
+    ]
+
+    store = MagicMock()
+    store.aadd_documents = AsyncMock()
+    worker = MessageIndexWorker(sessionmaker(bind=test_db.get_bind()), MagicMock(messages_store=store), batch_size=10)
+    assert asyncio.run(worker.drain_once()) == 5
+
+    store.aadd_documents.assert_awaited_once()
+    documents = store.aadd_documents.await_args.args[0]
+    ids = store.aadd_documents.await_args.kwargs["ids"]
+    assert dict(zip(ids, (d.page_content for d in documents))) == {
+        vector_id(messages[0].id): "note 0, edited",
+        vector_id(messages[2].id): "note 2",
+    }
+    assert documents[0].metadata["channel"] == "indexing"
+    store.delete.assert_called_once_with(ids=[vector_id(messages[1].id)])
+    assert test_db.query(IndexOutbox).count() == 0
+    assert worker.stats()["indexed"] == 2
+
+def test_index_outbox_retries_failed_batches_with_backoff(test_db, test_user):
+    """Test that a failed batch stays in the outbox until its retry is due"""
+    channel = Channel(name="retries", created_by_id=test_user.id, members=[test_user])
+    test_db.add(channel)
+    test_db.commit()
+    test_db.add(Message(content="will fail", channel_id=channel.id, sender_id=test_user.id))
+    test_db.commit()
+
+    store = MagicMock()
+    store.aadd_documents = AsyncMock(side_effect=RuntimeError("pinecone unavailable"))
+    worker = MessageIndexWorker(sessionmaker(bind=test_db.get_bind()), MagicMock(messages_store=store))
+    assert asyncio.run(worker.drain_once()) == 1
+    # Not due again until the backoff has passed
+    assert asyncio.run(worker.drain_once()) == 0
+
+    test_db.expire_all()
+    entry = test_db.query(IndexOutbox).one()
+    assert entry.attempts == 1 and entry.last_error == "pinecone unavailable"
+    stats = outbox_stats(test_db)
+    assert stats["pending"] == 1 and stats["retrying"] == 1
+    assert worker.stats()["failures"] == 1
+
+def test_faiss_store_filters_swaps_generations_and_replays_journal(tmp_path):
+    """Test that the FAISS store filters like Pinecone and keeps changes across rebuilds and restarts"""
+    directory = str(tmp_path / "messages")
+    embeddings = HashingEmbeddings()
+    store = FaissVectorStore(directory, embeddings)
+    store.add_texts(
+        ["deploy the backend tonight", "lunch at noon", "backend deploy failed"],
+        [{"is_bot": False, "channel_id": 1}, {"is_bot": False, "channel_id": 2}, {"is_bot": True, "channel_id": 1}],
+        ids=["m1", "m2", "m3"]
+    )
+    hits = store.similarity_search("backend deploy", k=3, filter={"is_bot": False})
+    assert [hit.page_content for hit in hits][0] == "deploy the backend tonight"
+    assert all(not hit.metadata["is_bot"] for hit in hits)
+
+    assert store.rebuild()
+    first_generation = store.stats()["generation"]
+    assert store.stats()["indexed"] == 3 and store.stats()["pending"] == 0
+
+    # Changes after the rebuild are searched on top of the index file
+    store.delete(ids=["m1"])
+    asyncio.run(store.aadd_documents([Document(page_content="backend deploy done", metadata={"is_bot": False, "channel_id": 1})], ids=["m4"]))
+    hits = store.similarity_search("backend deploy", k=5, filter={"channel_id": {"$in": [1]}})
+    assert {hit.page_content for hit in hits} == {"backend deploy failed", "backend deploy done"}
+    store.close()
+
+    reopened = FaissVectorStore(directory, embeddings)
+    assert reopened.stats()["generation"] == first_generation and reopened.stats()["pending"] == 2
+    hits = reopened.similarity_search("backend deploy", k=5, filter={"channel_id": 1})
+    assert {hit.page_content for hit in hits} == {"backend deploy failed", "backend deploy done"}
+
+    assert reopened.rebuild()
+    assert reopened.stats()["indexed"] == 3 and reopened.stats()["pending"] == 0
+    assert not os.path.exists(os.path.join(directory, f"gen-{first_generation:08d}"))
+    retriever = reopened.as_retriever(search_kwargs={"k": 1, "filter": {"is_bot": False}})
+    assert [hit.page_content for hit in asyncio.run(retriever.ainvoke("lunch at noon"))] == ["lunch at noon"]
+    reopened.close()
+
+def test_faiss_store_rebuilds_in_background(tmp_path):
+    """Test that reaching the rebuild threshold swaps in a new generation without blocking writes"""
+    store = FaissVectorStore(str(tmp_path / "chunks"), HashingEmbeddings(), rebuild_threshold=2)
+    store.add_texts(["first chunk", "second chunk"], ids=["c1", "c2"])
+    store.close()
+    assert store.stats()["rebuilds"] == 1
+    assert store.stats()["indexed"] == 2 and store.stats()["pending"] == 0
+    assert store.similarity_search("second chunk", k=1)[0].page_content == "second chunk"
+
+def test_activity_stats_follow_inserts_and_feed_profile_analysis(test_db, test_user):
+    """Test that inserts update the activity statistics that profile analysis reads"""
+    channel = Channel(name="activity", created_by_id=test_user.id, members=[test_user])
+    test_db.add(channel)
+    test_db.commit()
+    stats = build_activity_stats(test_db, test_user.id)
+    assert stats.message_count == 0 and analyze_activity_patterns(stats) == {}
+
+    day = datetime(2024, 3, 4)
+    test_db.add_all([
+        Message(content="ok 👍", channel_id=channel.id, sender_id=test_user.id, created_at=day.replace(hour=9)),
+        Message(content="```print('hi')```", channel_id=channel.id, sender_id=test_user.id, created_at=day.replace(hour=9, minute=30)),
+        Message(content="x" * 250, channel_id=channel.id, sender_id=test_user.id, created_at=day.replace(hour=20)),
+        Message(content="bot reply", channel_id=channel.id, sender_id=test_user.id, is_bot=True, created_at=day),
+        File(filename="a.png", file_type="image/png", file_size=1, file_path="/uploads/a.png", uploaded_by_id=test_user.id, created_at=day),
+        File(filename="b.pdf", file_type="application/pdf", file_size=1, file_path="/uploads/b.pdf", uploaded_by_id=test_user.id, created_at=day + timedelta(days=1)),
+        File(filename="c.png", file_type="image/png", file_size=1, file_path="/uploads/c.png", uploaded_by_id=test_user.id, created_at=day + timedelta(days=1)),
+    ])
+    test_db.commit()
+    test_db.refresh(stats)
+
+    assert stats.message_count == 3
+    assert analyze_activity_patterns(stats) == {
+        "most_active_period": "morning",
+        "active_hours": ["09:00-10:00", "20:00-21:00"]
+    }
+    style = analyze_communication_style(stats)
+    assert style["avg_message_length"] == (4 + 17 + 250) / 3
+    assert style["uses_code_blocks"] and style["uses_emojis"]
+    assert style["communication_style"] == "concise"
+    assert analyze_file_patterns(stats) == {
+        "common_file_types": ["image", "application"],
+        "total_files": 3,
+        "avg_files_per_day": 1.5,
+        "shares_files": True
+    }
+
+    # The running totals match a scan of the same history
+    incremental = {column.name: getattr(stats, column.name) for column in UserActivityStats.__table__.columns}
+    test_db.delete(stats)
+    test_db.commit()
+    rebuilt = build_activity_stats(test_db, test_user.id)
+    assert {column.name: getattr(rebuilt, column.name) for column in UserActivityStats.__table__.columns} == incremental
+
+def test_profile_refresher_regenerates_stale_profiles_of_users_with_bots(test_db, test_user):
+    """Test that the refresher regenerates due profiles of users with bots only"""
+    channel = Channel(name="profiles", created_by_id=test_user.id, members=[test_user])
+    test_db.add(channel)
+    test_db.commit()
+    test_db.add_all([
+        User(username="testuser<bot>", email="testuser.bot@sermo.ai", is_bot=True),
+        User(username="nobot", email="nobot@example.com"),
+        Message(content="deploying the backend today", channel_id=channel.id, sender_id=test_user.id),
+    ])
+    test_db.commit()
+    clients = MagicMock()
+    clients.profile_llm.ainvoke = AsyncMock(return_value=MagicMock(content="Ships backend changes"))
+    refresher = ProfileRefresher(sessionmaker(bind=test_db.get_bind()), clients)
+
+    assert asyncio.run(refresher.refresh_once()) == 1
+    test_db.refresh(test_user)
+    assert test_user.description == "Ships backend changes"
+    assert test_user.last_profile_generated is not None
+    clients.profile_llm.ainvoke.assert_awaited_once()
+
+    # Fresh profiles are not due, even with new activity
+    test_db.add(Message(content="and the frontend", channel_id=channel.id, sender_id=test_user.id))
+    test_db.commit()
+    assert asyncio.run(refresher.refresh_once()) == 0
+
+    # Once old, new activity makes them due again
+    test_user.last_profile_generated = datetime.now(UTC) - timedelta(hours=2)
+    test_db.commit()
+    assert asyncio.run(refresher.refresh_once()) == 1
+    assert clients.profile_llm.ainvoke.await_count == 2
+    test_db.refresh(test_user)
+    assert asyncio.run(refresher.refresh_once()) == 0
+
+def test_profile_refresher_reads_and_writes_off_the_event_loop(monkeypatch, test_db, test_user):
+    """Test that a profile refresh only awaits the LLM call on the event loop"""
+    test_db.add(User(username="testuser<bot>", email="testuser.bot@sermo.ai", is_bot=True))
+    test_db.commit()
+    threads = {}
+    def record(name, stage):
+        def recorded(*args):
+            threads[name] = threading.get_ident()
+            return stage(*args)
+        return recorded
+    monkeypatch.setattr(profile_generator, "build_profile_prompt", record("prompt", lambda db, user_id: "Describe testuser"))
+    monkeypatch.setattr(profile_generator, "save_profile", record("save", profile_generator.save_profile))
+    clients = MagicMock()
+    async def describe(prompt):
+        threads["llm"] = threading.get_ident()
+        return MagicMock(content="Writes tests")
+    clients.profile_llm.ainvoke = describe
+    refresher = ProfileRefresher(sessionmaker(bind=test_db.get_bind()), clients)
+
+    assert asyncio.run(refresher.refresh_once()) == 1
+    assert threads["llm"] == threading.get_ident()
+    assert threads["prompt"] != threads["llm"] and threads["save"] != threads["llm"]
+    test_db.refresh(test_user)
+    assert test_user.description == "Writes tests"
+
+def test_conversation_context_is_one_indexed_query(test_db, test_user, test_other_user):
+    """Test that a user's history with a bot comes from one query over the bot conversations index"""
+    bot = User(username="lain", email="lain@sermo.ai", is_bot=True)
+    channel = Channel(name="conversations", created_by_id=test_user.id, members=[test_user, test_other_user])
+    test_db.add_all([bot, channel])
+    test_db.commit()
+    base = datetime(2024, 5, 1, 12)
+    for i in range(7):
+        question = Message(content=f"question {i}", channel_id=channel.id, sender_id=test_user.id, created_at=base + timedelta(minutes=i))
+        test_db.add(question)
+        test_db.flush()
+        test_db.add(Message(content=f"answer {i}", channel_id=channel.id, sender_id=bot.id, is_bot=True, parent_id=question.id, created_at=base + timedelta(minutes=i, seconds=30)))
+    other = Message(content="someone else", channel_id=channel.id, sender_id=test_other_user.id, created_at=base + timedelta(hours=1))
+    test_db.add(other)
+    test_db.flush()
+    test_db.add(Message(content="answer to someone else", channel_id=channel.id, sender_id=bot.id, is_bot=True, parent=other, created_at=base + timedelta(hours=1)))
+    test_db.commit()
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(test_db.get_bind(), "before_cursor_execute", record)
+    try:
+        context = load_conversation_context(test_db, bot.id, test_user.id, test_user.username, "Lain")
+    finally:
+        event.remove(test_db.get_bind(), "before_cursor_execute", record)
+
+    assert len(statements) == 1
+    assert "answer to someone else" not in context and "question 1" not in context
+    assert context.index("testuser: question 2\nLain: answer 2") < context.index("testuser: question 6\nLain: answer 6")
+
+    # The same filter is answered from the partial index
+    compiled = str(test_db.query(Message.id).filter(
+        Message.sender_id == bot.id, Message.parent_sender_id == test_user.id, Message.is_bot == True
+    ).order_by(Message.created_at.desc()).statement.compile(
+        dialect=test_db.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    ))
+    plan = " ".join(str(row) for row in test_db.execute(text("EXPLAIN QUERY PLAN " + compiled)))
+    assert "ix_messages_bot_conversations" in plan
+
+def test_parent_sender_follows_reparented_replies(test_db, test_user, test_other_user):
+    """Test that parent_sender_id is recomputed when a reply moves to another parent"""
+    channel = Channel(name="threads", created_by_id=test_user.id, members=[test_user, test_other_user])
+    test_db.add(channel)
+    test_db.commit()
+    first = Message(content="first", sender_id=test_user.id, channel_id=channel.id)
+    second = Message(content="second", sender_id=test_other_user.id, channel_id=channel.id)
+    test_db.add_all([first, second])
+    test_db.commit()
+    reply = Message(content="reply", sender_id=test_user.id, channel_id=channel.id, parent_id=first.id)
+    test_db.add(reply)
+    test_db.commit()
+    assert reply.parent_sender_id == test_user.id
+
+    reply.parent_id = second.id
+    test_db.commit()
+    assert reply.parent_sender_id == test_other_user.id
+
+    reply.parent_id = None
+    test_db.commit()
+    assert reply.parent_sender_id is None
+
+def test_bot_scored_examples_are_cached_and_updated_by_score_changes(test_db, test_user, test_other_user):
+    """Test that a bot's best and worst replies are loaded once and kept current by reactions"""
+    bot = User(username="lain", email="lain@sermo.ai", is_bot=True)
+    channel = Channel(name="scores", created_by_id=test_user.id, members=[test_user, test_other_user])
+    test_db.add_all([bot, channel])
+    test_db.commit()
+    replies = []
+    for i, score in enumerate([2, 1, 0, -1, -2]):
+        question = Message(content=f"question {i}", channel_id=channel.id, sender_id=test_user.id)
+        test_db.add(question)
+        test_db.flush()
+        reply = Message(content=f"answer {i}", channel_id=channel.id, sender_id=bot.id, is_bot=True, parent_id=question.id)
+        test_db.add(reply)
+        test_db.flush()
+        test_db.add(BotMessageScore(message_id=reply.id, bot_user_id=bot.id, score=score))
+        replies.append(reply)
+    test_db.commit()
+    bot_score_cache.clear()
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(test_db.get_bind(), "before_cursor_execute", record)
+    try:
+        highest, lowest = load_bot_scored_messages(test_db, bot.id)
+        assert len(statements) == 2
+        assert [m["message"] for m in highest] == ["answer 0", "answer 1", "answer 2"]
+        assert [m["message"] for m in lowest] == ["answer 4", "answer 3"]
+        assert highest[0]["parent_message"] == "question 0"
+
+        # Two thumbs up lift a reply within the top set, updating it in place
+        test_db.add_all([
+            Reaction(emoji="👍", user_id=test_user.id, message_id=replies[1].id),
+            Reaction(emoji="👍", user_id=test_other_user.id, message_id=replies[1].id),
+        ])
+        test_db.commit()
+        asyncio.run(update_bot_message_score(test_db, replies[1].id))
+        statements.clear()
+        highest, lowest = load_bot_scored_messages(test_db, bot.id)
+        assert statements == []
+        assert [(m["message"], m["score"]) for m in highest] == [("answer 1", 2), ("answer 0", 2), ("answer 2", 0)]
+        assert [m["message"] for m in lowest] == ["answer 4", "answer 3"]
+
+        # The worst reply leaving the bottom set reloads it from the index
+        test_db.add(Reaction(emoji="👍", user_id=test_user.id, message_id=replies[4].id))
+        test_db.commit()
+        asyncio.run(update_bot_message_score(test_db, replies[4].id))
+        statements.clear()
+        highest, lowest = load_bot_scored_messages(test_db, bot.id)
+        assert len(statements) == 2
+        assert [m["message"] for m in highest] == ["answer 1", "answer 0", "answer 4"]
+        assert [m["message"] for m in lowest] == ["answer 3", "answer 2"]
+
+        # Editing a reply drops the bot's entry
+        replies[3].content = "edited answer"
+        test_db.commit()
+        statements.clear()
+        highest, lowest = load_bot_scored_messages(test_db, bot.id)
+        assert len(statements) == 2
+        assert lowest[0]["message"] == "edited answer"
+    finally:
+        event.remove(test_db.get_bind(), "before_cursor_execute", record)
+
+    plan = " ".join(str(row) for row in test_db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT message_id FROM bot_message_scores WHERE bot_user_id = 1 ORDER BY score DESC, message_id DESC LIMIT 3"
+    )))
+    assert "ix_bot_message_scores_bot_user_id_score" in plan
+
+def test_context_packer_fits_sections_into_token_limit_by_priority():
+    """Test that packing keeps the important sections, cuts the oldest history and drops what no longer fits"""
+    counter = TokenCounter()
+    conversation = "\n\n".join(f"[pair {i}] " + "talking about the wired " * 10 for i in range(20))
+    sections = [
+        ContextSection("profile", "=== USER PROFILE ===", ["Writes short messages late at night."], 0, 100),
+        ContextSection("conversation", "", [conversation], 1, 200, keep_tail=True),
+        ContextSection("file_chunks", "=== RELEVANT FILE CONTENT ===", [f"chunk {i} " + "protocol seven " * 40 for i in range(3)], 2, 500),
+        ContextSection("file_descriptions", "=== FILE SUMMARIES ===", ["a summary of the protocol " * 20], 3, 200),
+    ]
+    dropped_before = packing_stats()["dropped"].get("file_descriptions", 0)
+
+    packed = pack_context(sections, limit=400, counter=counter)
+
+    assert sum(packed.tokens.values()) <= 400
+    assert counter.count(packed.context) <= 400
+    assert packed.context.startswith("=== USER PROFILE ===\n\nWrites short messages")
+    assert packed.tokens["conversation"] <= 200
+    assert "[pair 19]" in packed.context and "[pair 0]" not in packed.context
+    assert packed.context.index("[...]") < packed.context.index("[pair 19]")
+    assert "chunk 0" in packed.context and "chunk 2" not in packed.context
+    assert "file_descriptions" not in packed.tokens and "FILE SUMMARIES" not in packed.context
+    assert packing_stats()["dropped"]["file_descriptions"] == dropped_before + 1
+
+    # Repeated snippets are counted once
+    misses = counter.misses
+    assert pack_context(sections, limit=400, counter=counter) == packed
+    assert counter.misses == misses
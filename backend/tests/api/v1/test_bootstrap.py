@@ -0,0 +1,69 @@
+import json
+import pytest
+from sqlalchemy.orm import Session, sessionmaker
+from fastapi.testclient import TestClient
+from app.models.user import User
+from app.models.channel import Channel
+from app.models.message import Message
+from app.api.deps import get_current_user, get_db, get_session_factory
+from app.main import app
+
+@pytest.fixture(autouse=True)
+def override_dependencies(test_user, test_db):
+    async def mock_get_current_user():
+        return test_db.merge(test_user)
+
+    def mock_get_db():
+        try:
+            yield test_db
+        finally:
+            pass
+
+    def mock_get_session_factory():
+        return sessionmaker(bind=test_db.get_bind())
+
+    app.dependency_overrides[get_current_user] = mock_get_current_user
+    app.dependency_overrides[get_db] = mock_get_db
+    app.dependency_overrides[get_session_factory] = mock_get_session_factory
+    yield
+    app.dependency_overrides.clear()
+
+def test_bootstrap_streams_all_sections(test_client: TestClient, test_user: User, test_other_user: User, test_db: Session):
+    """Test that bootstrap returns one NDJSON line per section with the user first."""
+    test_user = test_db.merge(test_user)
+    quiet = Channel(name="quiet", is_public=True, created_by_id=test_user.id)
+    busy = Channel(name="busy", is_public=True, created_by_id=test_user.id)
+    private = Channel(name="private", is_public=False, created_by_id=test_other_user.id)
+    test_db.add_all([quiet, busy, private])
+    test_db.commit()
+    test_db.add_all([
+        Message(content="old", sender_id=test_other_user.id, channel_id=quiet.id),
+        Message(content="hello @testuser", sender_id=test_other_user.id, channel_id=busy.id),
+        Message(content="secret", sender_id=test_other_user.id, channel_id=private.id),
+    ])
+    test_db.commit()
+
+    response = test_client.get("/api/bootstrap?message_channels=1")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert lines[0]["section"] == "user"
+    assert lines[0]["data"]["id"] == test_user.id
+
+    sections = {line["section"]: line for line in lines}
+    assert set(sections) == {"user", "channels", "users", "presence", "messages"}
+    assert all("error" not in section for section in sections.values())
+
+    channels = {channel["name"]: channel for channel in sections["channels"]["data"]}
+    assert set(channels) == {"quiet", "busy"}
+    assert channels["busy"]["unread_count"] == 1
+    assert channels["busy"]["mention_count"] == 1
+
+    messages = sections["messages"]["data"]
+    assert list(messages) == [str(busy.id)]
+    assert messages[str(busy.id)][0]["content"] == "hello @testuser"
+
+    usernames = {user["username"] for user in sections["users"]["data"]}
+    assert {test_user.username, test_other_user.username} <= usernames
+    assert {p["id"] for p in sections["presence"]["data"]} >= {test_user.id, test_other_user.id}
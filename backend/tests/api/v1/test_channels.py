@@ -2,6 +2,7 @@ import pytest
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.models.channel import Channel
+from app.models.message import Message
 from fastapi.testclient import TestClient
 from datetime import datetime, UTC
 from app.api.deps import get_current_user, get_db
@@ -632,4 +633,163 @@ def test_list_channels_filter(test_client: TestClient, test_user: User, test_use
     assert response.status_code == 200
     data = response.json()
     assert len(data) == 1
-    assert data[0]["name"] == "private-channel" 
\ No newline at end of file
+    assert data[0]["name"] == "private-channel"
+
+def test_get_channels_read_state(
+    test_client: TestClient,
+    test_user: User,
+    test_other_user: User,
+    test_user_token: str,
+    test_db: Session
+):
+    """Test unread counts, mention counts and last message preview in the channel list."""
+    channel = Channel(
+        name="read-state-channel",
+        is_direct_message=False,
+        created_by_id=test_user.id,
+        members=[test_user, test_other_user]
+    )
+    test_db.add(channel)
+    test_db.commit()
+
+    # Longer usernames starting with the user's do not count as mentions
+    for content in ["hello", f"hey @{test_user.username}", f"ask @{test_user.username}s", "anyone?"]:
+        test_db.add(Message(content=content, channel_id=channel.id, sender_id=test_other_user.id))
+    test_db.add(Message(content="my own message", channel_id=channel.id, sender_id=test_user.id))
+    test_db.commit()
+
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    response = test_client.get("/api/channels", headers=headers)
+    assert response.status_code == 200
+    data = next(c for c in response.json() if c["id"] == channel.id)
+    assert data["unread_count"] == 4  # Own messages are never unread
+    assert data["mention_count"] == 1
+    assert data["last_read_message_id"] is None
+    assert data["last_message"]["content"] == "my own message"
+
+def test_mark_channel_read(
+    test_client: TestClient,
+    test_user: User,
+    test_other_user: User,
+    test_user_token: str,
+    test_db: Session
+):
+    """Test advancing the read marker for a channel."""
+    channel = Channel(
+        name="mark-read-channel",
+        is_direct_message=False,
+        created_by_id=test_user.id,
+        members=[test_user, test_other_user]
+    )
+    test_db.add(channel)
+    test_db.commit()
+
+    messages = [
+        Message(content=f"message {i}", channel_id=channel.id, sender_id=test_other_user.id)
+        for i in range(3)
+    ]
+    test_db.add_all(messages)
+    test_db.commit()
+
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    # Mark up to the first message
+    response = test_client.post(
+        f"/api/channels/{channel.id}/read",
+        headers=headers,
+        json={"message_id": messages[0].id}
+    )
+    assert response.status_code == 200
+    assert response.json()["last_read_message_id"] == messages[0].id
+
+    response = test_client.get("/api/channels", headers=headers)
+    data = next(c for c in response.json() if c["id"] == channel.id)
+    assert data["unread_count"] == 2
+
+    # Without a message ID the marker moves to the latest message
+    response = test_client.post(f"/api/channels/{channel.id}/read", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["last_read_message_id"] == messages[-1].id
+
+    # The marker never moves backwards
+    response = test_client.post(
+        f"/api/channels/{channel.id}/read",
+        headers=headers,
+        json={"message_id": messages[0].id}
+    )
+    assert response.status_code == 200
+    assert response.json()["last_read_message_id"] == messages[-1].id
+
+    response = test_client.get("/api/channels", headers=headers)
+    data = next(c for c in response.json() if c["id"] == channel.id)
+    assert data["unread_count"] == 0
+
+def test_mark_channel_read_message_from_other_channel(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session
+):
+    """Test that a message from another channel cannot be used as the read marker."""
+    channels = [
+        Channel(name=f"channel-{i}", created_by_id=test_user.id, members=[test_user])
+        for i in range(2)
+    ]
+    test_db.add_all(channels)
+    test_db.commit()
+    message = Message(content="elsewhere", channel_id=channels[1].id, sender_id=test_user.id)
+    test_db.add(message)
+    test_db.commit()
+
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    response = test_client.post(
+        f"/api/channels/{channels[0].id}/read",
+        headers=headers,
+        json={"message_id": message.id}
+    )
+    assert response.status_code == 400
+
+def test_get_channel_members_sparse_fields(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session
+):
+    """Test that profile descriptions are only returned when requested with fields=."""
+    test_user = test_db.merge(test_user)
+    test_user.description = "A long generated profile"
+    channel = Channel(name="described", created_by_id=test_user.id, members=[test_user])
+    test_db.add(channel)
+    test_db.commit()
+
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    response = test_client.get(f"/api/channels/{channel.id}/members", headers=headers)
+    assert response.status_code == 200
+    assert response.json()[0]["username"] == test_user.username
+    assert response.json()[0]["description"] is None
+
+    response = test_client.get(
+        f"/api/channels/{channel.id}/members?fields=id,description",
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json() == [{"id": test_user.id, "description": "A long generated profile"}]
+
+def test_get_channels_sparse_fields(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session
+):
+    """Test that fields= trims the channel list and rejects unknown fields."""
+    channel = Channel(name="sparse", created_by_id=test_user.id, members=[test_user])
+    test_db.add(channel)
+    test_db.commit()
+
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    response = test_client.get("/api/channels?fields=id,name,unread_count", headers=headers)
+    assert response.status_code == 200
+    assert {"id": channel.id, "name": "sparse", "unread_count": 0} in response.json()
+
+    response = test_client.get("/api/channels?fields=members", headers=headers)
+    assert response.status_code == 400
@@ -1,15 +1,25 @@
 import pytest
+import asyncio
+import hashlib
 import os
+from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.models.file import File
 from app.models.message import Message
 from app.models.channel import Channel
+from app.models.upload_blob import UploadBlob
+from app.services.upload_store import collect_upload, release_upload, remember_processed_content, store_upload
 from fastapi.testclient import TestClient
 from datetime import datetime, UTC
 from pathlib import Path
 from app.api.deps import get_current_user, get_db
 from app.main import app
+from app.database import Base
+from app.ai import file_processor
+from app.api.v1 import files as files_api
 
 @pytest.fixture(autouse=True)
 def override_dependencies(test_user, test_db):
@@ -407,4 +417,239 @@ def test_get_channel_files_unauthorized(
     response = test_client.get(f"/api/files/channels/{channel.id}/files", headers=headers)
     
     assert response.status_code == 403
-    assert "Not authorized to access this channel" in response.json()["detail"] 
\ No newline at end of file
+    assert "Not authorized to access this channel" in response.json()["detail"]
+
+
+def test_upload_returns_before_processing(
+    monkeypatch,
+    test_client: TestClient,
+    test_user_token: str,
+    test_upload_file: Path,
+    test_channel_with_message: tuple[Channel, Message]
+):
+    """Test that an upload responds once stored and leaves processing to the queue"""
+    queued = MagicMock()
+    monkeypatch.setattr(files_api, "enqueue_file", queued)
+    _, message = test_channel_with_message
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    with open(test_upload_file, "rb") as f:
+        response = test_client.post(
+            f"/api/files/upload?message_id={message.id}",
+            headers=headers,
+            files={"file": ("notes.txt", f, "text/plain")}
+        )
+
+    assert response.status_code == 201
+    data = response.json()
+    assert data["processing_status"] == "pending"
+    assert data["description"] is None
+    queued.assert_called_once_with(data["id"])
+
+    response = test_client.get(f"/api/files/{data['id']}/status", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"id": data["id"], "processing_status": "pending", "description": None}
+    os.remove(os.path.join(files_api.UPLOAD_DIR, os.path.basename(data["file_path"])))
+
+def test_duplicate_upload_shares_storage_and_reuses_processing(
+    monkeypatch,
+    test_client: TestClient,
+    test_user_token: str,
+    test_db: Session,
+    test_channel_with_message: tuple[Channel, Message]
+):
+    """Test that identical uploads share one stored copy and the first upload's processing"""
+    queued = MagicMock()
+    monkeypatch.setattr(files_api, "enqueue_file", queued)
+    deleted_vectors = AsyncMock()
+    monkeypatch.setattr(files_api, "delete_vectors", deleted_vectors)
+    _, message = test_channel_with_message
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    content = b"Quarterly report, draft 3"
+
+    def upload(name):
+        response = test_client.post(
+            "/api/files/upload",
+            headers=headers,
+            data={"message_id": str(message.id)},
+            files={"file": (name, content, "text/plain")}
+        )
+        assert response.status_code == 201
+        return response.json()
+
+    first = upload("report.txt")
+    content_hash = hashlib.sha256(content).hexdigest()
+    assert first["file_path"] == f"/uploads/{content_hash}.txt"
+    assert first["processing_status"] == "pending"
+    # What the file processor stores once the first upload is processed
+    remember_processed_content(
+        test_db, content_hash, "A quarterly report", ["Quarterly report, draft 3"],
+        {"file_chunks_store": ["chunk-1"], "file_descriptions_store": ["description-1"]}
+    )
+    test_db.commit()
+
+    second = upload("report-copy.txt")
+    assert second["file_path"] == first["file_path"]
+    assert second["processing_status"] == "completed"
+    assert second["description"] == "A quarterly report"
+    queued.assert_called_once_with(first["id"])
+    copy = test_db.query(File).filter(File.id == second["id"]).one()
+    assert [chunk.content for chunk in copy.chunks] == ["Quarterly report, draft 3"]
+    stored = os.path.join(files_api.UPLOAD_DIR, f"{content_hash}.txt")
+    assert test_db.query(UploadBlob).filter(UploadBlob.content_hash == content_hash).one().ref_count == 2
+
+    # The stored copy and its vectors go with the last file referencing them
+    assert test_client.delete(f"/api/files/{first['id']}", headers=headers).status_code == 204
+    assert os.path.exists(stored)
+    deleted_vectors.assert_not_awaited()
+    assert test_client.delete(f"/api/files/{second['id']}", headers=headers).status_code == 204
+    assert not os.path.exists(stored)
+    assert test_db.query(UploadBlob).count() == 0
+    deleted_vectors.assert_awaited_once_with(
+        {"file_chunks_store": ["chunk-1"], "file_descriptions_store": ["description-1"]}
+    )
+
+def test_released_content_survives_a_new_reference(test_db: Session, tmp_path):
+    """Test that content is only removed while no file references it"""
+    content_hash = hashlib.sha256(b"shared").hexdigest()
+    stored = tmp_path / f"{content_hash}.txt"
+
+    def upload():
+        temp = tmp_path / ".upload"
+        temp.write_bytes(b"shared")
+        store_upload(test_db, str(temp), str(tmp_path), content_hash, ".txt", 6)
+        test_db.commit()
+
+    upload()
+    release_upload(test_db, content_hash)
+    test_db.commit()
+    # Uploaded again before the deleter collects the content
+    upload()
+    assert collect_upload(test_db, content_hash, str(tmp_path)) is None
+    assert stored.exists()
+    assert test_db.query(UploadBlob).one().ref_count == 1
+
+    release_upload(test_db, content_hash)
+    test_db.commit()
+    assert collect_upload(test_db, content_hash, str(tmp_path)) is not None
+    assert not stored.exists()
+    # Uploaded again after it was collected: stored afresh
+    upload()
+    assert stored.exists()
+    assert test_db.query(UploadBlob).one().ref_count == 1
+
+def test_file_processor_bounds_concurrency_and_reports_outcomes(monkeypatch, tmp_path):
+    """Test that queued files are processed at most two at a time, with their outcome stored and announced"""
+    # Workers use the database from several threads at once, which the shared
+    # in-memory test connection does not support
+    engine = create_engine(f"sqlite:///{tmp_path / 'files.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+    with session_factory() as db:
+        user = User(username="uploader", email="uploader@example.com", is_active=True, status="online")
+        channel = Channel(name="files", created_by=user, members=[user])
+        message = Message(content="see attached", channel=channel, sender=user)
+        db.add_all([user, channel, message])
+        db.flush()
+        uploads = [
+            File(
+                filename=name,
+                file_type="text/plain",
+                file_size=10,
+                file_path=f"/uploads/{name}",
+                message_id=message.id if name == "attached.txt" else None,
+                uploaded_by_id=user.id,
+                processing_status="pending"
+            )
+            for name in ["attached.txt", "second.txt", "third.txt", "broken.txt"]
+        ]
+        db.add_all(uploads)
+        db.commit()
+        channel_id, attached_id = channel.id, uploads[0].id
+
+    running = 0
+    peak = 0
+    async def fake_process_file(file_path, filename, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        if filename == "broken.txt":
+            return None
+        return [f"Summary of {filename}"], [f"text of {filename}"], {}
+    monkeypatch.setattr(file_processor, "process_file", fake_process_file)
+
+    notify = AsyncMock()
+    processor = file_processor.FileProcessor(session_factory, MagicMock(), "uploads", concurrency=2, notify=notify)
+
+    async def run():
+        # Pending files are picked up when the processor starts
+        await processor.start()
+        await processor._queue.join()
+        await processor.stop()
+    asyncio.run(run())
+
+    assert peak == 2
+    with session_factory() as db:
+        processed = {file.filename: file for file in db.query(File)}
+        assert {name: file.processing_status for name, file in processed.items()} == {
+            "attached.txt": "completed", "second.txt": "completed", "third.txt": "completed", "broken.txt": "failed"
+        }
+        assert processed["attached.txt"].description == "Summary of attached.txt"
+        assert [chunk.content for chunk in processed["attached.txt"].chunks] == ["text of attached.txt"]
+    assert processor.stats()["completed"] == 3 and processor.stats()["failed"] == 1
+
+    assert notify.await_count == 4
+    attached = next(call.kwargs for call in notify.await_args_list if call.kwargs["file_id"] == attached_id)
+    assert attached["channel_id"] == channel_id and attached["status"] == "completed"
+
+def test_file_processor_runs_identical_content_once(monkeypatch, tmp_path):
+    """Test that two files with the same content processed concurrently call the models once"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'files.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+    content_hash = hashlib.sha256(b"same bytes").hexdigest()
+    with session_factory() as db:
+        user = User(username="uploader", email="uploader@example.com", is_active=True, status="online")
+        db.add(UploadBlob(content_hash=content_hash, storage_path=f"{content_hash}.txt", file_size=10, ref_count=2))
+        uploads = [
+            File(
+                filename=name,
+                file_type="text/plain",
+                file_size=10,
+                file_path=f"/uploads/{content_hash}.txt",
+                content_hash=content_hash,
+                uploaded_by=user,
+                processing_status="pending"
+            )
+            for name in ["first.txt", "copy.txt"]
+        ]
+        db.add_all(uploads)
+        db.commit()
+        file_ids = [file.id for file in uploads]
+
+    calls = []
+    async def fake_process_file(file_path, filename, **kwargs):
+        calls.append(filename)
+        await asyncio.sleep(0.05)
+        return ["Summary"], ["text"], {"file_chunks_store": [f"chunk-{len(calls)}"]}
+    monkeypatch.setattr(file_processor, "process_file", fake_process_file)
+    deleted_vectors = AsyncMock()
+    monkeypatch.setattr(file_processor, "delete_vectors", deleted_vectors)
+    monkeypatch.setattr(file_processor, "FILE_CLAIM_POLL_SECONDS", 0.01)
+    processor = file_processor.FileProcessor(session_factory, MagicMock(), "uploads", concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(processor.process(file_id) for file_id in file_ids))
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert [result["status"] for result in results] == ["completed", "completed"]
+    assert [result["description"] for result in results] == ["Summary", "Summary"]
+    assert processor.stats()["reused"] == 1
+    deleted_vectors.assert_not_awaited()
+    with session_factory() as db:
+        blob = db.query(UploadBlob).one()
+        assert blob.vector_ids == '{"file_chunks_store": ["chunk-1"]}'
+        assert [[chunk.content for chunk in file.chunks] for file in db.query(File).order_by(File.id)] == [["text"], ["text"]]
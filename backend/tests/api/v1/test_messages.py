@@ -1,10 +1,14 @@
 import pytest
 from sqlalchemy.orm import Session
 from app.models.user import User
-from app.models.channel import Channel
+from app.models.channel import Channel, channel_members
 from app.models.message import Message
 from fastapi.testclient import TestClient
 from datetime import datetime, UTC
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.models.reaction import Reaction
+from app.models.file import File
 from app.api.deps import get_current_user, get_db
 from app.main import app
 
@@ -440,4 +444,190 @@ def test_update_message_empty_content(
         headers=headers,
         json={"content": ""}
     )
-    assert response.status_code == 422 
\ No newline at end of file
+    assert response.status_code == 422
+
+@contextmanager
+def count_queries(db: Session):
+    """Count the SQL statements executed on the session's engine."""
+    engine = db.get_bind()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+def test_get_channel_messages_query_count(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    test_channel_with_messages: tuple[Channel, list[Message]]
+):
+    """Test that loading a message page costs a fixed number of SQL statements."""
+    channel, messages = test_channel_with_messages
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    # Warm up so both measured requests start from the same session state
+    test_client.get(f"/api/channels/{channel.id}/messages", headers=headers)
+
+    with count_queries(test_db) as small_page:
+        response = test_client.get(f"/api/channels/{channel.id}/messages", headers=headers)
+    assert response.status_code == 200
+
+    # Add many messages, each with several reactions and files
+    for i in range(20):
+        message = Message(
+            content=f"Busy message {i}",
+            channel_id=channel.id,
+            sender_id=test_user.id,
+            has_attachments=True
+        )
+        test_db.add(message)
+        test_db.flush()
+        for emoji in ["👍", "👎", "🎉"]:
+            test_db.add(Reaction(emoji=emoji, message_id=message.id, user_id=test_user.id))
+        for j in range(3):
+            test_db.add(File(
+                filename=f"file_{i}_{j}.txt",
+                file_path=f"/uploads/file_{i}_{j}.txt",
+                file_type="text/plain",
+                file_size=10,
+                message_id=message.id,
+                uploaded_by_id=test_user.id
+            ))
+    test_db.commit()
+
+    with count_queries(test_db) as large_page:
+        response = test_client.get(f"/api/channels/{channel.id}/messages", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+
+    assert len(data) == 23
+    busy = [msg for msg in data if msg["content"].startswith("Busy message")]
+    assert all(len(msg["reactions"]) == 3 for msg in busy)
+    assert all(len(msg["files"]) == 3 for msg in busy)
+    assert len(large_page) == len(small_page)
+
+@pytest.fixture
+def public_channel_without_test_user(test_db: Session, test_other_user: User) -> Channel:
+    """Create a public channel where test_user is not an explicit member."""
+    channel = Channel(
+        name="public-channel",
+        description="Public channel",
+        is_public=True,
+        created_by_id=test_other_user.id,
+        members=[test_other_user]
+    )
+    test_db.add(channel)
+    test_db.commit()
+    test_db.add(Message(content="Welcome", channel_id=channel.id, sender_id=test_other_user.id))
+    test_db.commit()
+    return channel
+
+def _member_ids(test_db: Session, channel: Channel) -> set:
+    rows = test_db.execute(
+        channel_members.select().where(channel_members.c.channel_id == channel.id)
+    ).fetchall()
+    return {row.user_id for row in rows}
+
+def test_get_public_channel_is_side_effect_free(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    public_channel_without_test_user: Channel
+):
+    """Test that reading a public channel as a non-member never writes."""
+    channel = public_channel_without_test_user
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    with count_queries(test_db) as statements:
+        response = test_client.get(f"/api/channels/{channel.id}/messages", headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()) == 1
+
+        response = test_client.get(f"/api/channels/{channel.id}/members", headers=headers)
+        assert response.status_code == 200
+
+    writes = [s for s in statements if s.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE"))]
+    assert writes == []
+    assert test_user.id not in _member_ids(test_db, channel)
+
+def test_post_public_channel_materializes_membership(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    public_channel_without_test_user: Channel
+):
+    """Test that the first post to a public channel makes the user a member."""
+    channel = public_channel_without_test_user
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    response = test_client.post(
+        f"/api/channels/{channel.id}/messages",
+        headers=headers,
+        json={"content": "Hello", "channel_id": channel.id}
+    )
+    assert response.status_code == 200
+    assert test_user.id in _member_ids(test_db, channel)
+
+    # Posting again does not duplicate the membership row
+    response = test_client.post(
+        f"/api/channels/{channel.id}/messages",
+        headers=headers,
+        json={"content": "Hello again", "channel_id": channel.id}
+    )
+    assert response.status_code == 200
+    rows = test_db.execute(
+        channel_members.select().where(
+            channel_members.c.channel_id == channel.id,
+            channel_members.c.user_id == test_user.id
+        )
+    ).fetchall()
+    assert len(rows) == 1
+
+def test_get_channel_messages_sparse_fields(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    test_channel_with_messages: tuple[Channel, list[Message]]
+):
+    """Test that fields= trims messages and skips loading unrequested relations."""
+    channel, messages = test_channel_with_messages
+    test_db.add(File(
+        filename="notes.txt",
+        file_path="/uploads/notes.txt",
+        file_type="text/plain",
+        file_size=10,
+        description="A very long generated summary",
+        message_id=messages[0].id,
+        uploaded_by_id=test_user.id
+    ))
+    test_db.commit()
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    # File descriptions are deferred by default
+    response = test_client.get(f"/api/channels/{channel.id}/messages", headers=headers)
+    assert response.status_code == 200
+    files = [file for msg in response.json() for file in msg["files"]]
+    assert [file["filename"] for file in files] == ["notes.txt"]
+    assert files[0]["description"] is None
+
+    with count_queries(test_db) as statements:
+        response = test_client.get(
+            f"/api/channels/{channel.id}/messages?fields=id,content",
+            headers=headers
+        )
+    assert response.status_code == 200
+    assert all(set(msg) == {"id", "content"} for msg in response.json())
+    assert not any("FROM reactions" in s or "FROM files" in s for s in statements)
+
+    response = test_client.get(f"/api/channels/{channel.id}/messages?fields=id,bogus", headers=headers)
+    assert response.status_code == 400
@@ -1,13 +1,20 @@
 import pytest
-from sqlalchemy.orm import Session
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+from sqlalchemy.orm import Session, sessionmaker
 from app.models.user import User
 from app.models.channel import Channel
 from app.models.message import Message
 from app.models.file import File
+from app.models.file_chunk import FileChunk
 from fastapi.testclient import TestClient
 from datetime import datetime, UTC
 from app.main import app
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_session_factory
+from app.services import fulltext, inverted_index, semantic, suggest, trigram
+from app.services.search_cache import search_cache, SearchCache
 
 @pytest.fixture
 def test_client(test_user: User):
@@ -20,6 +27,13 @@ def test_client(test_user: User):
     yield client
     app.dependency_overrides.clear()
 
+@pytest.fixture(autouse=True)
+def clear_search_cache():
+    """Start every test with an empty search cache."""
+    search_cache.clear()
+    yield
+    search_cache.clear()
+
 @pytest.fixture
 def test_search_data(test_db: Session, test_user: User):
     """Create test data for search testing including channels, messages, and files."""
@@ -315,4 +329,551 @@ def test_search_empty_query(
     # Test channel search with empty query
     response = test_client.get("/api/search/channels?query=", headers=headers)
     assert response.status_code == 200
-    assert len(response.json()) == 0 
\ No newline at end of file
+    assert len(response.json()) == 0
+
+
+@pytest.fixture
+def fulltext_messages(test_db: Session, test_user: User) -> Channel:
+    """Create a channel with messages for exercising the full-text query syntax."""
+    channel = Channel(name="fulltext", created_by_id=test_user.id, members=[test_user])
+    test_db.add(channel)
+    test_db.commit()
+    for content in [
+        "deploy the release today",
+        "the deployment failed again",
+        "release notes are ready",
+        "lunch plans for friday",
+        "release release release the release",
+    ]:
+        test_db.add(Message(content=content, channel_id=channel.id, sender_id=test_user.id))
+    test_db.commit()
+    return channel
+
+def _search_contents(test_client: TestClient, headers: dict, query: str) -> list:
+    response = test_client.get("/api/search/messages", params={"query": query}, headers=headers)
+    assert response.status_code == 200
+    return [result["content"] for result in response.json()]
+
+def test_search_messages_fulltext_syntax(
+    test_client: TestClient,
+    test_user_token: str,
+    fulltext_messages: Channel
+):
+    """Test phrase, prefix and boolean operators in message search."""
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    assert _search_contents(test_client, headers, '"release notes"') == ["release notes are ready"]
+    assert set(_search_contents(test_client, headers, "rel*")) == {
+        "deploy the release today",
+        "release notes are ready",
+        "release release release the release",
+    }
+    assert _search_contents(test_client, headers, "release -notes -today") == [
+        "release release release the release"
+    ]
+    assert set(_search_contents(test_client, headers, "lunch OR failed")) == {
+        "lunch plans for friday",
+        "the deployment failed again",
+    }
+    assert _search_contents(test_client, headers, "release AND (today OR friday)") == [
+        "deploy the release today"
+    ]
+    assert _search_contents(test_client, headers, "-release") == []
+
+def test_search_messages_ranked_with_snippets(
+    test_client: TestClient,
+    test_user_token: str,
+    fulltext_messages: Channel
+):
+    """Test that results are ordered by relevance and carry highlighted snippets."""
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    response = test_client.get("/api/search/messages?query=release", headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+
+    assert len(results) == 3
+    assert results[0]["content"] == "release release release the release"
+    assert [r["rank"] for r in results] == sorted((r["rank"] for r in results), reverse=True)
+    assert all("<mark>release</mark>" in r["snippet"] for r in results)
+
+@pytest.fixture
+def memory_search(monkeypatch, tmp_path):
+    """Switch message search to a fresh in-process inverted index."""
+    monkeypatch.setattr(fulltext, "SEARCH_BACKEND", "memory")
+    monkeypatch.setattr(inverted_index, "SEARCH_INDEX_PATH", str(tmp_path / "search_index.snapshot"))
+    monkeypatch.setattr(inverted_index, "_index", None)
+
+def test_search_messages_memory_backend(
+    test_client: TestClient,
+    test_user_token: str,
+    test_db: Session,
+    test_other_user: User,
+    fulltext_messages: Channel,
+    memory_search
+):
+    """Test the inverted index backend: query syntax, ACL scoping and incremental updates."""
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    private = Channel(name="private", is_public=False, created_by_id=test_other_user.id, members=[test_other_user])
+    test_db.add(private)
+    test_db.commit()
+    test_db.add(Message(content="secret release plans", channel_id=private.id, sender_id=test_other_user.id))
+    test_db.commit()
+
+    results = test_client.get("/api/search/messages?query=release", headers=headers).json()
+    assert [r["content"] for r in results][0] == "release release release the release"
+    assert len(results) == 3
+    assert all("<mark>release</mark>" in r["snippet"] for r in results)
+    assert _search_contents(test_client, headers, '"release notes"') == ["release notes are ready"]
+    assert _search_contents(test_client, headers, "release AND (today OR friday)") == ["deploy the release today"]
+    assert set(_search_contents(test_client, headers, "lunch OR fail*")) == {
+        "lunch plans for friday",
+        "the deployment failed again",
+    }
+
+    # Edits and deletes through the API update the index
+    lunch = test_db.query(Message).filter(Message.content == "lunch plans for friday").first()
+    response = test_client.put(f"/api/messages/{lunch.id}", json={"content": "dinner plans"}, headers=headers)
+    assert response.status_code == 200
+    assert _search_contents(test_client, headers, "lunch") == []
+    assert _search_contents(test_client, headers, "dinner") == ["dinner plans"]
+
+    response = test_client.delete(f"/api/messages/{lunch.id}", headers=headers)
+    assert response.status_code == 204
+    assert _search_contents(test_client, headers, "dinner") == []
+
+def test_memory_index_snapshot_roundtrip(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    fulltext_messages: Channel,
+    memory_search
+):
+    """Test that a snapshot restores the index and catches up on newer messages."""
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    assert len(_search_contents(test_client, headers, "release")) == 3
+    inverted_index.save_snapshot()
+
+    test_db.add(Message(content="release candidate", channel_id=fulltext_messages.id, sender_id=test_user.id))
+    test_db.commit()
+
+    restored = inverted_index.InvertedIndex.load(inverted_index.SEARCH_INDEX_PATH)
+    assert restored.document_count == 5
+    assert restored.sync(test_db) == 1
+    inverted_index._index = restored
+    assert len(_search_contents(test_client, headers, "release")) == 4
+
+def test_search_files_and_channels_typo_tolerant(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    test_other_user: User
+):
+    """Test trigram search: misspelled queries match, best matches rank first, ACLs apply."""
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    reports = Channel(name="quarterly-reports", description="Finance updates", created_by_id=test_user.id, members=[test_user])
+    random = Channel(name="random", description="Weekly report digest", created_by_id=test_user.id, members=[test_user])
+    private = Channel(name="report-secrets", is_public=False, created_by_id=test_other_user.id, members=[test_other_user])
+    test_db.add_all([reports, random, private])
+    test_db.commit()
+    for channel, filename in [(reports, "annual_report.pdf"), (reports, "budget.xlsx"), (private, "secret_report.pdf")]:
+        message = Message(content=f"Uploaded {filename}", channel_id=channel.id, sender_id=channel.created_by_id)
+        test_db.add(message)
+        test_db.commit()
+        test_db.add(File(
+            filename=filename,
+            file_type="application/octet-stream",
+            file_path=f"/files/{filename}",
+            file_size=100,
+            message_id=message.id,
+            uploaded_by_id=channel.created_by_id
+        ))
+    test_db.commit()
+
+    response = test_client.get("/api/search/files?query=anual reprot", headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["filename"] for r in results] == ["annual_report.pdf"]
+    assert results[0]["channel_name"] == "quarterly-reports"
+    assert 0 < results[0]["score"] <= 1
+
+    response = test_client.get("/api/search/channels?query=reprots", headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+    # A name match outranks a description match; the private channel stays hidden
+    assert [r["name"] for r in results] == ["quarterly-reports", "random"]
+    assert results[0]["score"] > results[1]["score"]
+
+    # Renames are picked up by the next search
+    reports.name = "board-minutes"
+    test_db.commit()
+    response = test_client.get("/api/search/channels?query=reprots", headers=headers)
+    assert [r["name"] for r in response.json()] == ["random"]
+
+def test_search_files_ranks_only_accessible_candidates(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    test_other_user: User,
+    monkeypatch
+):
+    """Test that better matches in hidden channels do not crowd out accessible ones, and deleted files leave the index."""
+    monkeypatch.setattr(trigram, "MAX_CANDIDATES", 20)
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    mine = Channel(name="mine", created_by_id=test_user.id, members=[test_user])
+    hidden = Channel(name="hidden", is_public=False, created_by_id=test_other_user.id, members=[test_other_user])
+    test_db.add_all([mine, hidden])
+    test_db.commit()
+
+    def add_file(channel, filename):
+        message = Message(content=f"Uploaded {filename}", channel_id=channel.id, sender_id=channel.created_by_id)
+        test_db.add(message)
+        test_db.flush()
+        file = File(filename=filename, file_type="text/plain", file_path=f"/files/{filename}", file_size=1, message_id=message.id, uploaded_by_id=channel.created_by_id)
+        test_db.add(file)
+        return file
+
+    # Exact matches outscore the accessible plural, and outnumber the candidates
+    for i in range(25):
+        add_file(hidden, f"report_{i}.txt")
+    reports = add_file(mine, "reports_q1.txt")
+    kept = add_file(mine, "reports_q2.txt")
+    test_db.commit()
+
+    response = test_client.get("/api/search/files?query=report", headers=headers)
+    assert sorted(r["filename"] for r in response.json()) == ["reports_q1.txt", "reports_q2.txt"]
+
+    index = trigram.get_trigram_backend(test_db).files
+    test_db.delete(reports)
+    test_db.commit()
+    assert reports.id not in index._scopes
+    # Deleted without the session, e.g. by another process
+    test_db.execute(File.__table__.delete().where(File.id == kept.id))
+    test_db.commit()
+    assert test_client.get("/api/search/files?query=report", headers=headers).json() == []
+    assert kept.id not in index._scopes
+
+def test_search_all_types(
+    test_client: TestClient,
+    test_user_token: str,
+    test_db: Session,
+    test_search_data: dict
+):
+    """Test the combined endpoint: one section per type, limits, timings and type filtering."""
+    app.dependency_overrides[get_session_factory] = lambda: sessionmaker(bind=test_db.get_bind())
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    response = test_client.get("/api/search/?q=test&file_limit=1", headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results["messages"]) == 4
+    assert len(results["files"]) == 1
+    assert {c["name"] for c in results["channels"]} == {"test-channel-0", "test-channel-1"}
+    assert set(results["timings"]) == {"messages", "files", "channels"}
+    assert results["errors"] == {}
+    assert results["elapsed_ms"] >= max(results["timings"].values())
+
+    response = test_client.get("/api/search/?q=test&types=channels", headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+    assert results["messages"] is None and results["files"] is None
+    assert len(results["channels"]) == 2
+    assert set(results["timings"]) == {"channels"}
+
+    response = test_client.get("/api/search/?q=test&types=channels,users", headers=headers)
+    assert response.status_code == 400
+
+def test_search_cache_hits_and_write_invalidation(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    fulltext_messages: Channel
+):
+    """Test that repeated searches hit the cache until a message in a searched channel changes."""
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    before = test_client.get("/api/search/cache", headers=headers).json()
+    assert len(_search_contents(test_client, headers, "release")) == 3
+    # Whitespace and case are normalized away
+    assert len(_search_contents(test_client, headers, "  Release ")) == 3
+    stats = test_client.get("/api/search/cache", headers=headers).json()
+    assert (stats["hits"] - before["hits"], stats["misses"] - before["misses"]) == (1, 1)
+
+    response = test_client.post(
+        f"/api/channels/{fulltext_messages.id}/messages",
+        json={"content": "release party tonight", "channel_id": fulltext_messages.id},
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert len(_search_contents(test_client, headers, "release")) == 4
+
+    message = test_db.query(Message).filter(Message.content == "release party tonight").first()
+    test_client.delete(f"/api/messages/{message.id}", headers=headers)
+    assert len(_search_contents(test_client, headers, "release")) == 3
+    assert test_client.get("/api/search/cache", headers=headers).json()["invalidations"] >= before["invalidations"] + 2
+
+def test_search_cache_lru_and_ttl(monkeypatch):
+    """Test eviction of the least recently used entry and expiry after the TTL."""
+    cache = SearchCache(max_entries=2, ttl=60)
+    cache.set("a", [1], ["channel:1"])
+    cache.set("b", [2], ["channel:2"])
+    assert cache.get("a") == [1]
+    cache.set("c", [3], ["channel:1"])
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    assert cache.invalidate(["channel:1"]) == 2
+    assert cache.get("a") is None and cache.get("c") is None
+
+    now = 1000.0
+    monkeypatch.setattr("app.services.search_cache.time.monotonic", lambda: now)
+    cache.set("d", [4], [])
+    now += 61
+    assert cache.get("d") is None
+    assert cache.stats()["expirations"] == 1
+
+@pytest.fixture
+def local_semantic(monkeypatch, test_db: Session):
+    """Use the offline vector retriever and give endpoints sessions on the test database."""
+    monkeypatch.setattr(semantic, "SEMANTIC_BACKEND", "local")
+    monkeypatch.setattr(semantic, "_retriever", None)
+    app.dependency_overrides[get_session_factory] = lambda: sessionmaker(bind=test_db.get_bind())
+
+def test_search_messages_hybrid(
+    test_client: TestClient,
+    test_user_token: str,
+    test_db: Session,
+    test_other_user: User,
+    fulltext_messages: Channel,
+    local_semantic
+):
+    """Test that hybrid mode fuses lexical and vector results within the caller's channels."""
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    private = Channel(name="private", is_public=False, created_by_id=test_other_user.id, members=[test_other_user])
+    test_db.add(private)
+    test_db.commit()
+    test_db.add(Message(content="release today", channel_id=private.id, sender_id=test_other_user.id))
+    test_db.commit()
+
+    assert _search_contents(test_client, headers, "release today") == ["deploy the release today"]
+
+    response = test_client.get("/api/search/messages?query=release today&mode=hybrid", headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+    # Found by both retrievers, so fused first; vector-only matches follow without a snippet
+    assert results[0]["content"] == "deploy the release today"
+    assert {r["content"] for r in results[1:]} == {"release notes are ready", "release release release the release"}
+    assert all(r["rank"] < results[0]["rank"] and r["snippet"] is None for r in results[1:])
+
+    response = test_client.get("/api/search/messages?query=release&mode=fuzzy", headers=headers)
+    assert response.status_code == 400
+
+def test_search_messages_hybrid_falls_back_to_lexical(
+    test_client: TestClient,
+    test_user_token: str,
+    fulltext_messages: Channel,
+    local_semantic,
+    monkeypatch
+):
+    """Test that a failing vector retrieval degrades hybrid search to lexical results."""
+    def fail(*args, **kwargs):
+        raise RuntimeError("vector store unavailable")
+    monkeypatch.setattr(semantic.LocalVectorRetriever, "search", fail)
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    response = test_client.get("/api/search/?q=release&types=messages&mode=hybrid", headers=headers)
+    assert response.status_code == 200
+    assert [r["content"] for r in response.json()["messages"]] == _search_contents(test_client, headers, "release")
+
+def test_search_messages_hybrid_stops_waiting_for_slow_vector_retrieval(
+    test_client: TestClient,
+    test_user_token: str,
+    fulltext_messages: Channel,
+    local_semantic,
+    monkeypatch
+):
+    """Test that hybrid search answers with lexical results when the vector retrieval hangs."""
+    def hang(*args, **kwargs):
+        time.sleep(1.5)
+        return []
+    monkeypatch.setattr(semantic.LocalVectorRetriever, "search", hang)
+    monkeypatch.setattr(semantic, "HYBRID_VECTOR_TIMEOUT", 0.2)
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    started = time.perf_counter()
+    response = test_client.get("/api/search/messages?query=release&mode=hybrid", headers=headers)
+    assert time.perf_counter() - started < 1.0
+    assert response.status_code == 200
+    assert [r["content"] for r in response.json()] == _search_contents(test_client, headers, "release")
+
+def test_search_messages_hybrid_skips_vector_retrieval_without_a_free_worker(
+    test_client: TestClient,
+    test_user_token: str,
+    fulltext_messages: Channel,
+    local_semantic,
+    monkeypatch
+):
+    """Test that hybrid search does not queue vector retrievals behind busy workers."""
+    search = MagicMock(return_value=[])
+    monkeypatch.setattr(semantic.LocalVectorRetriever, "search", search)
+    monkeypatch.setattr(semantic, "_vector_slots", threading.BoundedSemaphore(1))
+    semantic._vector_slots.acquire()
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    response = test_client.get("/api/search/messages?query=release&mode=hybrid", headers=headers)
+    assert response.status_code == 200
+    assert [r["content"] for r in response.json()] == _search_contents(test_client, headers, "release")
+    search.assert_not_called()
+
+def test_search_messages_hybrid_stops_waiting_for_slow_lexical_retrieval(
+    test_client: TestClient,
+    test_user_token: str,
+    fulltext_messages: Channel,
+    local_semantic,
+    monkeypatch
+):
+    """Test that hybrid search answers with vector results when the lexical retrieval hangs."""
+    def hang(*args, **kwargs):
+        time.sleep(1.5)
+        return []
+    monkeypatch.setattr(semantic, "_lexical_hits", hang)
+    monkeypatch.setattr(semantic, "HYBRID_LEXICAL_TIMEOUT", 0.2)
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    started = time.perf_counter()
+    response = test_client.get("/api/search/messages?query=release&mode=hybrid", headers=headers)
+    assert time.perf_counter() - started < 1.0
+    assert response.status_code == 200
+    results = response.json()
+    assert results and all("release" in r["content"] and r["snippet"] is None for r in results)
+
+def test_search_files_by_content(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    test_other_user: User
+):
+    """Test that file search matches extracted document text and returns the chunk as a snippet."""
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    channel = Channel(name="docs", created_by_id=test_user.id, members=[test_user])
+    private = Channel(name="hidden", is_public=False, created_by_id=test_other_user.id, members=[test_other_user])
+    test_db.add_all([channel, private])
+    test_db.commit()
+
+    def add_file(channel, filename, chunks):
+        message = Message(content=f"Uploaded {filename}", channel_id=channel.id, sender_id=channel.created_by_id)
+        test_db.add(message)
+        test_db.commit()
+        file = File(
+            filename=filename,
+            file_type="text/plain",
+            file_path=f"/uploads/{filename}",
+            file_size=100,
+            message_id=message.id,
+            uploaded_by_id=channel.created_by_id,
+            chunks=[FileChunk(chunk_index=i, content=chunk) for i, chunk in enumerate(chunks)]
+        )
+        test_db.add(file)
+        test_db.commit()
+        return file
+
+    handbook = add_file(channel, "handbook.pdf", ["Welcome to the team.", "Vacation requests go through the portal."])
+    add_file(channel, "vacation_policy.pdf", ["Rules for time off."])
+    add_file(private, "secret.pdf", ["Vacation for executives only."])
+
+    response = test_client.get("/api/search/files?query=vacation", headers=headers)
+    assert response.status_code == 200
+    results = {r["filename"]: r for r in response.json()}
+    assert set(results) == {"handbook.pdf", "vacation_policy.pdf"}
+    # Content match: the best chunk, highlighted, and no name score
+    assert results["handbook.pdf"]["snippet"] == "<mark>Vacation</mark> requests go through the portal."
+    assert results["handbook.pdf"]["score"] is None
+    # Name match only
+    assert results["vacation_policy.pdf"]["snippet"] is None
+    assert results["vacation_policy.pdf"]["score"] > 0
+
+    # Chunks are removed with their file
+    test_db.delete(handbook)
+    test_db.commit()
+    assert test_db.query(FileChunk).filter(FileChunk.file_id == handbook.id).count() == 0
+    response = test_client.get("/api/search/files?query=portal", headers=headers)
+    assert response.json() == []
+
+def test_search_suggest(
+    test_client: TestClient,
+    test_user: User,
+    test_user_token: str,
+    test_db: Session,
+    test_other_user: User
+):
+    """Test prefix completions, their access filtering and their refresh on writes."""
+    app.dependency_overrides[get_session_factory] = lambda: sessionmaker(bind=test_db.get_bind())
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    channel = Channel(name="release-planning", created_by_id=test_user.id, members=[test_user])
+    private = Channel(name="release-secret", is_public=False, created_by_id=test_other_user.id, members=[test_other_user])
+    test_db.add_all([channel, private])
+    test_db.commit()
+    for target, content, filename in [
+        (channel, "release notes", "release-planning_report.pdf"),
+        (channel, "the release is out", "announcement.txt"),
+        (private, "reliable secret", "release-secret_report.pdf"),
+    ]:
+        message = Message(content=content, channel_id=target.id, sender_id=target.created_by_id)
+        test_db.add(message)
+        test_db.commit()
+        test_db.add(File(
+            filename=filename,
+            file_type="application/pdf",
+            file_path=f"/uploads/{filename}",
+            file_size=100,
+            message_id=message.id,
+            uploaded_by_id=target.created_by_id
+        ))
+    test_db.commit()
+
+    response = test_client.get("/api/search/suggest?q=Rel", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [c["name"] for c in data["channels"]] == ["release-planning"]
+    assert [f["filename"] for f in data["files"]] == ["release-planning_report.pdf"]
+    # Words from the private channel, and words seen only once, are left out
+    assert data["terms"] == [{"term": "release", "count": 2}]
+
+    data = test_client.get("/api/search/suggest?q=rep", headers=headers).json()
+    assert [f["filename"] for f in data["files"]] == ["release-planning_report.pdf"]
+    data = test_client.get("/api/search/suggest?q=oth", headers=headers).json()
+    assert data["users"] == [{"id": test_other_user.id, "username": "otheruser"}]
+
+    # Committed writes show up without a rebuild
+    test_client.post(
+        f"/api/channels/{channel.id}/messages",
+        json={"content": "reliable reliable build", "channel_id": channel.id},
+        headers=headers
+    )
+    private.members.append(test_user)
+    test_db.commit()
+    data = test_client.get("/api/search/suggest?q=reli", headers=headers).json()
+    assert data["terms"] == [{"term": "reliable", "count": 3}]
+    assert test_client.get("/api/search/suggest?q=rel&limit=50", headers=headers).status_code == 400
+
+def test_completion_index_first_build_is_shared(monkeypatch, test_db: Session, test_user: User):
+    """Test that concurrent first suggest requests wait on a single index build."""
+    builds = []
+    original = suggest.CompletionIndex.build.__func__
+
+    def slow_build(cls, db):
+        builds.append(db)
+        time.sleep(0.2)
+        return original(cls, db)
+    monkeypatch.setattr(suggest.CompletionIndex, "build", classmethod(slow_build))
+    factory = sessionmaker(bind=test_db.get_bind())
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        indexes = list(pool.map(lambda _: suggest.get_completion_index(test_db, factory), range(4)))
+
+    assert len(builds) == 1 and builds[0] is not test_db
+    assert all(index is indexes[0] for index in indexes)
+    assert indexes[0].suggest(test_user.id, "test", 5)["users"][0]["username"] == "testuser"
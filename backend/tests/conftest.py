@@ -80,12 +80,9 @@ def test_user(test_db):
         username="testuser",
         email="test@example.com",
         full_name="Test User",
-        hashed_password=get_password_hash("testpassword"),
         is_active=True,
         status="online",
         last_seen=datetime.now(UTC),
-        created_at=datetime.now(UTC),
-        updated_at=datetime.now(UTC)
     )
     test_db.add(user)
     test_db.commit()
@@ -114,12 +111,9 @@ def test_other_user(test_db) -> User:
         username="otheruser",
         email="other@example.com",
         full_name="Other User",
-        hashed_password="dummyhash",
         is_active=True,
         status="offline",
         last_seen=datetime.now(UTC),
-        created_at=datetime.now(UTC),
-        updated_at=datetime.now(UTC)
     )
     test_db.add(user)
     test_db.commit()
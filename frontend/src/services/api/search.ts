@@ -97,14 +97,36 @@ export const searchAll = async (query: string): Promise<SearchResult> => {
   }
 
   // If not in cache, perform the search
+  const token = getAuthToken();
+  if (!token) {
+    throw new Error('Authentication required');
+  }
+
   try {
-    const [channels, messages, files] = await Promise.all([
-      searchChannels(query),
-      searchMessages(query),
-      searchFiles(query)
-    ]);
+    // One request searches all types concurrently on the server
+    const response = await fetch(`${API_URL}/search/?q=${encodeURIComponent(query)}`, {
+      method: 'GET',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+        'Content-Type': 'application/json'
+      },
+      credentials: 'include'
+    });
 
-    const results = { channels, messages, files };
+    if (!response.ok) {
+      throw new Error(`Search failed with status ${response.status}`);
+    }
+
+    const data = await response.json();
+    if (data.errors && Object.keys(data.errors).length > 0) {
+      console.warn('Some search sections failed:', data.errors);
+    }
+
+    const results = {
+      channels: data.channels || [],
+      messages: data.messages || [],
+      files: data.files || []
+    };
     
     // Cache the results
     searchCache.set(query, results);
@@ -113,7 +135,6 @@ export const searchAll = async (query: string): Promise<SearchResult> => {
     return results;
   } catch (error) {
     console.error('Search failed with error:', error);
-    console.error('Request config:', (error as any)?.config);
     throw error;
   }
-}; 
\ No newline at end of file
+};
@@ -1,6 +1,6 @@
 import { Reaction, RawMessage, UserStatus, StoreMessage, RootState } from '../../types';
 import { store } from '../../store';
-import { addMessage, updateMessage, addReaction, removeReaction } from '../../store/messages/messagesSlice';
+import { addMessage, updateMessage, addReaction, removeReaction, removeStreamingMessage } from '../../store/messages/messagesSlice';
 import { updateUserStatus } from '../../store/chat/chatSlice';
 import { Store } from '@reduxjs/toolkit';
 import { transformMessage } from '../../utils/messageTransform';
@@ -38,6 +38,7 @@ interface NewMessageMessage extends BaseWebSocketMessage {
   message: RawMessage;
   isReply?: boolean;
   parentId?: string;
+  streamId?: string;
 }
 
 interface UpdateMessageMessage extends BaseWebSocketMessage {
@@ -59,6 +60,22 @@ interface BotMessageMessage extends BaseWebSocketMessage {
   message: RawMessage;
 }
 
+interface BotMessageDeltaMessage extends BaseWebSocketMessage {
+  type: 'BOT_MESSAGE_DELTA';
+  channelId: string;
+  streamId: string;
+  userId: string;
+  parentId: string | null;
+  sequence: number;
+  delta: string;
+}
+
+interface BotMessageCancelledMessage extends BaseWebSocketMessage {
+  type: 'BOT_MESSAGE_CANCELLED';
+  channelId: string;
+  streamId: string;
+}
+
 type WebSocketMessage = 
   | ReactionAddedMessage 
   | ReactionRemovedMessage 
@@ -66,6 +83,8 @@ type WebSocketMessage =
   | UpdateMessageMessage 
   | UserStatusMessage 
   | BotMessageMessage
+  | BotMessageDeltaMessage
+  | BotMessageCancelledMessage
   | BaseWebSocketMessage;
 
 function isReactionAddedMessage(message: WebSocketMessage): message is ReactionAddedMessage {
@@ -112,6 +131,19 @@ function isBotMessageMessage(message: WebSocketMessage): message is BotMessageMe
          'message' in message;
 }
 
+function isBotMessageDeltaMessage(message: WebSocketMessage): message is BotMessageDeltaMessage {
+  return message.type === 'BOT_MESSAGE_DELTA' && 
+         'channelId' in message && 
+         'streamId' in message && 
+         'delta' in message;
+}
+
+function isBotMessageCancelledMessage(message: WebSocketMessage): message is BotMessageCancelledMessage {
+  return message.type === 'BOT_MESSAGE_CANCELLED' && 
+         'channelId' in message && 
+         'streamId' in message;
+}
+
 export class WebSocketService {
   private static instance: WebSocketService | null = null;
   private static ws: WebSocket | null = null;
@@ -124,6 +156,8 @@ export class WebSocketService {
   private static pendingChannels: Set<string> = new Set();
   private static isReconnecting = false;
   private static auth0Token: string | null = null;
+  // streamId -> text received so far of bot replies being generated
+  private static streamingReplies: Map<string, string> = new Map();
 
   private constructor() {}
 
@@ -332,6 +366,10 @@ export class WebSocketService {
         WebSocketService.handleUserStatus(message);
       } else if (isBotMessageMessage(message)) {
         WebSocketService.handleBotMessage(message);
+      } else if (isBotMessageDeltaMessage(message)) {
+        WebSocketService.handleBotMessageDelta(message);
+      } else if (isBotMessageCancelledMessage(message)) {
+        WebSocketService.dropStreamingReply(message.channelId, message.streamId);
       } else if (message.type === 'PONG') {
         console.log('Received PONG');
       } else {
@@ -365,6 +403,10 @@ export class WebSocketService {
 
   private static handleNewMessage(message: NewMessageMessage) {
     if (WebSocketService.store) {
+      if (message.streamId) {
+        // The saved bot reply replaces the draft built from its deltas
+        WebSocketService.dropStreamingReply(message.channelId, message.streamId);
+      }
       const transformedMessage = transformMessage(message.message);
       WebSocketService.store.dispatch(addMessage({
         channelId: message.channelId,
@@ -410,6 +452,36 @@ export class WebSocketService {
     }
   }
 
+  private static handleBotMessageDelta(message: BotMessageDeltaMessage) {
+    if (WebSocketService.store) {
+      const content = (WebSocketService.streamingReplies.get(message.streamId) || '') + message.delta;
+      WebSocketService.streamingReplies.set(message.streamId, content);
+      WebSocketService.store.dispatch(addMessage({
+        channelId: message.channelId,
+        message: transformMessage({
+          id: `stream-${message.streamId}`,
+          content,
+          channelId: message.channelId,
+          userId: message.userId,
+          parentId: message.parentId,
+          reactions: [],
+          attachments: [],
+          is_bot: true
+        })
+      }));
+    }
+  }
+
+  private static dropStreamingReply(channelId: string, streamId: string) {
+    WebSocketService.streamingReplies.delete(streamId);
+    if (WebSocketService.store) {
+      WebSocketService.store.dispatch(removeStreamingMessage({
+        channelId,
+        messageId: `stream-${streamId}`
+      }));
+    }
+  }
+
   public static disconnect() {
     console.log('Disconnecting WebSocket');
     if (WebSocketService.ws) {
@@ -192,6 +192,22 @@ export const messagesSlice = createSlice({
       }
     },
 
+    removeStreamingMessage: (state, action: PayloadAction<{ channelId: string; messageId: string }>) => {
+      // Drop the draft of a streamed bot reply, whether shown in the channel or as a reply
+      const { channelId, messageId } = action.payload;
+      const messages = state.messagesByChannel[channelId];
+      if (!messages) {
+        return;
+      }
+      state.messagesByChannel[channelId] = messages.filter(message => message.id !== messageId);
+      state.messagesByChannel[channelId].forEach(parent => {
+        if (parent.replies?.some(reply => reply.id === messageId)) {
+          parent.replies = parent.replies.filter(reply => reply.id !== messageId);
+          parent.reply_count = Math.max(0, (parent.reply_count || 0) - 1);
+        }
+      });
+    },
+
     updateMessage: (state, action: PayloadAction<{ channelId: string; messageId: string; message: Partial<StoreMessage> }>) => {
       const { channelId, messageId, message } = action.payload;
       const messageIndex = state.messagesByChannel[channelId]?.findIndex(m => m.id === messageId);
@@ -308,6 +324,7 @@ export const {
   prependMessages, 
   addMessage, 
   deleteMessage,
+  removeStreamingMessage,
   updateMessage,
   addReaction,
   removeReaction,